@@ -1,7 +1,11 @@
 from django.contrib import admin
-from .models import Profile, MissingChild, MissingChildEncodedFace, SightedChild
+from .models import Profile, MissingChild, MissingChildEncodedFace, MissingChildNameTrigram, SightedChild, SightedChildEncodedFace, NotificationOutbox, FaceIndexChange
 
 admin.site.register(Profile)
 admin.site.register(MissingChild)
 admin.site.register(MissingChildEncodedFace)
+admin.site.register(MissingChildNameTrigram)
 admin.site.register(SightedChild)
+admin.site.register(SightedChildEncodedFace)
+admin.site.register(NotificationOutbox)
+admin.site.register(FaceIndexChange)
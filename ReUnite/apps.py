@@ -0,0 +1,7 @@
+from django.apps import AppConfig
+
+class ReUniteConfig(AppConfig):
+    name = 'ReUnite'
+
+    def ready(self):
+        from . import signals
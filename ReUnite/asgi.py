@@ -9,8 +9,27 @@ https://docs.djangoproject.com/en/3.0/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
+from django.core.handlers.asgi import ASGIHandler, ASGIRequest
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ReUnite.settings')
 
-application = get_asgi_application()
+django.setup(set_prefix = False)
+
+class ReUniteASGIRequest(ASGIRequest):
+    urlconf = 'ReUnite.asgi_urls' # search_child & sighted_child are served by their async variants (see async_views.py)
+
+class ReUniteASGIHandler(ASGIHandler):
+    request_class = ReUniteASGIRequest
+
+application = ReUniteASGIHandler()
+
+from django.conf import settings
+from ReUnite.face_index import load_face_index_on_first_request
+from ReUnite.face_index_changes import start_polling_face_index_changes
+from ReUnite.encoding_service import get_encoding_service
+
+load_face_index_on_first_request() # load the face search index before the first search request, without querying the database at import time
+start_polling_face_index_changes() # then follow the encodings saved & deleted by the other processes
+if settings.FACE_ENCODING_WORKERS:
+    get_encoding_service().start() # same for the face encoding worker processes & their models
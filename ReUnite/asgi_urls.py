@@ -0,0 +1,10 @@
+from django.urls import path
+from . import async_views
+from .urls import urlpatterns as wsgi_urlpatterns
+
+# URLs of the requests served by the ASGI application (see asgi.py) : the search & sighting endpoints go to their async
+# variants, everything else to the same views as under WSGI.
+urlpatterns = [
+    path('search-child/',async_views.search_child, name = 'search_child'),
+    path('sighted-child/',async_views.sighted_child, name = 'sighted_child'),
+] + wsgi_urlpatterns
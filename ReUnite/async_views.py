@@ -0,0 +1,78 @@
+from asgiref.sync import sync_to_async
+from django.contrib import messages
+from django.contrib.auth.views import redirect_to_login
+from django.shortcuts import render
+from functools import wraps
+from .forms import SearchChildForm, SightedChildForm
+from .encoding_service import face_encodings_of_file_async, EncodingServiceBusy, EncodingServiceTimeout, TooManyFaces
+from .views import single_face, search_response, sighting_response, group_sighting_response
+
+# Async variants of search_child & sighted_child, routed by the ASGI application (see asgi.py & asgi_urls.py). While a
+# sighting / searched image is encoded in the encoding service no thread is held : the request only awaits the worker
+# process' result. The upload parsing & form validation use the default executor and the database work (search,
+# saving the sighting & queueing its notifications, rendering) runs through sync_to_async, in the thread Django gives
+# to the synchronous code of the request. The Email & SMS themselves are sent by 'manage.py dispatch_notifications',
+# never while serving a request.
+
+def async_login_required(view):
+    # login_required for async views : request.user is loaded from the session (a database query) in a thread
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if not await sync_to_async(lambda: request.user.is_authenticated)():
+            return redirect_to_login(request.get_full_path())
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+async def bound_form(form_class, request):
+    # Parses the multipart upload (streamed to a temporary file by ImageUploadHandler) and validates the form
+    def validated_form():
+        form = form_class(request.POST, request.FILES)
+        form.is_valid()
+        return form
+    return await sync_to_async(validated_form, thread_sensitive = False)()
+
+async def face_encodings_of_upload(request, uploaded_image, endpoint, with_locations = False, max_faces = None):
+    try:
+        return await face_encodings_of_file_async(uploaded_image, endpoint, with_locations = with_locations, max_faces = max_faces)
+    except TooManyFaces as e: # same as face_encodings_of_upload in views.py
+        return [None] * e.face_count
+    except EncodingServiceBusy:
+        messages.error(request, f"Too many images are being processed right now!!! Please try again in a few moments.")
+    except EncodingServiceTimeout:
+        messages.error(request, f"Processing the uploaded image took too long!!! Please try again in a few moments or upload a smaller image.")
+
+@async_login_required
+async def search_child(request):
+    if request.method == 'POST':
+        search_form = await bound_form(SearchChildForm, request)
+        if search_form.is_valid():
+            child_image_to_search = search_form.cleaned_data['child_image_to_search']
+            if search_form.cleaned_data['full_name_to_search'] == "" and child_image_to_search == None:
+                messages.error(request, f"Access Denied!!! Please fill any one field.")
+            else:
+                unknown_face_encoding = None
+                if child_image_to_search != None:
+                    unknown_face_encoding = single_face(request, await face_encodings_of_upload(request, child_image_to_search, 'search_child', max_faces = 1))
+                return await sync_to_async(search_response)(request, search_form, unknown_face_encoding)
+        else:
+            messages.error(request, f"Some error(s) occurred. Please correct the error(s) below.")
+    else:
+        search_form = SearchChildForm()
+    return await sync_to_async(render)(request, 'search_child.html', {'search_form': search_form, 'title': 'Search Child'})
+
+@async_login_required
+async def sighted_child(request):
+    if request.method == 'POST':
+        sighted_form = await bound_form(SightedChildForm, request)
+        if sighted_form.is_valid():
+            sighted_child_image = sighted_form.cleaned_data['sighted_child_image']
+            if sighted_form.cleaned_data['group_photo']:
+                located_faces = await face_encodings_of_upload(request, sighted_child_image, 'sighted_child_group', with_locations = True)
+                return await sync_to_async(group_sighting_response)(request, sighted_form, located_faces)
+            face_encodings = await face_encodings_of_upload(request, sighted_child_image, 'sighted_child', max_faces = 1)
+            return await sync_to_async(sighting_response)(request, sighted_form, face_encodings)
+        else:
+            messages.error(request, f"Some error(s) occurred. Please correct the error(s) below.")
+    else:
+        sighted_form = SightedChildForm()
+    return await sync_to_async(render)(request, 'sighted_child.html', {'sighted_form': sighted_form, 'title': 'Sighted Child'})
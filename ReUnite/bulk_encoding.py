@@ -0,0 +1,40 @@
+from concurrent.futures import ProcessPoolExecutor
+from .encoding_service import encode_faces, warm_up_worker
+import multiprocessing, os, time
+
+def encode_image_file(path, profile = None):
+    # Runs in a worker process : returns (face encodings, content of the image downscaled for storage or None if it
+    # already fits, error message or None).
+    try:
+        with open(path, 'rb') as f:
+            face_encodings, downscaled_image = encode_faces(f.read(), profile)
+    except (OSError, ValueError) as e:
+        return [], None, f"cannot read image {path} ({e})"
+    return face_encodings, downscaled_image, None
+
+def encoding_pool(workers):
+    context = multiprocessing.get_context('forkserver' if os.name == 'posix' else 'spawn')
+    return ProcessPoolExecutor(max_workers = workers or os.cpu_count(), mp_context = context, initializer = warm_up_worker)
+
+def chunked(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+class ThroughputReport:
+    def __init__(self, stdout):
+        self.stdout = stdout
+        self.start = time.perf_counter()
+        self.done = 0
+        self.skipped = 0
+
+    def update(self, done, skipped = 0):
+        self.done += done
+        self.skipped += skipped
+        elapsed = time.perf_counter() - self.start
+        self.stdout.write(f"{self.done} record(s) done, {self.skipped} skipped in {elapsed:.1f}s ({self.done / elapsed if elapsed else 0:.1f} records/s)")
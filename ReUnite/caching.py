@@ -0,0 +1,33 @@
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import caches
+from django.http import HttpResponse
+from functools import wraps
+
+# Rendered pages & template fragments that are the same for every visitor are kept in the PAGE_CACHE cache (see
+# CACHES in settings.py) : the homepage and about pages for anonymous visitors (cache_anonymous_page) and the unbound
+# forms of missing_child.html, search_child.html & sighted_child.html ({% cache fragment_cache_timeout ... %}).
+
+def page_cache():
+    return caches[getattr(settings, 'PAGE_CACHE', 'default')]
+
+def cache_anonymous_page(view):
+    # Pages of anonymous visitors without pending messages are served from the cache for PAGE_CACHE_TIMEOUT seconds.
+    # Logged in users see their own navigation bar, so their pages are always rendered.
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method != 'GET' or request.user.is_authenticated or len(get_messages(request)):
+            return view(request, *args, **kwargs)
+        key = f"page:{request.get_full_path()}"
+        content = page_cache().get(key)
+        if content is not None:
+            return HttpResponse(content)
+        response = view(request, *args, **kwargs)
+        if response.status_code == 200:
+            page_cache().set(key, response.content, timeout = settings.PAGE_CACHE_TIMEOUT)
+        return response
+    return wrapper
+
+def cache_settings(request):
+    # context processor
+    return {'fragment_cache_timeout': settings.PAGE_CACHE_TIMEOUT, 'page_cache': getattr(settings, 'PAGE_CACHE', 'default')}
@@ -0,0 +1,139 @@
+from collections import OrderedDict, namedtuple
+from django.conf import settings
+from django.core.cache import caches
+from PIL import Image
+from .image_pipeline import MAX_IMAGE_SIZE
+import hashlib, io, threading
+import numpy as np
+
+# Face encodings of already seen uploads, so that a photo uploaded again (a retry after a form error, the same flyer
+# reported by several volunteers ...) isn't detected & encoded again. Both keys of an upload are combined with the
+# detection & encoding profile the encodings were computed with :
+#   - the SHA-256 of its content : an identical file gets the cached encodings straight away
+#   - a perceptual hash of the decoded image : a photo re-saved, resized or recompressed only gets a candidate, the
+#     boxes of the faces found in the cached photo. The faces at these boxes are encoded (no detection) and the cached
+#     encodings are only used when they are that close to them (see encoding_service.py) : a similar looking photo of
+#     another child is never taken for the cached one.
+# Entries are kept in a per process LRU and, when FACE_ENCODING_CACHE_BACKEND names one of the CACHES, in that shared /
+# persistent cache too. Resizing or recompressing a photo can flip a few bits of its perceptual hash : the LRU also
+# finds the entry whose hash differs by at most max_hash_distance bits, the shared cache only finds identical hashes.
+
+HASH_SIZE = 16 # 16 x 16 = 256 bits difference hash
+
+# content / perceptual : cache keys of an upload, image_size : (width, height) its faces are detected at (see
+# image_pipeline.prepare_image), which the boxes of the faces are relative to
+UploadCacheKeys = namedtuple('UploadCacheKeys', ['content', 'perceptual', 'image_size'])
+
+def perceptual_hash(img, hash_size = HASH_SIZE):
+    # Difference hash of an opened (not yet decoded) image : sign of the horizontal gradients of a (hash_size + 1) x
+    # hash_size grayscale thumbnail. Draft mode lets a JPEG be decoded at 1/8 scale, so this is much cheaper than the
+    # full decode of the face detection.
+    img.draft('L', ((hash_size + 1) * 8, hash_size * 8))
+    pixels = np.asarray(img.convert('L').resize((hash_size + 1, hash_size), Image.BILINEAR), dtype = np.int16)
+    return np.packbits(pixels[:, 1:] > pixels[:, :-1]).tobytes().hex()
+
+def profile_digest(profile):
+    return hashlib.sha1(repr(sorted((profile or {}).items())).encode()).hexdigest()[:12]
+
+def upload_cache_keys(image_bytes, profile = None):
+    prefix = f"face_encodings:{profile_digest(profile)}"
+    img = Image.open(io.BytesIO(image_bytes))
+    width, height = img.size
+    scale = min(MAX_IMAGE_SIZE / max(width, height), 1)
+    return UploadCacheKeys(f"{prefix}:sha256:{hashlib.sha256(image_bytes).hexdigest()}", f"{prefix}:dhash:{perceptual_hash(img)}",
+                           (width * scale, height * scale))
+
+def relative_face_locations(face_locations, image_size):
+    width, height = image_size
+    return [(top / height, right / width, bottom / height, left / width) for top, right, bottom, left in face_locations]
+
+def absolute_face_locations(face_locations, image_size):
+    width, height = image_size
+    return [(int(round(top * height)), int(round(right * width)), int(round(bottom * height)), int(round(left * width)))
+            for top, right, bottom, left in face_locations]
+
+class EncodingCache:
+    def __init__(self, max_entries, backend = None, timeout = None, max_hash_distance = 0):
+        self.max_entries = max_entries
+        self.max_hash_distance = max_hash_distance
+        self.timeout = timeout
+        self._backend = caches[backend] if backend else None
+        # content key ---> list of face encodings, perceptual key ---> (face boxes relative to the image size, list of
+        # face encodings), least recently used first
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _remember(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > 2 * self.max_entries: # two entries per upload
+                self._entries.popitem(last = False)
+
+    def _get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+        if self._backend is not None:
+            value = self._backend.get(key)
+            if value is not None:
+                self._remember(key, value)
+                return value
+        return None
+
+    def _similar_key(self, key):
+        # key of the LRU entry with the nearest perceptual hash (same profile), if within max_hash_distance bits
+        prefix, _, digest = key.rpartition(':')
+        value = int(digest, 16)
+        best_distance, best_key = self.max_hash_distance + 1, None
+        with self._lock:
+            for other_key in self._entries:
+                other_prefix, _, other_digest = other_key.rpartition(':')
+                if other_prefix == prefix:
+                    distance = bin(value ^ int(other_digest, 16)).count('1')
+                    if distance < best_distance:
+                        best_distance, best_key = distance, other_key
+        return best_key
+
+    def get(self, cache_keys):
+        # Face encodings cached for an identical upload (an empty list : no face detected), or None
+        return self._get(cache_keys.content)
+
+    def similar(self, cache_keys):
+        # (boxes of the faces in the upload, cached face encodings) of the cached upload with the nearest perceptual
+        # hash, or None : a candidate only, to be confirmed by the encodings of the faces at these boxes
+        entry = self._get(cache_keys.perceptual)
+        if entry is None and self.max_hash_distance:
+            similar_key = self._similar_key(cache_keys.perceptual)
+            entry = self._get(similar_key) if similar_key is not None else None
+        if entry is None:
+            return None
+        face_locations, face_encodings = entry
+        return absolute_face_locations(face_locations, cache_keys.image_size), face_encodings
+
+    def set(self, cache_keys, face_locations, face_encodings):
+        face_encodings = [np.asarray(face_encoding) for face_encoding in face_encodings]
+        entries = {cache_keys.content: face_encodings,
+                   cache_keys.perceptual: (relative_face_locations(face_locations, cache_keys.image_size), face_encodings)}
+        for key, value in entries.items():
+            self._remember(key, value)
+        if self._backend is not None:
+            self._backend.set_many(entries, timeout = self.timeout)
+
+_encoding_cache = None
+_encoding_cache_lock = threading.Lock()
+
+def get_encoding_cache():
+    # None when FACE_ENCODING_CACHE_SIZE is 0 (cache disabled)
+    global _encoding_cache
+    if _encoding_cache is None:
+        with _encoding_cache_lock:
+            if _encoding_cache is None:
+                max_entries = getattr(settings, 'FACE_ENCODING_CACHE_SIZE', 1024)
+                if not max_entries:
+                    return None
+                _encoding_cache = EncodingCache(max_entries, getattr(settings, 'FACE_ENCODING_CACHE_BACKEND', None),
+                                                getattr(settings, 'FACE_ENCODING_CACHE_TTL', None),
+                                                getattr(settings, 'FACE_ENCODING_CACHE_MAX_HASH_DISTANCE', 0))
+    return _encoding_cache
@@ -0,0 +1,267 @@
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from django.conf import settings
+from .image_pipeline import prepare_image, replace_upload_content
+from .face_detection import DEFAULT_PROFILE, detect_faces, detect_and_encode, low_resolution_face_locations
+from .metrics import stage, record_stage_timings, count_event
+from .encoding_cache import get_encoding_cache, upload_cache_keys
+from .thumbnails import rendition_contents
+from PIL import Image
+import asyncio, multiprocessing, os, threading, time
+import numpy as np
+
+class EncodingServiceBusy(Exception):
+    pass
+
+class EncodingServiceTimeout(Exception):
+    pass
+
+class TooManyFaces(Exception):
+    # More than max_faces faces detected in an upload : its faces were not encoded
+    def __init__(self, face_count):
+        super().__init__(face_count)
+        self.face_count = face_count
+
+def warm_up_worker():
+    # Runs once in every worker process : importing face_recognition loads the dlib detector / landmark / ResNet
+    # models and one encoding of a blank image initialises them, so the first real upload doesn't pay for it.
+    import face_recognition
+    face_recognition.face_encodings(np.zeros((64, 64, 3), dtype = np.uint8))
+
+def encode_faces(image_bytes, profile = None, known_face_locations = None):
+    # Returns (face encodings : list of 128-d float64 arrays, one per detected face, content of the image downscaled
+    # for storage or None) of an uploaded image file's content, which is decoded only once for both. profile holds
+    # the face detection & encoding options (see face_detection.py).
+    image, downscaled_image = prepare_image(image_bytes)
+    return detect_and_encode(image, profile, known_face_locations), downscaled_image
+
+def timed_encode_faces(image_bytes, profile = None, known_face_locations = None, max_faces = None):
+    # Same as encode_faces, also returning the (top, right, bottom, left) boxes of the faces in the image downscaled
+    # for storage, its renditions when the profile asks for them (see thumbnails.rendition_contents, None otherwise)
+    # and the seconds spent decoding, detecting and encoding (measured in the worker process, recorded in
+    # the metrics of the web process, see metrics.py). When the detection finds more than max_faces faces, they are
+    # not encoded and None is returned instead of their encodings (a photo that must show a single face is rejected
+    # without paying for the encodings). With the profile's precheck_size, the faces are first counted on a draft
+    # decoded copy : a photo already showing too many faces there is rejected without decoding and detecting at full
+    # resolution (its boxes being those of the copy), while one showing too few goes on to the full resolution
+    # detection, which finds the smaller faces.
+    options = dict(DEFAULT_PROFILE, **(profile or {}))
+    timings = {}
+    if max_faces is not None and known_face_locations is None and options['precheck_size']:
+        start = time.perf_counter()
+        precheck_face_locations = low_resolution_face_locations(image_bytes, options['precheck_size'], options['upsample'])
+        timings['face_precheck'] = time.perf_counter() - start
+        if len(precheck_face_locations) > max_faces:
+            return [tuple(face_location) for face_location in precheck_face_locations], None, None, None, timings
+    start = time.perf_counter()
+    image, downscaled_image = prepare_image(image_bytes)
+    timings['image_decode'] = time.perf_counter() - start
+    renditions = None
+    if options['renditions']: # from the image decoded for the faces, not from the stored file after the request
+        start = time.perf_counter()
+        renditions = rendition_contents(Image.fromarray(image))
+        timings['rendition_generation'] = time.perf_counter() - start
+    if known_face_locations is None:
+        start = time.perf_counter()
+        known_face_locations = detect_faces(image, options['detection_size'], options['upsample'], options['detection_model'])
+        timings['face_detection'] = time.perf_counter() - start
+    if max_faces is not None and len(known_face_locations) > max_faces:
+        return [tuple(face_location) for face_location in known_face_locations], None, downscaled_image, renditions, timings
+    start = time.perf_counter()
+    face_encodings = detect_and_encode(image, profile, known_face_locations) # every face of the image in one call
+    timings['face_encoding'] = time.perf_counter() - start
+    return [tuple(face_location) for face_location in known_face_locations], face_encodings, downscaled_image, renditions, timings
+
+class EncodingService:
+    # Runs the CPU-bound face detection & encoding in a pool of warm worker processes so that a multi-core box encodes
+    # several uploads in parallel. At most max_pending images are queued or in progress at a time; further submissions
+    # are refused with EncodingServiceBusy instead of piling up behind them (backpressure).
+
+    def __init__(self, workers, max_pending):
+        context = multiprocessing.get_context('forkserver' if os.name == 'posix' else 'spawn')
+        self._executor = ProcessPoolExecutor(max_workers = workers, mp_context = context, initializer = warm_up_worker)
+        self._workers = workers
+        self._pending = threading.BoundedSemaphore(max_pending)
+
+    def start(self):
+        # starts (and warms up) the worker processes now rather than on the first uploads
+        for future in [self._executor.submit(os.getpid) for _ in range(self._workers)]:
+            future.result()
+
+    def submit(self, image_bytes, profile = None, known_face_locations = None, wait = 0, max_faces = None):
+        if not self._pending.acquire(timeout = wait):
+            raise EncodingServiceBusy()
+        try:
+            future = self._executor.submit(timed_encode_faces, image_bytes, profile, known_face_locations, max_faces)
+        except Exception:
+            self._pending.release()
+            raise
+        future.add_done_callback(lambda _: self._pending.release())
+        return future
+
+    def encode(self, image_bytes, timeout, profile = None, known_face_locations = None, max_faces = None):
+        try:
+            future = self.submit(image_bytes, profile, known_face_locations, wait = getattr(settings, 'FACE_ENCODING_QUEUE_WAIT', 1), max_faces = max_faces)
+        except EncodingServiceBusy:
+            count_event('encoding_service_busy')
+            raise
+        try:
+            face_locations, face_encodings, downscaled_image, renditions, timings = future.result(timeout = timeout)
+        except TimeoutError:
+            future.cancel()
+            count_event('encoding_service_timeout')
+            raise EncodingServiceTimeout()
+        record_stage_timings(timings)
+        return face_locations, face_encodings, downscaled_image, renditions
+
+    async def encode_async(self, image_bytes, timeout, profile = None, known_face_locations = None, max_faces = None):
+        # Same as encode() for the async views : the event loop awaits the worker process' result instead of a thread
+        # blocking on it (only waiting for a free slot of a full queue, at most FACE_ENCODING_QUEUE_WAIT seconds,
+        # takes a thread of the default executor).
+        loop = asyncio.get_running_loop()
+        try:
+            future = await loop.run_in_executor(None, lambda: self.submit(image_bytes, profile, known_face_locations, wait = getattr(settings, 'FACE_ENCODING_QUEUE_WAIT', 1), max_faces = max_faces))
+        except EncodingServiceBusy:
+            count_event('encoding_service_busy')
+            raise
+        try:
+            face_locations, face_encodings, downscaled_image, renditions, timings = await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except asyncio.TimeoutError: # wait_for has cancelled the future
+            count_event('encoding_service_timeout')
+            raise EncodingServiceTimeout()
+        record_stage_timings(timings)
+        return face_locations, face_encodings, downscaled_image, renditions
+
+    def shutdown(self):
+        self._executor.shutdown(wait = False)
+
+_encoding_service = None
+_encoding_service_lock = threading.Lock()
+
+def get_encoding_service():
+    global _encoding_service
+    if _encoding_service is None:
+        with _encoding_service_lock:
+            if _encoding_service is None:
+                workers = settings.FACE_ENCODING_WORKERS
+                _encoding_service = EncodingService(workers, getattr(settings, 'FACE_ENCODING_MAX_PENDING', 4 * workers))
+    return _encoding_service
+
+def encoding_profile(endpoint):
+    return settings.FACE_ENCODING_PROFILES.get(endpoint)
+
+def read_upload(uploaded_file):
+    uploaded_file.seek(0)
+    image_bytes = uploaded_file.read()
+    uploaded_file.seek(0) # the file is saved to the media storage later on
+    return image_bytes
+
+def cached_face_encodings(image_bytes, profile, use_cache = True):
+    # (encoding cache, cache keys of the upload, face encodings cached for an identical upload or None)
+    encoding_cache = get_encoding_cache() if use_cache else None
+    if encoding_cache is None:
+        return None, None, None
+    cache_keys = upload_cache_keys(image_bytes, profile)
+    face_encodings = encoding_cache.get(cache_keys)
+    count_event('encoding_cache', result = 'miss' if face_encodings is None else 'hit')
+    return encoding_cache, cache_keys, face_encodings
+
+def similar_upload(encoding_cache, cache_keys, max_faces):
+    # (boxes of the faces in the upload, cached face encodings) of a similar looking cached upload, or None. An upload
+    # whose faces couldn't be confirmed (no face) or that would be rejected anyway (more than max_faces faces) isn't
+    # a candidate.
+    candidate = encoding_cache.similar(cache_keys) if encoding_cache is not None else None
+    if candidate is None or not candidate[1] or (max_faces is not None and len(candidate[1]) > max_faces):
+        return None
+    return candidate
+
+def confirmation_profile(profile):
+    # the faces at the candidate's boxes are encoded once, whatever the num_jitters of the profile
+    return dict(profile or {}, num_jitters = 1)
+
+def confirmed_face_encodings(cached_face_encodings, face_encodings):
+    # The cached encodings of a similar looking upload when the faces at its boxes are the same faces (encodings at most
+    # FACE_ENCODING_CACHE_CONFIRM_DISTANCE apart, far below the match tolerance), None otherwise
+    confirmed = face_encodings is not None and len(face_encodings) == len(cached_face_encodings) and \
+        all(np.linalg.norm(np.asarray(cached) - face_encoding) <= getattr(settings, 'FACE_ENCODING_CACHE_CONFIRM_DISTANCE', 0.15)
+            for cached, face_encoding in zip(cached_face_encodings, face_encodings))
+    count_event('encoding_cache_candidate', result = 'confirmed' if confirmed else 'rejected')
+    return cached_face_encodings if confirmed else None
+
+def encoded_upload(uploaded_file, encoding_cache, cache_keys, face_locations, face_encodings, downscaled_image, renditions, with_locations):
+    # The upload is replaced by its downscaled version and carries the renditions produced with its encodings (written
+    # by the model's save(), see thumbnails.py) even when it shows too many faces, a sighting being saved anyway.
+    if downscaled_image is not None:
+        replace_upload_content(uploaded_file, downscaled_image)
+    if renditions is not None:
+        uploaded_file.renditions = renditions
+    if face_encodings is None: # more faces than allowed, see timed_encode_faces
+        raise TooManyFaces(len(face_locations))
+    if encoding_cache is not None:
+        encoding_cache.set(cache_keys, face_locations, face_encodings)
+    if with_locations:
+        return face_locations, face_encodings
+    return face_encodings
+
+def too_many_faces(face_encodings, max_faces):
+    # for the encodings found in the cache
+    if max_faces is not None and len(face_encodings) > max_faces:
+        raise TooManyFaces(len(face_encodings))
+    return face_encodings
+
+def encode_upload(image_bytes, profile = None, known_face_locations = None, max_faces = None):
+    # (face boxes, face encodings, downscaled image content, renditions) computed in the encoding service, or in this
+    # thread when FACE_ENCODING_WORKERS is 0
+    if not settings.FACE_ENCODING_WORKERS:
+        face_locations, face_encodings, downscaled_image, renditions, timings = timed_encode_faces(image_bytes, profile, known_face_locations, max_faces)
+        record_stage_timings(timings)
+        return face_locations, face_encodings, downscaled_image, renditions
+    return get_encoding_service().encode(image_bytes, settings.FACE_ENCODING_TIMEOUT, profile, known_face_locations, max_faces)
+
+async def encode_upload_async(image_bytes, profile = None, known_face_locations = None, max_faces = None):
+    if not settings.FACE_ENCODING_WORKERS:
+        loop = asyncio.get_running_loop()
+        face_locations, face_encodings, downscaled_image, renditions, timings = await loop.run_in_executor(None, timed_encode_faces, image_bytes, profile, known_face_locations, max_faces)
+        record_stage_timings(timings)
+        return face_locations, face_encodings, downscaled_image, renditions
+    return await get_encoding_service().encode_async(image_bytes, settings.FACE_ENCODING_TIMEOUT, profile, known_face_locations, max_faces)
+
+def face_encodings_of_file(uploaded_file, endpoint = None, known_face_locations = None, with_locations = False, max_faces = None):
+    # Face encodings of an uploaded image, computed in the encoding service (or in this thread when
+    # FACE_ENCODING_WORKERS is 0) with the FACE_ENCODING_PROFILES options of endpoint, or taken from the encoding cache
+    # when the same photo was uploaded before (as is, or only encoded at the boxes of the faces of a similar looking
+    # cached photo to confirm it is the same, see encoding_cache.py). An upload too large to be stored as is gets
+    # replaced by its downscaled version produced in the same pass. With with_locations, (face boxes in the stored
+    # image, face encodings) are returned and the encoding cache is bypassed. May raise EncodingServiceBusy /
+    # EncodingServiceTimeout, or TooManyFaces when more than max_faces faces are detected.
+    image_bytes = read_upload(uploaded_file)
+    profile = encoding_profile(endpoint)
+    encoding_cache, cache_keys, face_encodings = cached_face_encodings(image_bytes, profile, known_face_locations is None and not with_locations)
+    if face_encodings is not None: # same photo already encoded, the model's save() downscales it for storage
+        return too_many_faces(face_encodings, max_faces)
+    with stage('face_encodings_of_upload'): # queueing + decode + detection + encoding
+        candidate = similar_upload(encoding_cache, cache_keys, max_faces)
+        if candidate is not None:
+            face_locations, face_encodings, downscaled_image, renditions = encode_upload(image_bytes, confirmation_profile(profile), candidate[0])
+            face_encodings = confirmed_face_encodings(candidate[1], face_encodings)
+        if face_encodings is None:
+            face_locations, face_encodings, downscaled_image, renditions = encode_upload(image_bytes, profile, known_face_locations, max_faces)
+    return encoded_upload(uploaded_file, encoding_cache, cache_keys, face_locations, face_encodings, downscaled_image, renditions, with_locations)
+
+async def face_encodings_of_file_async(uploaded_file, endpoint = None, with_locations = False, max_faces = None):
+    # Same as face_encodings_of_file for the async views : reading the upload, the encoding cache lookup (content &
+    # perceptual hash, shared cache) and the encoding itself (FACE_ENCODING_WORKERS = 0) run in the default executor, the
+    # encoding service's result is awaited, so the event loop keeps serving other requests meanwhile.
+    loop = asyncio.get_running_loop()
+    image_bytes = await loop.run_in_executor(None, read_upload, uploaded_file)
+    profile = encoding_profile(endpoint)
+    encoding_cache, cache_keys, face_encodings = await loop.run_in_executor(None, cached_face_encodings, image_bytes, profile, not with_locations)
+    if face_encodings is not None:
+        return too_many_faces(face_encodings, max_faces)
+    with stage('face_encodings_of_upload'):
+        candidate = await loop.run_in_executor(None, similar_upload, encoding_cache, cache_keys, max_faces)
+        if candidate is not None:
+            face_locations, face_encodings, downscaled_image = await encode_upload_async(image_bytes, confirmation_profile(profile), candidate[0])
+            face_encodings = confirmed_face_encodings(candidate[1], face_encodings)
+        if face_encodings is None:
+            face_locations, face_encodings, downscaled_image = await encode_upload_async(image_bytes, profile, max_faces = max_faces)
+    return await loop.run_in_executor(None, encoded_upload, uploaded_file, encoding_cache, cache_keys, face_locations, face_encodings, downscaled_image, renditions, with_locations)
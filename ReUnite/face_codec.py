@@ -0,0 +1,66 @@
+from django.conf import settings
+import struct
+import numpy as np
+
+# Binary format of MissingChildEncodedFace.child_encoded_face :
+#
+#   magic b'RE' | format version (uint8) | dtype code (uint8) | model version (uint8) | reserved (uint8) | dimension (uint16)
+#   followed by the little-endian float32 (or float16) payload.
+#
+# The 8 bytes header keeps the payload aligned, so that a blob is read as a numpy array without copying it. Encodings
+# saved before this format are raw float64 arrays without a header (1024 bytes for a 128-d encoding) and stay readable.
+
+MAGIC = b'RE'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<2sBBBBH')
+DTYPES = {1: np.dtype('<f4'), 2: np.dtype('<f2')}
+DTYPE_CODES = {dtype: code for code, dtype in DTYPES.items()}
+MODEL_VERSION = 1 # dlib ResNet face encoding model used by face_recognition
+LEGACY_DTYPE = np.dtype('<f8')
+LEGACY_DIMENSION = 128
+
+def encode_face_encoding(encoding, dtype = None, model_version = MODEL_VERSION):
+    dtype = dtype or getattr(settings, 'FACE_ENCODING_STORAGE_DTYPE', 'float32')
+    payload = np.ascontiguousarray(encoding, dtype = np.dtype(dtype).newbyteorder('<'))
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, DTYPE_CODES[payload.dtype], model_version, 0, payload.size)
+    return header + payload.tobytes()
+
+def is_legacy(blob):
+    return len(blob) == LEGACY_DIMENSION * LEGACY_DTYPE.itemsize
+
+def decode_face_encoding(blob):
+    # Read-only numpy view of the encoding stored in blob (bytes or memoryview), without copying the payload.
+    if is_legacy(blob):
+        return np.frombuffer(blob, dtype = LEGACY_DTYPE)
+    magic, format_version, dtype_code, _, _, dimension = HEADER.unpack_from(blob)
+    if magic != MAGIC or format_version != FORMAT_VERSION or dtype_code not in DTYPES:
+        raise ValueError("Unknown face encoding format.")
+    return np.frombuffer(blob, dtype = DTYPES[dtype_code], count = dimension, offset = HEADER.size)
+
+def encoding_model_version(blob):
+    if is_legacy(blob):
+        return None
+    return HEADER.unpack_from(blob)[3]
+
+def convert_legacy_encodings(apps = None, schema_editor = None, dtype = None, chunk_size = 500):
+    # Rewrites the legacy float64 blobs in the current format. Run by migration 0009 (apps given, as a RunPython
+    # function) and by 'manage.py convert_face_encodings'.
+    if apps is None:
+        from .models import MissingChildEncodedFace
+    else:
+        MissingChildEncodedFace = apps.get_model('ReUnite', 'MissingChildEncodedFace')
+    converted = 0
+    last_pk = 0
+    while True:
+        chunk = list(MissingChildEncodedFace.objects.filter(pk__gt = last_pk).order_by('pk')[:chunk_size])
+        if not chunk:
+            return converted
+        last_pk = chunk[-1].pk
+        legacy = [encoded_face for encoded_face in chunk if is_legacy(encoded_face.child_encoded_face)]
+        for encoded_face in legacy:
+            encoded_face.child_encoded_face = encode_face_encoding(decode_face_encoding(encoded_face.child_encoded_face), dtype = dtype)
+        MissingChildEncodedFace.objects.bulk_update(legacy, ['child_encoded_face'])
+        if apps is None: # float16 storage changes the encodings the face indexes hold
+            from .face_index_changes import record_face_index_changes
+            record_face_index_changes([encoded_face.missing_child_id for encoded_face in legacy if encoded_face.missing_child_id is not None])
+        converted += len(legacy)
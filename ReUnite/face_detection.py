@@ -0,0 +1,54 @@
+from PIL import Image
+from .image_pipeline import downscale
+import io
+import numpy as np
+
+# Face detection & encoding options of an endpoint (see FACE_ENCODING_PROFILES in settings.py) :
+#   detection_size  : faces are detected on a copy downscaled to fit in detection_size x detection_size (None = on the
+#                     full image) and their boxes are mapped back, the encodings are always computed at full resolution
+#   upsample        : number_of_times_to_upsample of face_recognition.face_locations (finds smaller faces, slower)
+#   detection_model : 'hog' (CPU) or 'cnn' (accurate, needs a GPU to be fast)
+#   num_jitters     : number of times a face is re-sampled and encoded, the encodings being averaged (slower, more stable)
+#   encoding_model  : 'small' (5 landmarks) or 'large' (68 landmarks) face alignment before the encoding
+#   precheck_size   : when the number of faces is limited (max_faces), they are first counted (HOG) on a copy decoded
+#                     to fit in precheck_size x precheck_size (None = no pre-check), see encoding_service.py
+#   renditions      : also produce the IMAGE_RENDITIONS of the image from its decoded copy (uploads that are stored)
+DEFAULT_PROFILE = {'detection_size': None, 'upsample': 1, 'detection_model': 'hog', 'num_jitters': 1, 'encoding_model': 'small', 'precheck_size': None,
+                   'renditions': False}
+
+def scale_face_location(face_location, scale, image_shape):
+    # (top, right, bottom, left) box found on a downscaled copy ---> same box on the full resolution image
+    top, right, bottom, left = face_location
+    height, width = image_shape[:2]
+    return (max(int(round(top * scale)), 0), min(int(round(right * scale)), width),
+            min(int(round(bottom * scale)), height), max(int(round(left * scale)), 0))
+
+def detect_faces(image, detection_size = None, upsample = 1, detection_model = 'hog'):
+    import face_recognition
+    height, width = image.shape[:2]
+    if not detection_size or max(height, width) <= detection_size:
+        return face_recognition.face_locations(image, number_of_times_to_upsample = upsample, model = detection_model)
+    scale = max(height, width) / detection_size
+    detection_image = Image.fromarray(image).resize((int(round(width / scale)), int(round(height / scale))), Image.BILINEAR)
+    face_locations = face_recognition.face_locations(np.asarray(detection_image), number_of_times_to_upsample = upsample, model = detection_model)
+    return [scale_face_location(face_location, scale, image.shape) for face_location in face_locations]
+
+def detect_and_encode(image, profile = None, known_face_locations = None):
+    # Face encodings of an RGB image array. known_face_locations (list of (top, right, bottom, left) boxes), when
+    # already known, skips the face detection altogether.
+    options = dict(DEFAULT_PROFILE, **(profile or {}))
+    import face_recognition
+    if known_face_locations is None:
+        known_face_locations = detect_faces(image, options['detection_size'], options['upsample'], options['detection_model'])
+    if not known_face_locations:
+        return []
+    return face_recognition.face_encodings(image, known_face_locations = known_face_locations,
+                                           num_jitters = options['num_jitters'], model = options['encoding_model'])
+
+def low_resolution_face_locations(image_bytes, size, upsample = 1):
+    # Cheap pre-check of an uploaded image's content : faces detected (HOG) on a copy downscaled to fit in size x size,
+    # decoded in draft mode (at 1/2, 1/4 or 1/8 scale for a JPEG) instead of at full resolution. The boxes are those of
+    # the downscaled copy.
+    img = Image.open(io.BytesIO(image_bytes))
+    downscale(img, size, Image.BILINEAR)
+    return detect_faces(np.asarray(img.convert('RGB')), upsample = upsample)
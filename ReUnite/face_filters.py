@@ -0,0 +1,143 @@
+from django.conf import settings
+import threading
+import numpy as np
+
+# Attribute prefilter of the face search, evaluated in memory : the prefilter attributes of every missing child
+# (gender, age, state, district, missing_from_date) are kept in arrays indexed by missing_child_id, so that a filter is
+# a few vectorized comparisons giving a mask over the ids instead of a database query pulling the list of candidate
+# ids on every search & sighting. Loaded once per process and then kept in sync like the face index (signals.py for
+# the changes of this process, the FaceIndexChange feed for those of the others, see face_index_changes.py).
+
+DAYS_PER_YEAR = 365.25
+COLUMNS = ('gender', 'age', 'state', 'district', 'missing_from_date')
+
+def normalized(value):
+    return str(value or '').strip().lower()
+
+class MissingChildAttributes:
+    def __init__(self, capacity = 1024):
+        self._lock = threading.RLock()
+        self._present = np.zeros(capacity, dtype = bool)
+        self._genders = np.zeros(capacity, dtype = np.int32) # codes of the normalized values, see _code()
+        self._ages = np.zeros(capacity, dtype = np.int16)
+        self._states = np.zeros(capacity, dtype = np.int32)
+        self._districts = np.zeros(capacity, dtype = np.int32)
+        self._missing_days = np.zeros(capacity, dtype = np.int32) # missing_from_date.toordinal()
+        self._codes = {'gender': {}, 'state': {}, 'district': {}} # normalized value ---> code (0 : blank)
+
+    def __len__(self):
+        return int(self._present.sum())
+
+    def _code(self, column, value, add = True):
+        value = normalized(value)
+        if not value:
+            return 0
+        codes = self._codes[column]
+        if value not in codes and add:
+            codes[value] = len(codes) + 1
+        return codes.get(value)
+
+    def _grow(self, min_capacity):
+        capacity = max(min_capacity, 2 * len(self._present))
+        for name in ('_present', '_genders', '_ages', '_states', '_districts', '_missing_days'):
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype = old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def load(self, rows):
+        # rows is an iterable of (missing_child_id, gender, age, state, district, missing_from_date) tuples
+        rows = list(rows)
+        with self._lock:
+            if not rows:
+                return
+            ids = np.array([row[0] for row in rows], dtype = np.int64)
+            if ids.max() >= len(self._present):
+                self._grow(int(ids.max()) + 1)
+            self._present[ids] = True
+            self._genders[ids] = [self._code('gender', row[1]) for row in rows]
+            self._ages[ids] = [row[2] or 0 for row in rows]
+            self._states[ids] = [self._code('state', row[3]) for row in rows]
+            self._districts[ids] = [self._code('district', row[4]) for row in rows]
+            self._missing_days[ids] = [row[5].toordinal() for row in rows]
+
+    def set(self, missing_child_id, gender, age, state, district, missing_from_date):
+        self.load([(missing_child_id, gender, age, state, district, missing_from_date)])
+
+    def remove(self, missing_child_id):
+        with self._lock:
+            if missing_child_id < len(self._present):
+                self._present[missing_child_id] = False
+
+    def candidates(self, filters):
+        # Structured filters ---> array of the missing_child_id's the face search is restricted to, or None when no
+        # filter is given and every stored face is compared.
+        #   gender, state, district : same value (case insensitive)
+        #   age                     : reported age within FACE_SEARCH_AGE_MARGIN year(s)
+        #   missing_from_date       : went missing on or before that date
+        #   sighted_date            : went missing on or before the date of a sighting and, with sighted_age, was
+        #                             about that age on that date (reported age + years elapsed since going missing)
+        filters = {name: value for name, value in (filters or {}).items() if value not in (None, '')}
+        if not filters:
+            return None
+        margin = settings.FACE_SEARCH_AGE_MARGIN
+        with self._lock:
+            mask = self._present.copy()
+            for column, values in (('gender', self._genders), ('state', self._states), ('district', self._districts)):
+                if column in filters:
+                    code = self._code(column, filters[column], add = False)
+                    if code is None: # value of no stored child
+                        return np.empty(0, dtype = np.int64)
+                    mask &= values == code
+            if 'age' in filters:
+                mask &= np.abs(self._ages - filters['age']) <= margin
+            if 'missing_from_date' in filters:
+                mask &= self._missing_days <= filters['missing_from_date'].toordinal()
+            if 'sighted_date' in filters:
+                sighted_day = filters['sighted_date'].toordinal()
+                mask &= self._missing_days <= sighted_day
+                if 'sighted_age' in filters:
+                    age_on_sighted_date = self._ages + np.floor((sighted_day - self._missing_days) / DAYS_PER_YEAR)
+                    mask &= np.abs(age_on_sighted_date - filters['sighted_age']) <= margin
+            return np.flatnonzero(mask)
+
+def missing_child_attributes_query(missing_child_ids = None):
+    from .models import MissingChild
+    queryset = MissingChild.objects.all()
+    if missing_child_ids is not None:
+        queryset = queryset.filter(pk__in = list(missing_child_ids))
+    return queryset.values_list('pk', *COLUMNS)
+
+def missing_child_attribute_rows(missing_child_ids = None):
+    return missing_child_attributes_query(missing_child_ids).iterator()
+
+_attributes = None
+_attributes_lock = threading.Lock()
+
+def loaded_missing_child_attributes():
+    return _attributes
+
+def get_missing_child_attributes():
+    global _attributes
+    if _attributes is None:
+        with _attributes_lock:
+            if _attributes is None:
+                attributes = MissingChildAttributes()
+                attributes.load(missing_child_attribute_rows())
+                _attributes = attributes
+    return _attributes
+
+def refresh_missing_child_attributes(missing_child_ids):
+    # Reloads the attributes of the given missing children (those deleted are removed), if they are loaded
+    attributes = _attributes
+    if attributes is None:
+        return
+    rows = list(missing_child_attribute_rows(missing_child_ids))
+    attributes.load(rows)
+    for missing_child_id in set(missing_child_ids) - {row[0] for row in rows}:
+        attributes.remove(missing_child_id)
+
+def reset_missing_child_attributes():
+    global _attributes
+    with _attributes_lock:
+        _attributes = None
@@ -0,0 +1,305 @@
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import request_started
+from django.db import DatabaseError
+import logging, os, threading
+import numpy as np
+from .face_codec import decode_face_encoding
+
+logger = logging.getLogger(__name__)
+
+ENCODING_DIMENSION = 128
+DEFAULT_TOLERANCE = 0.6 # same default as face_recognition.compare_faces
+
+def top_k(ids, distances, k, tolerance = DEFAULT_TOLERANCE):
+    # Best k (missing_child_id, distance) pairs within tolerance, nearest first. np.argpartition selects the k
+    # smallest distances in linear time so that only those k are sorted, not every stored encoding.
+    within_tolerance = distances <= tolerance
+    ids, distances = ids[within_tolerance], distances[within_tolerance]
+    if k is not None and 0 < k < len(distances):
+        best = np.argpartition(distances, k - 1)[:k]
+        ids, distances = ids[best], distances[best]
+    order = np.argsort(distances, kind = 'stable')
+    return list(zip(ids[order].tolist(), distances[order].tolist()))
+
+class FaceEncodingIndex:
+    # Keeps every stored MissingChildEncodedFace in one contiguous float32 matrix (one row per encoding) with an
+    # aligned array of missing_child_id's, so that a search computes all the face distances in a single batched
+    # operation instead of one compare_faces call per database row.
+
+    def __init__(self, capacity = 1024):
+        self._lock = threading.RLock()
+        self._matrix = np.empty((capacity, ENCODING_DIMENSION), dtype = np.float32)
+        self._squared_norms = np.empty(capacity, dtype = np.float32)
+        self._ids = np.empty(capacity, dtype = np.int64)
+        self._row_of = np.full(capacity, -1, dtype = np.int64) # missing_child_id ---> row of the matrix (-1 : not in the index)
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def _grow(self, min_capacity):
+        capacity = max(min_capacity, 2 * len(self._ids))
+        for name in ('_matrix', '_squared_norms', '_ids'):
+            old = getattr(self, name)
+            new = np.empty((capacity,) + old.shape[1:], dtype = old.dtype)
+            new[:self._size] = old[:self._size]
+            setattr(self, name, new)
+
+    def _row_of_capacity(self, max_id):
+        if max_id >= len(self._row_of):
+            row_of = np.full(max(max_id + 1, 2 * len(self._row_of)), -1, dtype = np.int64)
+            row_of[:len(self._row_of)] = self._row_of
+            self._row_of = row_of
+
+    def load(self, rows):
+        # rows is an iterable of (missing_child_id, encoding) pairs; replaces the whole content of the index
+        ids = []
+        encodings = []
+        for missing_child_id, encoding in rows:
+            ids.append(missing_child_id)
+            encodings.append(encoding)
+        self.load_arrays(np.array(ids, dtype = np.int64), np.array(encodings, dtype = np.float32).reshape(-1, ENCODING_DIMENSION))
+
+    def load_arrays(self, ids, encodings):
+        # Same as load() for an id array and its aligned (N x 128) encodings matrix, without a per-row Python loop.
+        n = len(ids)
+        capacity = max(n, len(self._ids))
+        matrix = np.empty((capacity, ENCODING_DIMENSION), dtype = np.float32)
+        matrix[:n] = encodings
+        squared_norms = np.empty(capacity, dtype = np.float32)
+        squared_norms[:n] = np.einsum('ij,ij->i', matrix[:n], matrix[:n])
+        aligned_ids = np.empty(capacity, dtype = np.int64)
+        aligned_ids[:n] = ids
+        row_of = np.full(max(int(aligned_ids[:n].max()) + 1 if n else 0, len(self._row_of)), -1, dtype = np.int64)
+        row_of[aligned_ids[:n]] = np.arange(n)
+        with self._lock:
+            self._matrix = matrix
+            self._squared_norms = squared_norms
+            self._ids = aligned_ids
+            self._row_of = row_of
+            self._size = n
+
+    def _add(self, missing_child_id, encoding):
+        missing_child_id = int(missing_child_id)
+        self._row_of_capacity(missing_child_id)
+        row = int(self._row_of[missing_child_id])
+        if row < 0:
+            if self._size == len(self._ids):
+                self._grow(self._size + 1)
+            row = self._size
+            self._size += 1
+            self._row_of[missing_child_id] = row
+        self._matrix[row] = encoding
+        self._squared_norms[row] = np.dot(self._matrix[row], self._matrix[row])
+        self._ids[row] = missing_child_id
+
+    def ids(self):
+        with self._lock:
+            return self._ids[:self._size].copy()
+
+    def rows(self):
+        # Copy of (missing_child_ids, encodings matrix) currently held by the index.
+        with self._lock:
+            return self._ids[:self._size].copy(), self._matrix[:self._size].copy()
+
+    def add(self, missing_child_id, encoding):
+        with self._lock:
+            self._add(missing_child_id, encoding)
+
+    def remove(self, missing_child_id):
+        with self._lock:
+            missing_child_id = int(missing_child_id)
+            if missing_child_id >= len(self._row_of) or self._row_of[missing_child_id] < 0:
+                return
+            row = int(self._row_of[missing_child_id])
+            self._row_of[missing_child_id] = -1
+            last = self._size - 1
+            if row != last: # move the last row into the hole so that the matrix stays contiguous
+                self._matrix[row] = self._matrix[last]
+                self._squared_norms[row] = self._squared_norms[last]
+                self._ids[row] = self._ids[last]
+                self._row_of[self._ids[row]] = row
+            self._size = last
+
+    def candidate_rows(self, candidates):
+        # Rows of the given missing_child_id's that are in the index (the others are ignored), looked up with one
+        # vectorized gather so that a prefilter keeping most of the children costs no per-candidate Python loop.
+        candidates = np.asarray(candidates, dtype = np.int64).reshape(-1)
+        candidates = candidates[(candidates >= 0) & (candidates < len(self._row_of))]
+        rows = self._row_of[candidates]
+        return rows[rows >= 0]
+
+    def distances(self, encoding, candidates = None):
+        # Returns (missing_child_ids, euclidean distances) for every encoding in the index, or only for those of the
+        # candidates (missing_child_id's kept by an attribute prefilter) whose rows are gathered in a sub-matrix.
+        # ||a - b||^2 = ||a||^2 - 2 a.b + ||b||^2 is evaluated with one matrix-vector product so no (N x 128)
+        # temporary array is created.
+        encoding = np.asarray(encoding, dtype = np.float32)
+        with self._lock:
+            if candidates is None:
+                n = self._size
+                squared = self._squared_norms[:n] - 2 * self._matrix[:n].dot(encoding) + encoding.dot(encoding)
+                ids = self._ids[:n].copy()
+            else:
+                rows = self.candidate_rows(candidates)
+                squared = self._squared_norms[rows] - 2 * self._matrix[rows].dot(encoding) + encoding.dot(encoding)
+                ids = self._ids[rows]
+        np.maximum(squared, 0, out = squared)
+        return ids, np.sqrt(squared)
+
+    def distances_many(self, encodings, candidates = None):
+        # Same as distances() for several query encodings (e.g. every face of a group photo) at once : returns
+        # (missing_child_ids, len(encodings) x len(missing_child_ids) distance matrix) computed with a single
+        # matrix-matrix product instead of one matrix-vector product per query.
+        encodings = np.asarray(encodings, dtype = np.float32).reshape(-1, ENCODING_DIMENSION)
+        query_squared_norms = np.einsum('ij,ij->i', encodings, encodings)
+        with self._lock:
+            if candidates is None:
+                n = self._size
+                squared = self._squared_norms[None, :n] - 2 * encodings.dot(self._matrix[:n].T) + query_squared_norms[:, None]
+                ids = self._ids[:n].copy()
+            else:
+                rows = self.candidate_rows(candidates)
+                squared = self._squared_norms[None, rows] - 2 * encodings.dot(self._matrix[rows].T) + query_squared_norms[:, None]
+                ids = self._ids[rows]
+        np.maximum(squared, 0, out = squared)
+        return ids, np.sqrt(squared)
+
+    def match(self, encoding, tolerance = DEFAULT_TOLERANCE, candidates = None):
+        ids, distances = self.distances(encoding, candidates)
+        return ids[distances <= tolerance].tolist()
+
+    def search(self, encoding, k, tolerance = DEFAULT_TOLERANCE, candidates = None):
+        return top_k(*self.distances(encoding, candidates), k, tolerance)
+
+    def search_many(self, encodings, k, tolerance = DEFAULT_TOLERANCE, candidates = None, max_distances = 16 * 1024 * 1024):
+        # [search() result of every query encoding]. The queries are taken in chunks so that a distance matrix never
+        # holds more than max_distances values (64 MB), whatever the number of stored encodings.
+        encodings = np.asarray(encodings, dtype = np.float32).reshape(-1, ENCODING_DIMENSION)
+        chunk_size = max(1, max_distances // max(len(self), 1))
+        results = []
+        for start in range(0, len(encodings), chunk_size):
+            ids, distances = self.distances_many(encodings[start:start + chunk_size], candidates)
+            results.extend(top_k(ids, query_distances, k, tolerance) for query_distances in distances)
+        return results
+
+_face_index = None
+_face_index_lock = threading.Lock()
+_sighting_index = None
+_sighting_index_lock = threading.Lock()
+
+def encoded_face_rows(missing_child_ids = None, chunk_size = 500):
+    from .models import MissingChildEncodedFace
+    queryset = MissingChildEncodedFace.objects.filter(missing_child__isnull = False).order_by('pk')
+    if missing_child_ids is None:
+        chunks = [queryset]
+    else:
+        missing_child_ids = sorted(missing_child_ids)
+        chunks = [queryset.filter(missing_child_id__in = missing_child_ids[i:i + chunk_size]) for i in range(0, len(missing_child_ids), chunk_size)]
+    for chunk in chunks:
+        for missing_child_id, encoded_face in chunk.values_list('missing_child_id', 'child_encoded_face').iterator():
+            yield missing_child_id, decode_face_encoding(encoded_face)
+
+def sighting_encoded_face_rows(sighted_child_ids = None):
+    # Encodings of the sightings not matched with any missing child yet, keyed by sighted_child_id
+    from .models import SightedChildEncodedFace
+    queryset = SightedChildEncodedFace.objects.filter(sighted_child__match_found = False).order_by('pk')
+    if sighted_child_ids is not None:
+        queryset = queryset.filter(sighted_child_id__in = list(sighted_child_ids))
+    for sighted_child_id, encoded_face in queryset.values_list('sighted_child_id', 'child_encoded_face').iterator():
+        yield sighted_child_id, decode_face_encoding(encoded_face)
+
+def sync_with_database(index):
+    # Brings an index loaded from disk up to date with MissingChildEncodedFace: only the ids are read for every row,
+    # the encodings are fetched just for the rows added since the index file was written.
+    from .models import MissingChildEncodedFace
+    stored_ids = set(index.ids().tolist())
+    database_ids = set(MissingChildEncodedFace.objects.filter(missing_child__isnull = False).values_list('missing_child_id', flat = True))
+    for missing_child_id in stored_ids - database_ids:
+        index.remove(missing_child_id)
+    for missing_child_id, encoding in encoded_face_rows(database_ids - stored_ids):
+        index.add(missing_child_id, encoding)
+
+def build_face_index():
+    backend = getattr(settings, 'FACE_INDEX_BACKEND', 'brute_force')
+    if backend == 'ivf':
+        from .ivf_index import IVFFaceIndex
+        path = getattr(settings, 'FACE_INDEX_PATH', None)
+        if path and os.path.exists(path):
+            index = IVFFaceIndex.load_file(path, nprobe = getattr(settings, 'FACE_INDEX_NPROBE', None))
+            sync_with_database(index)
+            return index
+        logger.warning("Face index file %s not found, falling back to brute-force face search. Run 'manage.py rebuild_face_index' to create it.", path)
+    elif backend != 'brute_force':
+        raise ImproperlyConfigured(f"Unknown FACE_INDEX_BACKEND {backend!r}, expected 'brute_force' or 'ivf'.")
+    else:
+        snapshot_directory = getattr(settings, 'FACE_INDEX_SNAPSHOT_DIR', None)
+        if snapshot_directory:
+            from .face_snapshot import load_snapshot_index
+            index = load_snapshot_index(snapshot_directory)
+            if index is not None:
+                return index
+            logger.warning("No face index snapshot found in %s, loading every encoding from the database. Run 'manage.py snapshot_face_index' to create it.", snapshot_directory)
+    index = FaceEncodingIndex()
+    index.load(encoded_face_rows())
+    return index
+
+def loaded_face_index():
+    # Returns the process-wide index only if it has already been built, else None.
+    return _face_index
+
+def get_face_index():
+    # The process-wide index is built on first use and then kept in sync by the post_save / post_delete signals of
+    # MissingChildEncodedFace (see signals.py) with the changes of this process, and by the FaceIndexChange feed with
+    # those of the other processes & nodes (see face_index_changes.py).
+    from .face_index_changes import follow_face_index_changes, latest_change_sequence, poll_stale_face_index_changes
+    global _face_index
+    if _face_index is None:
+        with _face_index_lock:
+            if _face_index is None:
+                sequence = latest_change_sequence()
+                index = build_face_index()
+                snapshot_sequence = getattr(index, 'change_sequence', None)
+                follow_face_index_changes(index, sequence if snapshot_sequence is None else snapshot_sequence)
+                _face_index = index
+    else:
+        poll_stale_face_index_changes()
+    return _face_index
+
+def reset_face_index():
+    # Drops the process-wide index, it is rebuilt from the database on its next use
+    from .face_index_changes import stop_following_face_index_changes
+    global _face_index
+    with _face_index_lock:
+        _face_index = None
+        stop_following_face_index_changes()
+
+def load_face_index_on_first_request():
+    # Called by wsgi.py / asgi.py : the index is loaded when the worker serves its first request rather than when the
+    # application is imported, which must not query the database (its tables may not be migrated yet, and a connection
+    # opened before the server forks its workers would be shared by all of them). A failure is logged and the searches
+    # load the index themselves.
+    def load_face_index(sender, **kwargs):
+        request_started.disconnect(dispatch_uid = 'load_face_index')
+        try:
+            get_face_index()
+        except DatabaseError:
+            logger.exception("Loading the face index failed, it is loaded by the first search instead.")
+    request_started.connect(load_face_index, weak = False, dispatch_uid = 'load_face_index')
+
+def loaded_sighting_index():
+    return _sighting_index
+
+def get_sighting_index():
+    # Same as get_face_index() for the encodings of the unmatched sightings, searched when a new missing child is
+    # reported (see reverse_matching.py). The change feed followed by the face index keeps it in sync as well.
+    global _sighting_index
+    get_face_index()
+    if _sighting_index is None:
+        with _sighting_index_lock:
+            if _sighting_index is None:
+                index = FaceEncodingIndex()
+                index.load(sighting_encoded_face_rows())
+                _sighting_index = index
+    return _sighting_index
@@ -0,0 +1,192 @@
+from datetime import timedelta
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Max
+from django.utils import timezone
+from .face_index import encoded_face_rows, sighting_encoded_face_rows, loaded_sighting_index
+from .face_filters import refresh_missing_child_attributes
+from .metrics import count_event, FACE_INDEX_CHANGE_LAG, FACE_INDEX_CHANGE_SEQUENCE, FACE_INDEX_LAST_POLL
+from .models import FaceIndexChange
+import logging, threading, time
+
+logger = logging.getLogger(__name__)
+
+# Keeps the in-process face index of every web worker (with the prefilter attributes of face_filters.py) and its
+# sighting index (unmatched sightings searched by reverse_matching.py) in sync with the missing children & sightings
+# saved and deleted by the other workers and nodes sharing the database. Every change of MissingChildEncodedFace,
+# MissingChild, SightedChildEncodedFace or of the match_found flag of a SightedChild appends a FaceIndexChange row in
+# the transaction of the change (post_save / post_delete signals, record_face_index_changes and
+# record_sighting_index_changes for the bulk writes). Every worker remembers the last FaceIndexChange id it applied and
+# polls the newer ones every FACE_INDEX_CHANGE_POLL_INTERVAL seconds (one range query on the primary key), then reads
+# the current encodings & attributes of the changed missing children and sightings only : the indexes end up in the
+# database state whatever the order of the changes.
+# A request finding the last successful poll older than FACE_INDEX_MAX_STALENESS seconds (poll thread not started,
+# e.g. in a worker forked from a preloaded application, or failing) polls itself before searching.
+#
+# An id is allocated at insert time but only visible at commit : a change committed after a newer one is missing from
+# the ids seen by a poll. Such gaps are queried again until they show up or are older than FACE_INDEX_CHANGE_GAP_TIMEOUT
+# seconds (a rolled back transaction leaves a gap for ever).
+
+MAX_TRACKED_GAPS = 10000 # larger jumps of the ids are not waited for (e.g. ids reserved by MySQL for a bulk insert)
+
+def record_face_index_changes(missing_child_ids, action = 'S'):
+    # For the bulk writes of MissingChildEncodedFace, which don't send the post_save / post_delete signals
+    FaceIndexChange.objects.bulk_create([FaceIndexChange(missing_child_id = missing_child_id, action = action) for missing_child_id in missing_child_ids], batch_size = 1000)
+
+def record_sighting_index_changes(sighted_child_ids, action = 'S'):
+    # Same for the sightings : encoding saved or deleted, or matched (then removed from the sighting indexes)
+    FaceIndexChange.objects.bulk_create([FaceIndexChange(sighted_child_id = sighted_child_id, action = action) for sighted_child_id in sighted_child_ids], batch_size = 1000)
+
+def latest_change_sequence():
+    return FaceIndexChange.objects.aggregate(sequence = Max('pk'))['sequence'] or 0
+
+CHANGE_COLUMNS = ('pk', 'missing_child_id', 'sighted_child_id', 'changed_at')
+
+def changes_after(sequence):
+    # (id, missing_child_id, sighted_child_id, changed_at) of the changes after sequence, oldest first
+    return FaceIndexChange.objects.filter(pk__gt = sequence).order_by('pk').values_list(*CHANGE_COLUMNS)
+
+def changes_among(change_ids):
+    # Same for the changes of change_ids visible by now (the gaps). Queried apart from changes_after : OR-ing the two
+    # conditions makes some databases (SQLite) scan the whole table in primary key order.
+    return FaceIndexChange.objects.filter(pk__in = list(change_ids)).values_list(*CHANGE_COLUMNS)
+
+def prune_face_index_changes(up_to_sequence, retention_days = None):
+    # Deletes the changes up to up_to_sequence (e.g. included in the current snapshot) older than the retention
+    if retention_days is None:
+        retention_days = getattr(settings, 'FACE_INDEX_CHANGE_RETENTION_DAYS', 7)
+    deleted, _ = FaceIndexChange.objects.filter(pk__lte = up_to_sequence, changed_at__lt = timezone.now() - timedelta(days = retention_days)).delete()
+    return deleted
+
+class FaceIndexChangeFeed:
+    def __init__(self, index, sequence):
+        self.index = index
+        self.sequence = sequence # last FaceIndexChange id applied to the index
+        self.last_poll = time.monotonic()
+        self._gaps = {} # FaceIndexChange id not visible yet ---> time.monotonic() when it was found missing
+        self._lock = threading.Lock()
+        FACE_INDEX_CHANGE_SEQUENCE.set(sequence)
+
+    def poll(self, batch_size = 1000):
+        # Applies the changes after self.sequence (and those of the gaps) to the index. Returns the number of changes.
+        with self._lock:
+            return self._poll(batch_size)
+
+    def poll_if_stale(self, max_staleness):
+        if time.monotonic() - self.last_poll <= max_staleness:
+            return
+        if not self._lock.acquire(blocking = False): # another thread is polling
+            return
+        try:
+            self._poll()
+        except Exception: # the request is served with the index as it is
+            logger.exception("Polling the face index changes failed.")
+            count_event('face_index_change_poll_failed')
+        finally:
+            self._lock.release()
+
+    def _poll(self, batch_size = 1000):
+        applied = 0
+        gaps = sorted(self._gaps)
+        for i in range(0, len(gaps), batch_size):
+            changes = list(changes_among(gaps[i:i + batch_size]))
+            self._apply(changes)
+            applied += len(changes)
+        while True:
+            changes = list(changes_after(self.sequence)[:batch_size])
+            self._apply(changes)
+            applied += len(changes)
+            if len(changes) < batch_size:
+                break
+        now = time.monotonic()
+        gap_timeout = getattr(settings, 'FACE_INDEX_CHANGE_GAP_TIMEOUT', 60)
+        for pk, found_missing in list(self._gaps.items()):
+            if now - found_missing > gap_timeout:
+                del self._gaps[pk]
+        self.last_poll = now
+        FACE_INDEX_LAST_POLL.set(time.time())
+        return applied
+
+    def _apply(self, changes):
+        if not changes:
+            return
+        now = time.monotonic()
+        expected = self.sequence + 1
+        for pk, _, _, _ in changes:
+            if pk < expected:
+                self._gaps.pop(pk, None)
+                continue
+            if pk - expected + len(self._gaps) <= MAX_TRACKED_GAPS:
+                self._gaps.update((gap, now) for gap in range(expected, pk))
+            expected = pk + 1
+        missing_child_ids = {missing_child_id for _, missing_child_id, _, _ in changes if missing_child_id is not None}
+        if missing_child_ids:
+            encodings = dict(encoded_face_rows(missing_child_ids))
+            for missing_child_id in missing_child_ids:
+                if missing_child_id in encodings:
+                    self.index.add(missing_child_id, encodings[missing_child_id])
+                else:
+                    self.index.remove(missing_child_id)
+            refresh_missing_child_attributes(missing_child_ids) # prefilter attributes, when loaded by this process
+        sighted_child_ids = {sighted_child_id for _, _, sighted_child_id, _ in changes if sighted_child_id is not None}
+        sighting_index = loaded_sighting_index()
+        if sighted_child_ids and sighting_index is not None: # else built from the database on its first use
+            encodings = dict(sighting_encoded_face_rows(sighted_child_ids))
+            for sighted_child_id in sighted_child_ids:
+                if sighted_child_id in encodings:
+                    sighting_index.add(sighted_child_id, encodings[sighted_child_id])
+                else:
+                    sighting_index.remove(sighted_child_id)
+        applied_at = timezone.now() # lag includes the clock difference between the nodes
+        for _, _, _, changed_at in changes:
+            FACE_INDEX_CHANGE_LAG.observe(max((applied_at - changed_at).total_seconds(), 0))
+        self.sequence = max(self.sequence, expected - 1)
+        FACE_INDEX_CHANGE_SEQUENCE.set(self.sequence)
+
+_feed = None
+_poller = None
+_poller_lock = threading.Lock()
+
+def follow_face_index_changes(index, sequence):
+    # Called by get_face_index() with the index it has just built and the last change already in it : the changes made
+    # since (while it was built, or after its snapshot was written) are applied at once.
+    global _feed
+    feed = FaceIndexChangeFeed(index, sequence)
+    feed.poll()
+    _feed = feed
+    return feed
+
+def stop_following_face_index_changes():
+    global _feed
+    _feed = None
+
+def poll_stale_face_index_changes():
+    feed = _feed
+    max_staleness = getattr(settings, 'FACE_INDEX_MAX_STALENESS', 10)
+    if feed is not None and max_staleness is not None:
+        feed.poll_if_stale(max_staleness)
+
+def start_polling_face_index_changes(interval = None):
+    # Starts the thread polling the changes of this process (once); interval = 0 / None in the settings disables it.
+    global _poller
+    interval = interval or getattr(settings, 'FACE_INDEX_CHANGE_POLL_INTERVAL', 2)
+    if not interval:
+        return None
+    with _poller_lock:
+        if _poller is None:
+            _poller = threading.Thread(target = poll_face_index_changes_forever, args = (interval,), name = 'face-index-changes', daemon = True)
+            _poller.start()
+    return _poller
+
+def poll_face_index_changes_forever(interval):
+    while True:
+        time.sleep(interval)
+        feed = _feed
+        if feed is None:
+            continue
+        close_old_connections() # reconnects after a database restart and honours CONN_MAX_AGE
+        try:
+            feed.poll()
+        except Exception:
+            logger.exception("Polling the face index changes failed.")
+            count_event('face_index_change_poll_failed')
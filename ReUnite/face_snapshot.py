@@ -0,0 +1,185 @@
+from django.utils import timezone
+from .face_codec import decode_face_encoding
+from .face_index import FaceEncodingIndex, ENCODING_DIMENSION
+import json, os, shutil, tempfile, threading
+import numpy as np
+
+# Snapshot of the stored face encodings that the web workers memory-map instead of each one reading the whole
+# MissingChildEncodedFace table and keeping a private copy of it. A snapshot is a directory holding
+#   ids.npy           : missing_child_id's, sorted (a row is found by binary search, no per-row dict is kept)
+#   encodings.npy     : (N x 128) float32 matrix aligned with ids.npy
+#   squared_norms.npy : squared norm of every row, used by the distance computation
+#   meta.json         : watermark = highest MissingChildEncodedFace id included, change_sequence = last FaceIndexChange
+#                       id before it was written, number of rows, creation time
+# written by 'manage.py snapshot_face_index' into a new directory of FACE_INDEX_SNAPSHOT_DIR whose name is then put in
+# the CURRENT file (atomically replaced), so that a starting worker never maps a half written snapshot. The .npy files
+# are mapped read-only : their pages live in the page cache once, shared by all the workers of the host.
+
+CURRENT_FILE = 'CURRENT'
+KEPT_SNAPSHOTS = 2 # the previous snapshot is kept for the workers still mapping it
+
+class SnapshotFaceIndex:
+    # Same interface as FaceEncodingIndex : a read-only memory-mapped snapshot, the ids of the snapshot rows removed or
+    # replaced since it was written (a private mask) and a private FaceEncodingIndex holding the encodings added or
+    # replaced since then.
+
+    def __init__(self, ids, matrix, squared_norms, watermark, change_sequence = None):
+        self._base_ids = ids
+        self._base_matrix = matrix
+        self._base_squared_norms = squared_norms
+        self._base_removed = np.zeros(len(ids), dtype = bool)
+        self._removed_count = 0
+        self._overlay = FaceEncodingIndex(capacity = 64)
+        self._lock = threading.RLock()
+        self.watermark = watermark
+        self.change_sequence = change_sequence # the changes after it are replayed by get_face_index()
+
+    @classmethod
+    def open(cls, path):
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        return cls(np.load(os.path.join(path, 'ids.npy'), mmap_mode = 'r'),
+                   np.load(os.path.join(path, 'encodings.npy'), mmap_mode = 'r'),
+                   np.load(os.path.join(path, 'squared_norms.npy'), mmap_mode = 'r'), meta['watermark'], meta.get('change_sequence'))
+
+    def __len__(self):
+        return len(self._base_ids) - self._removed_count + len(self._overlay)
+
+    def _base_rows(self, missing_child_ids):
+        # rows of the snapshot holding (and not removed for) the given missing_child_id's
+        missing_child_ids = np.asarray(missing_child_ids, dtype = np.int64).reshape(-1)
+        rows = np.searchsorted(self._base_ids, missing_child_ids)
+        found = rows < len(self._base_ids)
+        found[found] = self._base_ids[rows[found]] == missing_child_ids[found]
+        rows = rows[found]
+        return rows[~self._base_removed[rows]]
+
+    def _remove_from_base(self, missing_child_id):
+        rows = self._base_rows([missing_child_id])
+        self._base_removed[rows] = True
+        self._removed_count += len(rows)
+
+    def add(self, missing_child_id, encoding):
+        with self._lock:
+            self._remove_from_base(missing_child_id)
+            self._overlay.add(missing_child_id, encoding)
+
+    def remove(self, missing_child_id):
+        with self._lock:
+            self._remove_from_base(missing_child_id)
+            self._overlay.remove(missing_child_id)
+
+    def ids(self):
+        with self._lock:
+            return np.concatenate([self._base_ids[~self._base_removed], self._overlay.ids()])
+
+    def distances_many(self, encodings, candidates = None):
+        encodings = np.asarray(encodings, dtype = np.float32).reshape(-1, ENCODING_DIMENSION)
+        query_squared_norms = np.einsum('ij,ij->i', encodings, encodings)
+        with self._lock:
+            if candidates is None: # the whole mapped matrix, never a gathered copy of it
+                squared = self._base_squared_norms[None, :] - 2 * encodings.dot(self._base_matrix.T) + query_squared_norms[:, None]
+                ids = np.asarray(self._base_ids) # a view, not a copy
+                if self._removed_count: # out of any tolerance, their current encodings (if any) are in the overlay
+                    squared[:, self._base_removed] = np.inf
+            else:
+                rows = self._base_rows(candidates)
+                squared = self._base_squared_norms[None, rows] - 2 * encodings.dot(self._base_matrix[rows].T) + query_squared_norms[:, None]
+                ids = self._base_ids[rows]
+            overlay_ids, overlay_distances = self._overlay.distances_many(encodings, candidates) if len(self._overlay) else (None, None)
+        np.maximum(squared, 0, out = squared)
+        if overlay_ids is None:
+            return ids, np.sqrt(squared)
+        return np.concatenate([ids, overlay_ids]), np.concatenate([np.sqrt(squared), overlay_distances], axis = 1)
+
+    def distances(self, encoding, candidates = None):
+        ids, distances = self.distances_many(encoding, candidates)
+        return ids, distances[0]
+
+    # computed from distances() / distances_many() exactly as FaceEncodingIndex does
+    match = FaceEncodingIndex.match
+    search = FaceEncodingIndex.search
+    search_many = FaceEncodingIndex.search_many
+
+def current_snapshot_path(directory):
+    try:
+        with open(os.path.join(directory, CURRENT_FILE)) as f:
+            name = f.read().strip()
+    except FileNotFoundError:
+        return None
+    return os.path.join(directory, name) if name else None
+
+def write_snapshot(directory, chunk_size = 2000):
+    # Writes a snapshot of MissingChildEncodedFace (sorted by missing_child_id, streamed in chunks so that the encodings
+    # are never all held in memory) and makes it the current one. Returns (path, number of rows, watermark).
+    from .models import MissingChildEncodedFace
+    from .face_index_changes import latest_change_sequence
+    change_sequence = latest_change_sequence() # read first : the changes made while the rows are read are replayed
+    os.makedirs(directory, exist_ok = True)
+    path = tempfile.mkdtemp(prefix = 'snapshot-', dir = directory)
+    raw_ids_path = os.path.join(path, 'ids.raw')
+    raw_encodings_path = os.path.join(path, 'encodings.raw')
+    count = 0
+    watermark = 0
+    queryset = MissingChildEncodedFace.objects.filter(missing_child__isnull = False).order_by('missing_child_id')
+    with open(raw_ids_path, 'wb') as ids_file, open(raw_encodings_path, 'wb') as encodings_file:
+        last_missing_child_id = 0
+        while True: # keyset pagination on missing_child_id (unique), served by its index
+            chunk = list(queryset.filter(missing_child_id__gt = last_missing_child_id).values_list('pk', 'missing_child_id', 'child_encoded_face')[:chunk_size])
+            if not chunk:
+                break
+            last_missing_child_id = chunk[-1][1]
+            ids_file.write(np.array([missing_child_id for _, missing_child_id, _ in chunk], dtype = np.int64).tobytes())
+            encodings_file.write(np.array([decode_face_encoding(encoded_face) for _, _, encoded_face in chunk], dtype = np.float32).tobytes())
+            watermark = max(watermark, max(pk for pk, _, _ in chunk))
+            count += len(chunk)
+    ids = np.lib.format.open_memmap(os.path.join(path, 'ids.npy'), mode = 'w+', dtype = np.int64, shape = (count,))
+    encodings = np.lib.format.open_memmap(os.path.join(path, 'encodings.npy'), mode = 'w+', dtype = np.float32, shape = (count, ENCODING_DIMENSION))
+    squared_norms = np.lib.format.open_memmap(os.path.join(path, 'squared_norms.npy'), mode = 'w+', dtype = np.float32, shape = (count,))
+    if count:
+        ids[:] = np.fromfile(raw_ids_path, dtype = np.int64)
+        raw_encodings = np.memmap(raw_encodings_path, dtype = np.float32, mode = 'r', shape = (count, ENCODING_DIMENSION))
+        for start in range(0, count, 65536):
+            encodings[start:start + 65536] = raw_encodings[start:start + 65536]
+            squared_norms[start:start + 65536] = np.einsum('ij,ij->i', encodings[start:start + 65536], encodings[start:start + 65536])
+        del raw_encodings
+    for array in (ids, encodings, squared_norms):
+        array.flush()
+    del ids, encodings, squared_norms
+    os.remove(raw_ids_path)
+    os.remove(raw_encodings_path)
+    with open(os.path.join(path, 'meta.json'), 'w') as f:
+        json.dump({'watermark': watermark, 'change_sequence': change_sequence, 'count': count, 'created': timezone.now().isoformat()}, f)
+    os.chmod(path, 0o755)
+    current_path = os.path.join(directory, f'{CURRENT_FILE}.tmp')
+    with open(current_path, 'w') as f:
+        f.write(os.path.basename(path))
+    os.replace(current_path, os.path.join(directory, CURRENT_FILE)) # atomic
+    snapshots = sorted((entry for entry in os.scandir(directory) if entry.is_dir() and entry.name.startswith('snapshot-')), key = lambda entry: entry.stat().st_mtime)
+    for entry in snapshots[:-KEPT_SNAPSHOTS]:
+        if entry.path != path:
+            shutil.rmtree(entry.path, ignore_errors = True)
+    return path, count, watermark
+
+def apply_database_delta(index):
+    # Brings a snapshot index up to date : the encodings saved after its watermark are added and the missing children
+    # deleted since it was written are removed. Only the ids of the other rows are read. An encoding replaced in place
+    # (reencode_faces, convert_face_encodings) keeps its id : it is updated from the FaceIndexChange feed instead.
+    from .models import MissingChildEncodedFace
+    queryset = MissingChildEncodedFace.objects.filter(missing_child__isnull = False)
+    watermark = index.watermark
+    for pk, missing_child_id, encoded_face in queryset.filter(pk__gt = watermark).values_list('pk', 'missing_child_id', 'child_encoded_face').iterator():
+        index.add(missing_child_id, decode_face_encoding(encoded_face))
+        watermark = max(watermark, pk)
+    index.watermark = watermark
+    database_ids = np.fromiter(queryset.values_list('missing_child_id', flat = True).iterator(), dtype = np.int64)
+    for missing_child_id in np.setdiff1d(index.ids(), database_ids).tolist():
+        index.remove(missing_child_id)
+    return index
+
+def load_snapshot_index(directory):
+    # The current snapshot of directory brought up to date with the database, or None when there is no snapshot yet
+    path = current_snapshot_path(directory)
+    if path is None or not os.path.exists(os.path.join(path, 'meta.json')):
+        return None
+    return apply_database_delta(SnapshotFaceIndex.open(path))
@@ -5,6 +5,7 @@ from .models import Profile, MissingChild, SightedChild
 from phonenumber_field.widgets import PhoneNumberPrefixWidget
 from django.core.validators import FileExtensionValidator
 from django.core.exceptions import ValidationError
+from PIL import Image
 
 class DateInput(forms.DateInput):
     input_type = 'date'
@@ -12,6 +13,20 @@ class DateInput(forms.DateInput):
 class TimeInput(forms.TimeInput):
     input_type = 'time'
 
+class HeaderCheckedImageField(forms.ImageField):
+    # Relies on the image format & dimensions read from the header by ImageUploadHandler while the upload was streamed
+    # (see upload_handlers.py) instead of opening and verifying the whole image once more.
+    def to_python(self, data):
+        rejection = getattr(data, 'upload_rejection', None)
+        if rejection:
+            raise ValidationError(rejection, code = 'invalid_image')
+        if getattr(data, 'image_format', None) is None: # not uploaded through ImageUploadHandler
+            return super().to_python(data)
+        f = forms.FileField.to_python(self, data)
+        if f is not None:
+            f.content_type = Image.MIME.get(data.image_format)
+        return f
+
 class UserRegisterForm(UserCreationForm):
     first_name = forms.CharField(max_length = 30)
     last_name = forms.CharField(max_length = 30)
@@ -58,6 +73,7 @@ class ProfileUpdateForm(forms.ModelForm):
     class Meta:
         model = Profile
         fields = ['user_mobile_no', 'image']
+        field_classes = {'image': HeaderCheckedImageField}
         widgets = {'user_mobile_no' : PhoneNumberPrefixWidget(attrs = {'onkeypress': 'if(this.value.length === 10) event.preventDefault()'})}
 
 class MissingChildPersonalDetailsForm(forms.ModelForm):
@@ -69,6 +85,7 @@ class MissingChildPersonalDetailsForm(forms.ModelForm):
                    'child_aadhar_no': forms.NumberInput(attrs = {'onkeypress': 'if(this.value.length === 12) event.preventDefault()'}),
                    'age': forms.NumberInput(attrs = {'onkeypress': 'if(this.value.length === 2) event.preventDefault()'})
                   }
+        field_classes = {'child_image': HeaderCheckedImageField}
 
 class MissingChildParentDetailsForm(forms.ModelForm):
     class Meta:
@@ -117,13 +134,23 @@ def validate_image_size(image):
 
 class SearchChildForm(forms.Form):
     full_name_to_search = forms.CharField(max_length = 60, required = False, help_text = "Fullname should be in the format :- First Name Last Name")
-    child_image_to_search = forms.ImageField(required = False, help_text = "Image must contains front face. It should be in .jpg or .png format having size range [ 1 MB - 5 MB ].", validators = [FileExtensionValidator(allowed_extensions = ['jpg', 'png']), validate_image_size])
+    child_image_to_search = HeaderCheckedImageField(required = False, help_text = "Image must contains front face. It should be in .jpg or .png format having size range [ 1 MB - 5 MB ].", validators = [FileExtensionValidator(allowed_extensions = ['jpg', 'png']), validate_image_size])
+    # optional filters narrowing the search by image to the matching missing children
+    gender = forms.ChoiceField(choices = (('', '---------'),) + MissingChild.GENDER, required = False)
+    age = forms.IntegerField(required = False, min_value = 1, max_value = 12, help_text = "Approximate age of the child [ in year(s) ].")
+    state = forms.CharField(max_length = 30, required = False)
+    district = forms.CharField(max_length = 60, required = False)
+    missing_from_date = forms.DateField(label = 'Missing on or before', required = False, widget = DateInput,
+                                        help_text = "Date should be in YYYY-MM-DD format , if datepicker widget will not work. If the datepicker widget works, format would be DD-MMM-YYYY automatically.")
 
 class SightedChildForm(forms.ModelForm):
     sighted_date = forms.DateField(help_text = "Date should be in YYYY-MM-DD format , if datepicker widget will not work. If the datepicker widget works, format would be DD-MMM-YYYY automatically.",
                                    widget = DateInput)
     sighted_time = forms.TimeField(help_text = "Time should be in HH:MM:SS format , if timepicker widget will not work. If the timepicker widget works, format would be HH:MM AM/PM ( 12-hour clock [ 12:00 AM - 11:59 PM ] ) automatically.",
                                    widget = TimeInput)
+    group_photo = forms.BooleanField(required = False, label = "Group photo / CCTV still",
+                                     help_text = "Tick if the image shows several children : every face in it is searched. Full name & age are then ignored.")
     class Meta:
         model = SightedChild
         fields = ['sighted_child_full_name', 'sighted_child_age', 'sighted_date', 'sighted_time', 'sighted_location', 'sighted_child_image']
+        field_classes = {'sighted_child_image': HeaderCheckedImageField}
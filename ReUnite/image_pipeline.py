@@ -0,0 +1,59 @@
+from django.core.files.base import ContentFile
+from PIL import Image
+import io
+import numpy as np
+
+MAX_IMAGE_SIZE = 1600 # child images are stored (and faces are detected) at most MAX_IMAGE_SIZE x MAX_IMAGE_SIZE
+
+def downscale(img, max_size, resample = Image.LANCZOS):
+    # Downscales an opened (not yet decoded) image to fit in max_size x max_size and returns True if it had to be.
+    # For a JPEG, draft mode first makes the decoder produce a 1/2, 1/4 or 1/8 scale version directly from the DCT
+    # coefficients, which is much cheaper than decoding the full resolution image and resizing it.
+    width, height = img.size
+    if max(width, height) <= max_size:
+        return False
+    scale = max_size / max(width, height)
+    if img.format == 'JPEG':
+        img.draft('RGB', (int(width * scale), int(height * scale)))
+    img.thumbnail((max_size, max_size), resample)
+    return True
+
+def image_content(img, image_format, **save_options):
+    buffer = io.BytesIO()
+    img.save(buffer, format = image_format, **save_options)
+    return buffer.getvalue()
+
+def prepare_image(image_bytes, max_size = MAX_IMAGE_SIZE):
+    # Decodes an uploaded image once and returns (RGB array used for the face detection & encoding, content to store
+    # instead of the upload or None when the upload already fits in max_size x max_size).
+    img = Image.open(io.BytesIO(image_bytes))
+    image_format = img.format
+    downscaled_image = None
+    if downscale(img, max_size):
+        downscaled_image = image_content(img, image_format)
+    return np.asarray(img.convert('RGB')), downscaled_image
+
+def replace_upload_content(uploaded_file, content):
+    # Overwrites an uploaded file (in memory or temporary file) with the downscaled image before it is saved to the
+    # media storage, so that the model's save() has nothing left to resize.
+    f = uploaded_file.file
+    f.seek(0)
+    f.truncate()
+    f.write(content)
+    f.flush()
+    f.seek(0)
+    uploaded_file.size = len(content)
+
+def fit_image_field(field_file, max_size, resample = Image.LANCZOS):
+    # Called from the models' save() : an image that hasn't been written to the media storage yet is downscaled to
+    # fit in max_size x max_size before being written. Only the image header is read when it already fits, and an
+    # already stored image is never read or rewritten.
+    if not field_file or field_file._committed:
+        return
+    field_file.seek(0)
+    img = Image.open(field_file)
+    image_format = img.format
+    if downscale(img, max_size, resample):
+        field_file.save(field_file.name, ContentFile(image_content(img, image_format)), save = False)
+    else:
+        field_file.seek(0)
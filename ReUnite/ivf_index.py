@@ -0,0 +1,197 @@
+from collections import defaultdict
+import os, threading
+import numpy as np
+from .face_index import FaceEncodingIndex, DEFAULT_TOLERANCE, ENCODING_DIMENSION, top_k
+
+DEFAULT_NPROBE = 8
+
+def squared_distances(points, centroids, centroid_squared_norms):
+    # (len(points) x len(centroids)) matrix of squared euclidean distances computed with one matrix product
+    squared = np.einsum('ij,ij->i', points, points)[:, None] - 2 * points.dot(centroids.T) + centroid_squared_norms[None, :]
+    np.maximum(squared, 0, out = squared)
+    return squared
+
+def kmeans(points, k, iterations = 10, seed = 0):
+    # Plain Lloyd's algorithm; empty clusters are re-seeded with random points.
+    rng = np.random.default_rng(seed)
+    centroids = points[rng.choice(len(points), size = k, replace = False)].copy()
+    for _ in range(iterations):
+        assignments = squared_distances(points, centroids, np.einsum('ij,ij->i', centroids, centroids)).argmin(axis = 1)
+        counts = np.bincount(assignments, minlength = k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, points)
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        centroids[empty] = points[rng.choice(len(points), size = int(empty.sum()), replace = False)]
+    return centroids
+
+class IVFFaceIndex:
+    # Inverted-file index: the encodings are partitioned by k-means into len(centroids) lists, each one being a
+    # FaceEncodingIndex of its own, and a search only scans the nprobe lists whose centroids are nearest to the query.
+    # nprobe is the recall / latency knob : nprobe = len(centroids) is an exact (brute-force) search.
+
+    def __init__(self, centroids, nprobe = None):
+        self.centroids = np.ascontiguousarray(centroids, dtype = np.float32)
+        self._centroid_squared_norms = np.einsum('ij,ij->i', self.centroids, self.centroids)
+        self.nprobe = nprobe or DEFAULT_NPROBE
+        self._lists = [FaceEncodingIndex(capacity = 64) for _ in range(len(self.centroids))]
+        self._list_of = np.full(1024, -1, dtype = np.int64) # missing_child_id ---> inverted list holding its encoding (-1 : none)
+        self._size = 0
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return self._size
+
+    def _nearest_lists(self, encoding, n):
+        squared = squared_distances(encoding[None, :], self.centroids, self._centroid_squared_norms)[0]
+        if n >= len(squared):
+            return np.arange(len(squared))
+        return np.argpartition(squared, n - 1)[:n]
+
+    def load(self, rows):
+        ids = []
+        encodings = []
+        for missing_child_id, encoding in rows:
+            ids.append(missing_child_id)
+            encodings.append(encoding)
+        self.load_arrays(np.array(ids, dtype = np.int64), np.array(encodings, dtype = np.float32).reshape(-1, ENCODING_DIMENSION))
+
+    def load_arrays(self, ids, encodings, chunk_size = 65536):
+        assignments = np.empty(len(ids), dtype = np.int64)
+        for start in range(0, len(ids), chunk_size):
+            chunk = encodings[start:start + chunk_size]
+            assignments[start:start + chunk_size] = squared_distances(chunk, self.centroids, self._centroid_squared_norms).argmin(axis = 1)
+        lists = [FaceEncodingIndex(capacity = 64) for _ in range(len(self.centroids))]
+        order = np.argsort(assignments, kind = 'stable')
+        boundaries = np.searchsorted(assignments[order], np.arange(len(self.centroids) + 1))
+        for i, inverted_list in enumerate(lists):
+            rows = order[boundaries[i]:boundaries[i + 1]]
+            inverted_list.load_arrays(ids[rows], encodings[rows])
+        with self._lock:
+            self._lists = lists
+            self._list_of = np.full(max(int(ids.max()) + 1 if len(ids) else 0, 1024), -1, dtype = np.int64)
+            self._list_of[ids] = assignments
+            self._size = int((self._list_of >= 0).sum())
+
+    def ids(self):
+        with self._lock:
+            return np.flatnonzero(self._list_of >= 0)
+
+    def _candidates_of_lists(self, candidates):
+        # [(list number, missing_child_id's of the candidates held by that list)], grouped with one sort instead of a
+        # per-candidate Python loop
+        candidates = np.asarray(candidates, dtype = np.int64).reshape(-1)
+        candidates = candidates[(candidates >= 0) & (candidates < len(self._list_of))]
+        list_numbers = self._list_of[candidates]
+        candidates, list_numbers = candidates[list_numbers >= 0], list_numbers[list_numbers >= 0]
+        if not len(candidates):
+            return []
+        order = np.argsort(list_numbers, kind = 'stable')
+        candidates, list_numbers = candidates[order], list_numbers[order]
+        starts = np.flatnonzero(np.r_[True, list_numbers[1:] != list_numbers[:-1]])
+        return list(zip(list_numbers[starts].tolist(), np.split(candidates, starts[1:])))
+
+    def add(self, missing_child_id, encoding):
+        encoding = np.asarray(encoding, dtype = np.float32)
+        missing_child_id = int(missing_child_id)
+        with self._lock:
+            new_list = int(self._nearest_lists(encoding, 1)[0])
+            if missing_child_id >= len(self._list_of):
+                list_of = np.full(max(missing_child_id + 1, 2 * len(self._list_of)), -1, dtype = np.int64)
+                list_of[:len(self._list_of)] = self._list_of
+                self._list_of = list_of
+            old_list = int(self._list_of[missing_child_id])
+            if old_list < 0:
+                self._size += 1
+            elif old_list != new_list:
+                self._lists[old_list].remove(missing_child_id)
+            self._lists[new_list].add(missing_child_id, encoding)
+            self._list_of[missing_child_id] = new_list
+
+    def remove(self, missing_child_id):
+        with self._lock:
+            missing_child_id = int(missing_child_id)
+            if missing_child_id >= len(self._list_of) or self._list_of[missing_child_id] < 0:
+                return
+            self._lists[int(self._list_of[missing_child_id])].remove(missing_child_id)
+            self._list_of[missing_child_id] = -1
+            self._size -= 1
+
+    def distances(self, encoding, nprobe = None, candidates = None):
+        # Returns (missing_child_ids, euclidean distances) for the encodings of the probed lists only. With candidates
+        # (missing_child_id's kept by an attribute prefilter) no list is probed : the candidates are grouped by the list
+        # holding them and each list only computes the distances of its own sub-matrix, so the search is exact.
+        encoding = np.asarray(encoding, dtype = np.float32)
+        with self._lock:
+            if candidates is None:
+                results = [self._lists[i].distances(encoding) for i in self._nearest_lists(encoding, nprobe or self.nprobe)]
+            else:
+                results = [self._lists[i].distances(encoding, list_candidates) for i, list_candidates in self._candidates_of_lists(candidates)]
+        if not results:
+            return np.empty(0, dtype = np.int64), np.empty(0, dtype = np.float32)
+        return np.concatenate([ids for ids, _ in results]), np.concatenate([distances for _, distances in results])
+
+    def match(self, encoding, tolerance = DEFAULT_TOLERANCE, candidates = None):
+        ids, distances = self.distances(encoding, candidates = candidates)
+        return ids[distances <= tolerance].tolist()
+
+    def search(self, encoding, k, tolerance = DEFAULT_TOLERANCE, candidates = None):
+        return top_k(*self.distances(encoding, candidates = candidates), k, tolerance)
+
+    def search_many(self, encodings, k, tolerance = DEFAULT_TOLERANCE, candidates = None, nprobe = None):
+        # [search() result of every query encoding]. The nearest lists of all the queries are found with one matrix
+        # product against the centroids, then every probed list computes the distances of all the queries probing it
+        # with one matrix-matrix product (see FaceEncodingIndex.distances_many).
+        encodings = np.asarray(encodings, dtype = np.float32).reshape(-1, ENCODING_DIMENSION)
+        found = [([], []) for _ in range(len(encodings))] # per query : ids & distances of every list searched
+        with self._lock:
+            if candidates is None:
+                nprobe = min(nprobe or self.nprobe, len(self.centroids))
+                squared = squared_distances(encodings, self.centroids, self._centroid_squared_norms)
+                probed = np.argpartition(squared, nprobe - 1, axis = 1)[:, :nprobe] if nprobe < len(self.centroids) else np.tile(np.arange(len(self.centroids)), (len(encodings), 1))
+                queries_of_list = defaultdict(list)
+                for query, list_numbers in enumerate(probed.tolist()):
+                    for list_number in list_numbers:
+                        queries_of_list[list_number].append(query)
+                searches = [(list_number, queries, None) for list_number, queries in queries_of_list.items()]
+            else:
+                searches = [(list_number, list(range(len(encodings))), list_candidates) for list_number, list_candidates in self._candidates_of_lists(candidates)]
+            for list_number, queries, list_candidates in searches:
+                ids, distances = self._lists[list_number].distances_many(encodings[queries], list_candidates)
+                for query, query_distances in zip(queries, distances):
+                    found[query][0].append(ids)
+                    found[query][1].append(query_distances)
+        return [top_k(np.concatenate(ids), np.concatenate(distances), k, tolerance) if ids else [] for ids, distances in found]
+
+    @classmethod
+    def train(cls, ids, encodings, nlist, iterations = 10, sample_size = None, nprobe = None, seed = 0):
+        # Learns the centroids on (a random sample of) the encodings and then fills the inverted lists with all of them.
+        encodings = np.asarray(encodings, dtype = np.float32).reshape(-1, ENCODING_DIMENSION)
+        nlist = max(1, min(nlist, len(encodings)))
+        sample = encodings
+        if sample_size and len(encodings) > sample_size:
+            sample = encodings[np.random.default_rng(seed).choice(len(encodings), size = sample_size, replace = False)]
+        index = cls(kmeans(sample, nlist, iterations = iterations, seed = seed), nprobe = nprobe)
+        index.load_arrays(np.asarray(ids, dtype = np.int64), encodings)
+        return index
+
+    def save(self, path):
+        with self._lock:
+            ids = []
+            encodings = []
+            for inverted_list in self._lists:
+                list_ids, list_encodings = inverted_list.rows()
+                ids.append(list_ids)
+                encodings.append(list_encodings)
+        temporary_path = f"{path}.tmp"
+        with open(temporary_path, 'wb') as f:
+            np.savez(f, centroids = self.centroids, ids = np.concatenate(ids),
+                     encodings = np.concatenate(encodings).reshape(-1, ENCODING_DIMENSION))
+        os.replace(temporary_path, path) # atomic, so that a starting worker never reads a half written file
+
+    @classmethod
+    def load_file(cls, path, nprobe = None):
+        with np.load(path) as data:
+            index = cls(data['centroids'], nprobe = nprobe)
+            index.load_arrays(data['ids'], data['encodings'])
+        return index
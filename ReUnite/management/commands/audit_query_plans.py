@@ -0,0 +1,99 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+from ReUnite.models import MissingChild, MissingChildEncodedFace
+from ReUnite.face_index_changes import changes_after, changes_among, latest_change_sequence
+from ReUnite.name_search import name_trigrams, normalize_name, similar_names
+from ReUnite.face_filters import missing_child_attributes_query
+from ReUnite.notifications import due_notifications
+import json, re
+
+SQLITE_SCAN = re.compile(r'^SCAN (?:TABLE )?(\S+)')
+
+def plan_nodes(plan):
+    # every dict of a JSON query plan, depth first
+    if isinstance(plan, dict):
+        yield plan
+        plan = list(plan.values())
+    if isinstance(plan, list):
+        for value in plan:
+            yield from plan_nodes(value)
+
+def explain(queryset):
+    # (plan text, [tables read in full]) of the query of queryset, from the EXPLAIN of the database in use
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            details = [row[-1] for row in cursor.fetchall()]
+            scans = [match.group(1) for match in map(SQLITE_SCAN.match, details) if match]
+            return '\n'.join(details), scans
+        if connection.vendor == 'mysql':
+            cursor.execute(f'EXPLAIN FORMAT=JSON {sql}', params)
+            plan = json.loads(cursor.fetchone()[0])
+            return json.dumps(plan, indent = 2), [node['table_name'] for node in plan_nodes(plan) if node.get('access_type') in ('ALL', 'index')]
+        if connection.vendor == 'postgresql':
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            return json.dumps(plan, indent = 2), [node['Relation Name'] for node in plan_nodes(plan) if node.get('Node Type') == 'Seq Scan']
+    raise CommandError(f"Query plans of the {connection.vendor} database backend are not supported.")
+
+class Command(BaseCommand):
+    help = ("Runs EXPLAIN on the queries the app issues on every request or poll (prefilter attributes & encodings of "
+            "the changed missing children, name search trigrams, matched children, notification outbox polling, face "
+            "index change polling) against the configured database and fails when one of them reads a whole table (or "
+            "a whole index) holding more than --max-rows rows. Run it against a database of production size, e.g. in "
+            "CI after 'migrate' on a restored dump.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-rows', type = int, default = 10000, help = "Full scans of tables up to this number of rows are accepted.")
+
+    def handle(self, *args, **options):
+        failures = []
+        row_counts = {}
+        for name, queryset in self.queries():
+            plan, scanned_tables = explain(queryset)
+            if options['verbosity'] >= 2:
+                self.stdout.write(f"{name} :\n{queryset.query}\n{plan}\n")
+            too_large = []
+            for table in scanned_tables:
+                if table not in row_counts:
+                    row_counts[table] = self.row_count(table)
+                if row_counts[table] is None or row_counts[table] > options['max_rows']:
+                    too_large.append(f"{table} ({'?' if row_counts[table] is None else row_counts[table]} rows)")
+            if too_large:
+                failures.append(name)
+                self.stdout.write(self.style.ERROR(f"FULL SCAN  {name} : {', '.join(too_large)}"))
+            elif scanned_tables:
+                self.stdout.write(f"ok         {name} (full scan of small table(s) {', '.join(scanned_tables)})")
+            else:
+                self.stdout.write(f"ok         {name}")
+        if failures:
+            raise CommandError(f"{len(failures)} quer(ies) read a whole table of more than {options['max_rows']} rows : {', '.join(failures)}.")
+        self.stdout.write(self.style.SUCCESS(f"No full scan of a table of more than {options['max_rows']} rows."))
+
+    def row_count(self, table):
+        # None when the plan names the table by an alias
+        if table not in connection.introspection.table_names():
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT COUNT(*) FROM {connection.ops.quote_name(table)}')
+            return cursor.fetchone()[0]
+
+    def queries(self):
+        # The queries as the app builds them (same functions), with the values of stored records (or placeholders) as
+        # parameters. The full loads done once per process (face index, sighting index, prefilter attributes) aren't
+        # audited : they read whole tables by design.
+        full_name = MissingChild.objects.order_by('-pk').values_list('full_name', flat = True).first() or 'Ravi Kumar'
+        missing_child_ids = list(MissingChild.objects.order_by('-pk').values_list('pk', flat = True)[:10]) or [1]
+        sequence = latest_change_sequence()
+        yield "prefilter attributes of changed missing children", missing_child_attributes_query(missing_child_ids)
+        yield "encodings of changed missing children", MissingChildEncodedFace.objects.filter(missing_child__isnull = False, missing_child_id__in = missing_child_ids).order_by('pk').values_list('missing_child_id', 'child_encoded_face')
+        yield "name search", similar_names(name_trigrams(normalize_name(full_name)), settings.NAME_SEARCH_MIN_SIMILARITY, settings.NAME_SEARCH_LIMIT)
+        yield "matched children of a search", MissingChild.objects.select_related('user__profile').filter(pk__in = missing_child_ids)
+        yield "due notifications", due_notifications(timezone.now())[:100]
+        yield "face index changes poll", changes_after(sequence)[:1000]
+        yield "face index change gaps poll", changes_among([max(sequence - i, 1) for i in range(10)])
@@ -0,0 +1,94 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from ReUnite.face_detection import DEFAULT_PROFILE, detect_and_encode
+from ReUnite.image_pipeline import prepare_image
+import glob, itertools, json, os, time
+import numpy as np
+
+class Command(BaseCommand):
+    help = ("Measures the accuracy / latency trade-off of face detection & encoding profiles on a fixture set : a "
+            "directory holding one sub-directory of .jpg / .png images per person. For every profile it reports the "
+            "per-image latency, the share of images with exactly one face detected and the share of those whose nearest "
+            "other image (within FACE_MATCH_TOLERANCE) shows the same person. As in production, where the stored faces "
+            "are encoded with the registration profile and the searched ones with the search / sighting profiles, every "
+            "profile is then also paired with the gallery profile : its encodings are the queries, those of the gallery "
+            "profile the stored faces.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('fixtures', help = "Directory with one sub-directory of images per person.")
+        parser.add_argument('--grid', action = 'store_true', help = "Also sweep detection sizes x encoding models x jitters instead of only the FACE_ENCODING_PROFILES.")
+        parser.add_argument('--detection-sizes', nargs = '+', type = int, default = [400, 800, 0], help = "Detection sizes swept with --grid (0 = full image).")
+        parser.add_argument('--jitters', nargs = '+', type = int, default = [1, 3], help = "num_jitters values swept with --grid.")
+        parser.add_argument('--gallery-profile', default = 'missing_child', help = "Profile the stored faces are encoded with in the cross-profile pairing.")
+        parser.add_argument('--json', dest = 'json_path', default = None, help = "Also write the results to this JSON file.")
+
+    def handle(self, *args, **options):
+        images = []
+        labels = []
+        for person in sorted(os.listdir(options['fixtures'])):
+            for path in sorted(glob.glob(os.path.join(options['fixtures'], person, '*'))):
+                if os.path.splitext(path)[1].lower() in ('.jpg', '.jpeg', '.png'):
+                    with open(path, 'rb') as f:
+                        images.append(prepare_image(f.read())[0]) # decoded once, only detection & encoding are timed
+                    labels.append(person)
+        if not images:
+            raise CommandError(f"No images found in the sub-directories of {options['fixtures']}.")
+        profiles = dict(settings.FACE_ENCODING_PROFILES, full_resolution = DEFAULT_PROFILE)
+        if options['gallery_profile'] not in profiles:
+            raise CommandError(f"Unknown gallery profile {options['gallery_profile']} (one of {', '.join(profiles)}).")
+        if options['grid']:
+            for detection_size, encoding_model, num_jitters in itertools.product(options['detection_sizes'], ['small', 'large'], options['jitters']):
+                profiles[f"detect@{detection_size or 'full'}/{encoding_model}/jitters={num_jitters}"] = dict(DEFAULT_PROFILE, detection_size = detection_size or None, encoding_model = encoding_model, num_jitters = num_jitters)
+        tolerance = settings.FACE_MATCH_TOLERANCE
+        results = []
+        encodings = {}
+        self.stdout.write(f"{len(images)} image(s) of {len(set(labels))} person(s)")
+        self.stdout.write(f"{'profile':<40} {'mean ms':>8} {'p95 ms':>8} {'1 face':>7} {'correct':>8}")
+        for name, profile in profiles.items():
+            latencies, encodings[name] = self.encode(profile, images)
+            result = {
+                'profile': name,
+                'options': profile,
+                'mean_ms': float(np.mean(latencies)),
+                'p95_ms': float(np.percentile(latencies, 95)),
+                'single_face_rate': sum(1 for encoding in encodings[name] if encoding is not None) / len(images),
+                'identification_rate': self.identification_rate(encodings[name], encodings[name], labels, tolerance),
+            }
+            results.append(result)
+            self.stdout.write(f"{name:<40} {result['mean_ms']:>8.1f} {result['p95_ms']:>8.1f} {result['single_face_rate']:>7.1%} {result['identification_rate']:>8.1%}")
+        gallery = options['gallery_profile']
+        self.stdout.write(f"\nqueries vs gallery encoded with {gallery} ({profiles[gallery]['encoding_model']} landmarks, {profiles[gallery]['num_jitters']} jitter(s))")
+        self.stdout.write(f"{'query profile':<40} {'landmarks':>9} {'correct':>8} {'same':>8}")
+        for result in results:
+            name = result['profile']
+            result['gallery_profile'] = gallery
+            result['cross_identification_rate'] = self.identification_rate(encodings[name], encodings[gallery], labels, tolerance)
+            self.stdout.write(f"{name:<40} {profiles[name]['encoding_model']:>9} {result['cross_identification_rate']:>8.1%} {result['identification_rate']:>8.1%}")
+        if options['json_path']:
+            with open(options['json_path'], 'w') as f:
+                json.dump(results, f, indent = 2)
+
+    def encode(self, profile, images):
+        # (latencies in ms, encoding of every image or None when it hasn't exactly one face detected)
+        latencies = []
+        encodings = []
+        for image in images:
+            start = time.perf_counter()
+            face_encodings = detect_and_encode(image, profile)
+            latencies.append((time.perf_counter() - start) * 1000)
+            encodings.append(face_encodings[0] if len(face_encodings) == 1 else None)
+        return latencies, encodings
+
+    def identification_rate(self, queries, gallery, labels, tolerance):
+        # Share of the images whose query encoding has, as nearest gallery encoding of another image, one within
+        # tolerance showing the same person
+        query_rows = [i for i, encoding in enumerate(queries) if encoding is not None]
+        gallery_rows = [i for i, encoding in enumerate(gallery) if encoding is not None]
+        if not query_rows or not gallery_rows:
+            return 0.0
+        distances = np.linalg.norm(np.array([queries[i] for i in query_rows])[:, None, :] - np.array([gallery[i] for i in gallery_rows])[None, :, :], axis = 2)
+        distances[np.array(query_rows)[:, None] == np.array(gallery_rows)[None, :]] = np.inf # not the image itself
+        nearest = distances.argmin(axis = 1)
+        correct = sum(1 for row, column in enumerate(nearest)
+                      if distances[row, column] <= tolerance and labels[query_rows[row]] == labels[gallery_rows[column]])
+        return correct / len(queries)
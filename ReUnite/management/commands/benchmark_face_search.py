@@ -0,0 +1,153 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from ReUnite.face_codec import encode_face_encoding, decode_face_encoding
+from ReUnite.face_index import ENCODING_DIMENSION, FaceEncodingIndex, reset_face_index
+from ReUnite.ivf_index import IVFFaceIndex
+import datetime, json, os, platform, resource, subprocess, sys, time
+import numpy as np
+
+IDENTITY_SPREAD = 0.055 # encodings of different synthetic children are ~0.9 apart, like real face_recognition encodings
+QUERY_NOISE = 0.02 # a query is ~0.25 away from the stored encoding of the same child
+
+def synthetic_corpus(size, seed):
+    return np.random.default_rng(seed).normal(0, IDENTITY_SPREAD, (size, ENCODING_DIMENSION)).astype(np.float32)
+
+def synthetic_queries(corpus, count, seed):
+    # (row of the child each query shows, query encodings)
+    rng = np.random.default_rng(seed + 1)
+    rows = rng.integers(0, len(corpus), count)
+    return rows, corpus[rows] + rng.normal(0, QUERY_NOISE, (count, ENCODING_DIMENSION)).astype(np.float32)
+
+def peak_rss_mb():
+    # ru_maxrss is in KB on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+def percentiles(latencies):
+    return {f'p{p}_ms': float(np.percentile(latencies, p)) for p in (50, 95, 99)}
+
+class LoopSearch:
+    # The search as views.face_comparision originally did it : every stored blob decoded and compared one by one
+    def __init__(self, ids, corpus):
+        self.rows = [(missing_child_id, encode_face_encoding(encoding)) for missing_child_id, encoding in zip(ids.tolist(), corpus)]
+
+    def search(self, encoding, k, tolerance):
+        matches = []
+        for missing_child_id, blob in self.rows:
+            face_distance = float(np.linalg.norm(decode_face_encoding(blob) - encoding))
+            if face_distance <= tolerance:
+                matches.append((missing_child_id, face_distance))
+        return sorted(matches, key = lambda match: match[1])[:k]
+
+class Command(BaseCommand):
+    help = ("Benchmarks the face search on synthetic corpora of 128-d encodings (one per synthetic child, queries being "
+            "noisy copies of stored encodings) : for every corpus size and search backend it reports the build time, the "
+            "p50 / p95 / p99 search latency, the recall of the true child among the results and the peak RSS of the "
+            "process. With --database the corpus is also written to the database (in a transaction rolled back "
+            "afterwards) and views.search_missing_children is measured end to end, including its queries per request. "
+            "Peak RSS never decreases within a run : run one size per process to compare memory use.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs = '+', type = int, default = [1000, 10000, 100000, 1000000], help = "Corpus sizes (number of encodings).")
+        parser.add_argument('--backends', nargs = '+', choices = ['loop', 'brute_force', 'ivf'], default = ['loop', 'brute_force', 'ivf'])
+        parser.add_argument('--loop-max-size', type = int, default = 100000, help = "Largest corpus the (slow) per-row loop is run on.")
+        parser.add_argument('--queries', type = int, default = 200, help = "Number of searches per corpus and backend.")
+        parser.add_argument('--nprobe', type = int, default = None, help = "IVF lists probed per search (default : FACE_INDEX_NPROBE).")
+        parser.add_argument('--database', action = 'store_true', help = "Also seed the database and measure search_missing_children.")
+        parser.add_argument('--seed', type = int, default = 0)
+        parser.add_argument('--json', dest = 'json_path', default = None, help = "Also write the results to this JSON file.")
+
+    def handle(self, *args, **options):
+        k = settings.FACE_SEARCH_TOP_K
+        tolerance = settings.FACE_MATCH_TOLERANCE
+        results = []
+        self.stdout.write(f"{'size':>8} {'backend':<20} {'build s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'recall':>7} {'queries':>7} {'peak MB':>8}")
+        for size in options['sizes']:
+            corpus = synthetic_corpus(size, options['seed'])
+            ids = np.arange(1, size + 1, dtype = np.int64)
+            query_rows, queries = synthetic_queries(corpus, options['queries'], options['seed'])
+            for backend in options['backends']:
+                if backend == 'loop' and size > options['loop_max_size']:
+                    continue
+                start = time.perf_counter()
+                index = self.build(backend, ids, corpus, options)
+                build_seconds = time.perf_counter() - start
+                latencies, found = [], 0
+                for row, query in zip(query_rows, queries):
+                    start = time.perf_counter()
+                    best_matches = index.search(query, k, tolerance)
+                    latencies.append((time.perf_counter() - start) * 1000)
+                    found += any(missing_child_id == ids[row] for missing_child_id, _ in best_matches)
+                del index
+                results.append(self.report(dict(size = size, backend = backend, build_seconds = build_seconds, recall = found / len(queries),
+                                                queries_per_search = 0, peak_rss_mb = peak_rss_mb(), **percentiles(latencies))))
+            if options['database']:
+                results.append(self.report(self.benchmark_database(ids, corpus, query_rows, queries)))
+        if options['json_path']:
+            with open(options['json_path'], 'w') as f:
+                json.dump({'environment': self.environment(options), 'results': results}, f, indent = 2)
+
+    def build(self, backend, ids, corpus, options):
+        if backend == 'loop':
+            return LoopSearch(ids, corpus)
+        if backend == 'ivf':
+            return IVFFaceIndex.train(ids, corpus, max(1, int(4 * np.sqrt(len(ids)))), sample_size = 100000,
+                                      nprobe = options['nprobe'] or getattr(settings, 'FACE_INDEX_NPROBE', None), seed = options['seed'])
+        index = FaceEncodingIndex()
+        index.load_arrays(ids, corpus)
+        return index
+
+    def benchmark_database(self, ids, corpus, query_rows, queries):
+        from ReUnite.models import MissingChild, MissingChildEncodedFace
+        from ReUnite.views import search_missing_children
+        with transaction.atomic():
+            first_pk = (MissingChild.objects.order_by('-pk').values_list('pk', flat = True).first() or 0) + 1
+            pks = ids - 1 + first_pk # explicit primary keys : bulk_create doesn't return them on SQLite / MySQL
+            self.seed_database(pks, corpus)
+            reset_face_index()
+            latencies, query_counts, found = [], [], 0
+            start = time.perf_counter()
+            search_missing_children(queries[0]) # builds the process-wide index from the database
+            build_seconds = time.perf_counter() - start
+            for row, query in zip(query_rows, queries):
+                with CaptureQueriesContext(connection) as captured:
+                    start = time.perf_counter()
+                    search_results = search_missing_children(query)
+                    latencies.append((time.perf_counter() - start) * 1000)
+                query_counts.append(len(captured))
+                found += any(result.pk == pks[row] for result in search_results)
+            transaction.set_rollback(True)
+        reset_face_index()
+        return dict(size = len(ids), backend = f"database/{getattr(settings, 'FACE_INDEX_BACKEND', 'brute_force')}", build_seconds = build_seconds,
+                    recall = found / len(queries), queries_per_search = float(np.mean(query_counts)), peak_rss_mb = peak_rss_mb(), **percentiles(latencies))
+
+    def seed_database(self, pks, corpus, chunk_size = 1000):
+        from ReUnite.models import MissingChild, MissingChildEncodedFace
+        for start in range(0, len(pks), chunk_size):
+            chunk_pks = pks[start:start + chunk_size].tolist()
+            MissingChild.objects.bulk_create([
+                MissingChild(pk = pk, full_name = f"Benchmark Child {pk}", name_key = f"benchmark child {pk}", gender = 'Male', age = 1 + pk % 12,
+                             father_name = 'Father', mother_name = 'Mother', nationality = 'Indian', child_image = 'missing_child_images/benchmark.jpg',
+                             residential_address = 'Address', district = 'District', state = 'State', pincode = 110001, parent_mobile_no = '+919999999999',
+                             parent_aadhar_no = 999999999999, missing_from_place = 'Place', police_station_nearby_missing_place = 'Police station',
+                             missing_from_date = datetime.date(2020, 1, 1), missing_from_time = datetime.time(12, 0), additional_info = 'Benchmark fixture',
+                             height = '4.00', weight = 20)
+                for pk in chunk_pks])
+            MissingChildEncodedFace.objects.bulk_create([MissingChildEncodedFace(missing_child_id = pk, child_encoded_face = encode_face_encoding(encoding))
+                                                         for pk, encoding in zip(chunk_pks, corpus[start:start + chunk_size])])
+
+    def report(self, result):
+        self.stdout.write(f"{result['size']:>8} {result['backend']:<20} {result['build_seconds']:>8.2f} {result['p50_ms']:>8.2f} {result['p95_ms']:>8.2f} "
+                          f"{result['p99_ms']:>8.2f} {result['recall']:>7.1%} {result['queries_per_search']:>7.1f} {result['peak_rss_mb']:>8.0f}")
+        return result
+
+    def environment(self, options):
+        try:
+            commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output = True, text = True, cwd = settings.BASE_DIR).stdout.strip() or None
+        except OSError:
+            commit = None
+        return {'commit': commit, 'python': platform.python_version(), 'numpy': np.__version__, 'database': connection.vendor,
+                'cpu_count': os.cpu_count(), 'seed': options['seed'], 'queries': options['queries'],
+                'top_k': settings.FACE_SEARCH_TOP_K, 'tolerance': settings.FACE_MATCH_TOLERANCE}
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from ReUnite.face_codec import convert_legacy_encodings
+
+class Command(BaseCommand):
+    help = "Rewrites the face encodings stored as raw float64 arrays (legacy format) in the current versioned format."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dtype', choices = ['float32', 'float16'], default = None, help = "Storage precision (default : FACE_ENCODING_STORAGE_DTYPE).")
+        parser.add_argument('--chunk-size', type = int, default = 500)
+
+    def handle(self, *args, **options):
+        converted = convert_legacy_encodings(dtype = options['dtype'], chunk_size = options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f"Converted {converted} face encoding(s)."))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from ReUnite.notifications import dispatch_notifications
+from ReUnite.metrics import serve_metrics, share_metrics
+import time
+
+class Command(BaseCommand):
+    help = "Sends the queued sighted child Email & SMS notifications of the NotificationOutbox."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action = 'store_true', help = "Keep running as a worker, polling the outbox for new notifications.")
+        parser.add_argument('--interval', type = float, default = 5, help = "Seconds to wait between two polls of an idle outbox (with --loop).")
+        parser.add_argument('--batch-size', type = int, default = 100)
+        parser.add_argument('--workers', type = int, default = 4, help = "Number of notifications sent concurrently.")
+        parser.add_argument('--metrics-port', type = int, default = None, help = "Serve the SMTP / SMS metrics in the Prometheus text format on this port (to the METRICS_TOKEN bearer).")
+
+    def handle(self, *args, **options):
+        share_metrics() # with METRICS_DIR set, also served by the web workers' /metrics
+        if options['metrics_port']:
+            serve_metrics(options['metrics_port'])
+        while True:
+            start = time.perf_counter()
+            handled = dispatch_notifications(batch_size = options['batch_size'], workers = options['workers'])
+            if handled:
+                self.stdout.write(f"Dispatched {handled} notification(s) in {time.perf_counter() - start:.2f}s.")
+            if not options['loop']:
+                if handled == options['batch_size']: # there may be more due notifications
+                    continue
+                break
+            if not handled:
+                time.sleep(options['interval'])
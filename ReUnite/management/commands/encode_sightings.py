@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from functools import partial
+from ReUnite.encoding_service import encoding_profile
+from ReUnite.bulk_encoding import encode_image_file, encoding_pool, chunked, ThroughputReport
+from ReUnite.face_codec import encode_face_encoding
+from ReUnite.face_index_changes import record_sighting_index_changes
+from ReUnite.models import SightedChild, SightedChildEncodedFace
+
+class Command(BaseCommand):
+    help = ("Encodes, in parallel, the faces of the sighted child images saved without an encoding, so that they can be "
+            "matched with the missing children reported from now on. Already encoded sightings are skipped, so an "
+            "interrupted run can simply be run again.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type = int, default = 200, help = "Number of encodings written per query.")
+        parser.add_argument('--workers', type = int, default = None, help = "Number of encoding processes (default : number of CPUs).")
+        parser.add_argument('--all', action = 'store_true', help = "Also encode the sightings already matched with a missing child.")
+
+    def handle(self, *args, **options):
+        sightings = SightedChild.objects.filter(sightedchildencodedface__isnull = True).order_by('pk')
+        if not options['all']:
+            sightings = sightings.filter(match_found = False)
+        storage = SightedChild._meta.get_field('sighted_child_image').storage
+        encode = partial(encode_image_file, profile = encoding_profile('sighted_child'))
+        report = ThroughputReport(self.stdout)
+        with encoding_pool(options['workers']) as pool:
+            for chunk in chunked(sightings.values_list('pk', 'sighted_child_image').iterator(), options['chunk_size']):
+                encoded_faces = []
+                for (pk, image), (face_encodings, _, error) in zip(chunk, pool.map(encode, [storage.path(image) for _, image in chunk], chunksize = 4)):
+                    if error or len(face_encodings) != 1:
+                        self.stderr.write(f"Skipping sighted child {pk} : {error or f'{len(face_encodings)} face(s) recognized in {image}'}")
+                        continue
+                    encoded_faces.append(SightedChildEncodedFace(sighted_child_id = pk, child_encoded_face = encode_face_encoding(face_encodings[0])))
+                SightedChildEncodedFace.objects.bulk_create(encoded_faces)
+                record_sighting_index_changes([encoded_face.sighted_child_id for encoded_face in encoded_faces]) # bulk_create doesn't send signals
+                report.update(len(encoded_faces), len(chunk) - len(encoded_faces))
+        self.stdout.write(self.style.SUCCESS(f"Encoded {report.done} sighting(s), skipped {report.skipped}. The web workers pick them up from the face index changes."))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from ReUnite.models import MissingChild, SightedChild
+from ReUnite.thumbnails import generate_renditions
+
+class Command(BaseCommand):
+    help = ("Writes the list / detail renditions (see IMAGE_RENDITIONS) of the images of the missing & sighted children "
+            "stored before the renditions existed, or whose renditions failed to be written after they were saved. "
+            "Images whose renditions all exist are skipped unless --overwrite is given (e.g. after changing "
+            "IMAGE_RENDITIONS or IMAGE_RENDITION_QUALITY).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--overwrite', action = 'store_true', help = "Rewrite the existing renditions too.")
+        parser.add_argument('--chunk-size', type = int, default = 500)
+
+    def handle(self, *args, **options):
+        for model, field in ((MissingChild, 'child_image'), (SightedChild, 'sighted_child_image')):
+            images = written = failed = 0
+            last_pk = 0
+            while True:
+                chunk = list(model.objects.filter(pk__gt = last_pk).exclude(**{field: ''}).order_by('pk').only('pk', field)[:options['chunk_size']])
+                if not chunk:
+                    break
+                last_pk = chunk[-1].pk
+                for instance in chunk:
+                    try:
+                        written += generate_renditions(getattr(instance, field), overwrite = options['overwrite'])
+                    except OSError as e:
+                        self.stderr.write(f"Skipping {model.__name__} ID = {instance.pk} : {e}")
+                        failed += 1
+                    images += 1
+            self.stdout.write(self.style.SUCCESS(f"{model.__name__} : {images} image(s), {written} rendition(s) written, {failed} failed."))
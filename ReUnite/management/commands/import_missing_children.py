@@ -0,0 +1,107 @@
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile, File
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from functools import partial
+from ReUnite.encoding_service import encoding_profile
+from ReUnite.bulk_encoding import encode_image_file, encoding_pool, chunked, ThroughputReport
+from ReUnite.face_codec import encode_face_encoding
+from ReUnite.face_index_changes import record_face_index_changes
+from ReUnite.models import MissingChild, MissingChildEncodedFace
+from ReUnite.name_search import normalize_name, sync_name_trigrams, invalidate_name_searches
+from ReUnite.reverse_matching import match_sightings
+from ReUnite.thumbnails import generate_renditions_on_commit
+import csv, glob, os
+
+CHOICE_FIELDS = ['gender', 'missing_cause', 'complexion', 'build', 'eye_color', 'hair_color', 'deformities']
+
+class Command(BaseCommand):
+    help = ("Bulk imports missing child records from a CSV file (or every CSV file of a directory). The columns are the "
+            "MissingChild field names, 'child_image' being the image path relative to the CSV file and 'source_reference' "
+            "the partner agency's unique case reference. Faces are encoded in parallel and the records are written in "
+            "chunks; records already imported (same source_reference) are skipped, so an interrupted import can simply be "
+            "run again.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', help = "CSV file or directory of CSV files.")
+        parser.add_argument('--user', required = True, help = "Username of the (partner agency) account the imported records belong to.")
+        parser.add_argument('--chunk-size', type = int, default = 200, help = "Number of records written per transaction.")
+        parser.add_argument('--workers', type = int, default = None, help = "Number of encoding processes (default : number of CPUs).")
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username = options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['user']!r} does not exist.")
+        if os.path.isdir(options['source']):
+            csv_files = sorted(glob.glob(os.path.join(options['source'], '*.csv')))
+        else:
+            csv_files = [options['source']]
+        report = ThroughputReport(self.stdout)
+        with encoding_pool(options['workers']) as pool:
+            for csv_file in csv_files:
+                with open(csv_file, newline = '') as f:
+                    for chunk in chunked(csv.DictReader(f), options['chunk_size']):
+                        imported, skipped = self.import_chunk(chunk, os.path.dirname(os.path.abspath(csv_file)), user, pool)
+                        report.update(imported, skipped)
+        self.stdout.write(self.style.SUCCESS(f"Imported {report.done} missing child record(s), skipped {report.skipped}. The web workers pick them up from the face index changes."))
+
+    def import_chunk(self, rows, base_dir, user, pool):
+        existing = set(MissingChild.objects.filter(source_reference__in = [row.get('source_reference') for row in rows]).values_list('source_reference', flat = True))
+        records = []
+        for row in rows:
+            if row.get('source_reference') in existing:
+                continue
+            record = self.build_record(row, user)
+            if record is not None:
+                records.append((record, os.path.join(base_dir, row['child_image'])))
+        skipped = len(rows) - len(records)
+        children = []
+        encodings = {}
+        for (child, image_path), (face_encodings, downscaled_image, error) in zip(records, pool.map(partial(encode_image_file, profile = encoding_profile('missing_child')), [path for _, path in records], chunksize = 4)):
+            if error or len(face_encodings) != 1:
+                self.stderr.write(f"Skipping {child.source_reference} : {error or f'{len(face_encodings)} face(s) recognized in {image_path}'}")
+                skipped += 1
+                continue
+            image_name = os.path.basename(image_path)
+            if downscaled_image is None:
+                with open(image_path, 'rb') as image_file:
+                    child.child_image.save(image_name, File(image_file), save = False)
+            else:
+                child.child_image.save(image_name, ContentFile(downscaled_image), save = False)
+            children.append(child)
+            encodings[child.source_reference] = face_encodings[0]
+        with transaction.atomic():
+            for child in children: # bulk_create doesn't call save()
+                child.name_key = normalize_name(child.full_name)
+                generate_renditions_on_commit(child.child_image)
+            MissingChild.objects.bulk_create(children)
+            # bulk_create doesn't return the primary keys on MySQL, they are looked up by source_reference
+            pks = dict(MissingChild.objects.filter(source_reference__in = list(encodings)).values_list('source_reference', 'pk'))
+            sync_name_trigrams({pks[child.source_reference]: child.name_key for child in children})
+            MissingChildEncodedFace.objects.bulk_create([MissingChildEncodedFace(missing_child_id = pk, child_encoded_face = encode_face_encoding(encodings[reference])) for reference, pk in pks.items()])
+            record_face_index_changes(list(pks.values()))
+        invalidate_name_searches()
+        for child in children: # the imported cases are checked against the past sightings like the reported ones
+            child.pk = pks[child.source_reference]
+            matched_sightings = match_sightings(child, encodings[child.source_reference])
+            if matched_sightings:
+                self.stdout.write(f"{child.source_reference} matches {len(matched_sightings)} earlier sighting(s), notifications queued.")
+        return len(children), skipped
+
+    def build_record(self, row, user):
+        if not row.get('source_reference'):
+            self.stderr.write(f"Skipping record without source_reference : {row}")
+            return None
+        fields = {field.name for field in MissingChild._meta.fields}
+        child = MissingChild(user = user, **{k: v for k, v in row.items() if k in fields and k not in ('child_image', 'user', 'id') and v != ''})
+        try:
+            child.full_clean(exclude = ['child_image', 'user', 'source_reference'], validate_unique = False)
+        except ValidationError as e:
+            self.stderr.write(f"Skipping {row.get('source_reference')} : {e.message_dict}")
+            return None
+        for field in CHOICE_FIELDS: # stored as display values, same as the missing_child view does
+            if getattr(child, field) is not None:
+                setattr(child, field, getattr(child, f'get_{field}_display')())
+        return child
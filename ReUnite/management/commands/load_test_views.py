@@ -0,0 +1,120 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+from django.utils.crypto import get_random_string
+import asyncio, io, json, os, sys, time
+import numpy as np
+
+class Command(BaseCommand):
+    help = ("Load tests the search (or sighting) endpoint through the WSGI application, served by a pool of "
+            "--concurrency threads like a threaded WSGI server, and through the ASGI application, which serves its "
+            "async variant with the same --concurrency requests in flight, so that both modes are compared under the "
+            "same load. Both receive the same --requests uploads of an image from a logged in --user; the throughput, "
+            "latencies and status codes of each are reported. The applications run in this process (no network), the "
+            "face encoding in the encoding service as configured. When both modes run, the ASGI throughput and p95 "
+            "latency are compared with the WSGI ones. The sighting endpoint saves every sighting : load test it on a "
+            "test database only.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('image', help = "Image (.jpg / .png) uploaded by every request.")
+        parser.add_argument('--user', required = True, help = "Username the requests are made as.")
+        parser.add_argument('--endpoint', choices = ['search', 'sighting'], default = 'search')
+        parser.add_argument('--requests', type = int, default = 200)
+        parser.add_argument('--concurrency', type = int, default = 16, help = "Requests in flight at once, in both modes (threads of the simulated WSGI server).")
+        parser.add_argument('--modes', nargs = '+', choices = ['wsgi', 'asgi'], default = ['wsgi', 'asgi'])
+        parser.add_argument('--keep-encoding-cache', action = 'store_true', help = "Let the encoding cache answer the repeated uploads (by default every upload is encoded).")
+        parser.add_argument('--json', dest = 'json_path', default = None, help = "Also write the results to this JSON file.")
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username = options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['user']!r} does not exist.")
+        if not options['keep_encoding_cache']:
+            settings.FACE_ENCODING_CACHE_SIZE = 0
+        client = Client()
+        client.force_login(user)
+        csrf_token = get_random_string(32)
+        self.cookie = f"{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}; {settings.CSRF_COOKIE_NAME}={csrf_token}"
+        self.csrf_token = csrf_token
+        with open(options['image'], 'rb') as f:
+            image = SimpleUploadedFile(os.path.basename(options['image']), f.read())
+        if options['endpoint'] == 'search':
+            self.path = '/search-child/'
+            self.body = encode_multipart(BOUNDARY, {'full_name_to_search': '', 'child_image_to_search': image})
+        else:
+            self.path = '/sighted-child/'
+            self.body = encode_multipart(BOUNDARY, {'sighted_date': '2020-01-01', 'sighted_time': '12:00', 'sighted_location': 'Load test', 'sighted_child_image': image})
+        results = []
+        self.stdout.write(f"{'mode':<6} {'requests':>8} {'in flight':>9} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}  status codes")
+        in_flight = options['concurrency']
+        for mode in options['modes']:
+            start = time.perf_counter()
+            if mode == 'wsgi':
+                with ThreadPoolExecutor(in_flight) as pool:
+                    responses = list(pool.map(self.wsgi_request, [WSGIHandler()] * options['requests']))
+            else:
+                responses = asyncio.run(self.asgi_requests(options['requests'], in_flight))
+            wall_seconds = time.perf_counter() - start
+            latencies = [latency * 1000 for _, latency in responses]
+            status_codes = {}
+            for status_code, _ in responses:
+                status_codes[status_code] = status_codes.get(status_code, 0) + 1
+            result = dict(mode = mode, requests = len(responses), in_flight = in_flight, throughput = len(responses) / wall_seconds,
+                          status_codes = status_codes, **{f'p{p}_ms': float(np.percentile(latencies, p)) for p in (50, 95, 99)})
+            self.stdout.write(f"{mode:<6} {result['requests']:>8} {in_flight:>9} {result['throughput']:>8.1f} {result['p50_ms']:>8.1f} {result['p95_ms']:>8.1f} {result['p99_ms']:>8.1f}  {status_codes}")
+            results.append(result)
+        comparison = None
+        by_mode = {result['mode']: result for result in results}
+        if 'wsgi' in by_mode and 'asgi' in by_mode:
+            wsgi, asgi = by_mode['wsgi'], by_mode['asgi']
+            comparison = dict(throughput_ratio = asgi['throughput'] / wsgi['throughput'], p95_ratio = asgi['p95_ms'] / wsgi['p95_ms'])
+            style = self.style.SUCCESS if comparison['throughput_ratio'] > 1 else self.style.WARNING
+            self.stdout.write(style(f"asgi vs wsgi : {comparison['throughput_ratio']:.2f}x the throughput ({asgi['throughput']:.1f} vs {wsgi['throughput']:.1f} req/s), "
+                                    f"{comparison['p95_ratio']:.2f}x the p95 latency ({asgi['p95_ms']:.1f} vs {wsgi['p95_ms']:.1f} ms)"))
+        if options['json_path']:
+            with open(options['json_path'], 'w') as f:
+                json.dump({'endpoint': options['endpoint'], 'encoding_workers': settings.FACE_ENCODING_WORKERS, 'results': results, 'asgi_vs_wsgi': comparison}, f, indent = 2)
+
+    def wsgi_request(self, handler):
+        environ = {'REQUEST_METHOD': 'POST', 'PATH_INFO': self.path, 'SCRIPT_NAME': '', 'QUERY_STRING': '', 'SERVER_NAME': 'testserver',
+                   'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1', 'REMOTE_ADDR': '127.0.0.1', 'CONTENT_TYPE': MULTIPART_CONTENT,
+                   'CONTENT_LENGTH': str(len(self.body)), 'HTTP_COOKIE': self.cookie, 'HTTP_X_CSRFTOKEN': self.csrf_token,
+                   'wsgi.version': (1, 0), 'wsgi.url_scheme': 'http', 'wsgi.input': io.BytesIO(self.body), 'wsgi.errors': sys.stderr,
+                   'wsgi.multithread': True, 'wsgi.multiprocess': False, 'wsgi.run_once': False}
+        status = []
+        start = time.perf_counter()
+        response = handler(environ, lambda status_line, headers, exc_info = None: status.append(int(status_line.split()[0])))
+        b''.join(response)
+        response.close()
+        return status[0], time.perf_counter() - start
+
+    async def asgi_requests(self, count, concurrency):
+        from ReUnite.asgi import application
+        semaphore = asyncio.Semaphore(concurrency)
+        async def asgi_request():
+            async with semaphore:
+                scope = {'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'POST', 'scheme': 'http',
+                         'path': self.path, 'raw_path': self.path.encode(), 'query_string': b'', 'root_path': '',
+                         'client': ('127.0.0.1', 0), 'server': ('testserver', 80),
+                         'headers': [(b'content-type', MULTIPART_CONTENT.encode()), (b'content-length', str(len(self.body)).encode()),
+                                     (b'cookie', self.cookie.encode()), (b'x-csrftoken', self.csrf_token.encode())]}
+                received = []
+                async def receive():
+                    if received: # the whole body has been sent, the client never disconnects
+                        await asyncio.Future()
+                    received.append(True)
+                    return {'type': 'http.request', 'body': self.body, 'more_body': False}
+                status = []
+                async def send(message):
+                    if message['type'] == 'http.response.start':
+                        status.append(message['status'])
+                start = time.perf_counter()
+                await application(scope, receive, send)
+                return status[0], time.perf_counter() - start
+        return await asyncio.gather(*[asgi_request() for _ in range(count)])
@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from ReUnite.face_index import encoded_face_rows
+from ReUnite.ivf_index import IVFFaceIndex
+import time
+import numpy as np
+
+class Command(BaseCommand):
+    help = "Rebuilds the IVF face encoding index from MissingChildEncodedFace and writes it to FACE_INDEX_PATH."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--nlist', type = int, default = None, help = "Number of k-means partitions (default : 4 * sqrt(number of encodings)).")
+        parser.add_argument('--iterations', type = int, default = 10, help = "Number of k-means iterations.")
+        parser.add_argument('--sample-size', type = int, default = 100000, help = "Number of encodings the k-means centroids are trained on.")
+        parser.add_argument('--output', default = None, help = "Index file to write (default : FACE_INDEX_PATH).")
+
+    def handle(self, *args, **options):
+        path = options['output'] or getattr(settings, 'FACE_INDEX_PATH', None)
+        if not path:
+            raise CommandError("No output file given and FACE_INDEX_PATH is not set.")
+        start = time.perf_counter()
+        ids = []
+        encodings = []
+        for missing_child_id, encoding in encoded_face_rows():
+            ids.append(missing_child_id)
+            encodings.append(encoding)
+        if not ids:
+            raise CommandError("No encoded faces found in the database, nothing to index.")
+        nlist = options['nlist'] or int(4 * np.sqrt(len(ids)))
+        index = IVFFaceIndex.train(ids, np.vstack(encodings), nlist, iterations = options['iterations'], sample_size = options['sample_size'])
+        index.save(path)
+        self.stdout.write(self.style.SUCCESS(f"Indexed {len(index)} encoded faces in {len(index.centroids)} partitions to {path} ({time.perf_counter() - start:.1f}s)."))
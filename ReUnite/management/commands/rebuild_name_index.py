@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from ReUnite.models import MissingChild
+from ReUnite.name_search import normalize_name, sync_name_trigrams, invalidate_name_searches
+
+class Command(BaseCommand):
+    help = "Recomputes MissingChild.name_key and the name trigrams of every missing child (e.g. for the records created before the name search)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type = int, default = 500)
+
+    def handle(self, *args, **options):
+        updated = 0
+        last_pk = 0
+        while True:
+            chunk = list(MissingChild.objects.filter(pk__gt = last_pk).order_by('pk').only('pk', 'full_name', 'name_key')[:options['chunk_size']])
+            if not chunk:
+                break
+            last_pk = chunk[-1].pk
+            for child in chunk:
+                child.name_key = normalize_name(child.full_name)
+            with transaction.atomic():
+                MissingChild.objects.bulk_update(chunk, ['name_key'])
+                sync_name_trigrams({child.pk: child.name_key for child in chunk})
+            updated += len(chunk)
+        invalidate_name_searches()
+        self.stdout.write(self.style.SUCCESS(f"Indexed the names of {updated} missing child record(s)."))
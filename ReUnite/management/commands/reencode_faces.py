@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from functools import partial
+from ReUnite.encoding_service import encoding_profile
+from ReUnite.bulk_encoding import encode_image_file, encoding_pool, chunked, ThroughputReport
+from ReUnite.face_codec import encode_face_encoding
+from ReUnite.face_index_changes import record_face_index_changes
+from ReUnite.models import MissingChild, MissingChildEncodedFace
+
+class Command(BaseCommand):
+    help = ("Re-encodes the face of every missing child from its stored image (e.g. after changing the face encoding "
+            "settings), in parallel and in chunks. Use --after-id with the last id reported to resume an interrupted run.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--after-id', type = int, default = 0, help = "Only re-encode the missing children with an id greater than this.")
+        parser.add_argument('--chunk-size', type = int, default = 200, help = "Number of encodings written per transaction.")
+        parser.add_argument('--workers', type = int, default = None, help = "Number of encoding processes (default : number of CPUs).")
+
+    def handle(self, *args, **options):
+        children = MissingChild.objects.filter(pk__gt = options['after_id']).order_by('pk').values_list('pk', 'child_image')
+        report = ThroughputReport(self.stdout)
+        with encoding_pool(options['workers']) as pool:
+            for chunk in chunked(children.iterator(), options['chunk_size']):
+                paths = [MissingChild._meta.get_field('child_image').storage.path(image) for _, image in chunk]
+                encodings = {}
+                for (pk, image), (face_encodings, _, error) in zip(chunk, pool.map(partial(encode_image_file, profile = encoding_profile('missing_child')), paths, chunksize = 4)):
+                    if error or len(face_encodings) != 1:
+                        self.stderr.write(f"Skipping missing child {pk} : {error or f'{len(face_encodings)} face(s) recognized in {image}'}")
+                        continue
+                    encodings[pk] = encode_face_encoding(face_encodings[0])
+                encoded = len(encodings)
+                self.save_chunk(encodings)
+                report.update(encoded, len(chunk) - encoded)
+                self.stdout.write(f"Done up to missing child id {chunk[-1][0]}.")
+        self.stdout.write(self.style.SUCCESS(f"Re-encoded {report.done} face(s), skipped {report.skipped}. The web workers pick them up from the face index changes."))
+
+    def save_chunk(self, encodings):
+        with transaction.atomic():
+            existing = list(MissingChildEncodedFace.objects.filter(missing_child_id__in = list(encodings)))
+            for encoded_face in existing:
+                encoded_face.child_encoded_face = encodings[encoded_face.missing_child_id]
+            MissingChildEncodedFace.objects.bulk_update(existing, ['child_encoded_face'])
+            existing_ids = {encoded_face.missing_child_id for encoded_face in existing}
+            MissingChildEncodedFace.objects.bulk_create([MissingChildEncodedFace(missing_child_id = pk, child_encoded_face = encoding) for pk, encoding in encodings.items() if pk not in existing_ids])
+            record_face_index_changes(list(encodings)) # bulk_update / bulk_create don't send signals
@@ -0,0 +1,81 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from ReUnite.face_index_changes import prune_face_index_changes
+from ReUnite.face_snapshot import SnapshotFaceIndex, write_snapshot
+import json, subprocess, sys, time
+
+# Run in every probe process of --measure : loads the face index like a starting web worker, reports the time it took,
+# waits until every probe has loaded it (so that the shared pages are counted once per host) and reports its memory.
+PROBE = """
+import django, json, os, sys, time
+sys.path.insert(0, {base_dir!r})
+django.setup()
+from django.conf import settings
+settings.FACE_INDEX_SNAPSHOT_DIR = sys.argv[2] if sys.argv[1] == 'snapshot' else None
+import numpy as np
+from ReUnite.face_index import build_face_index
+start = time.perf_counter()
+index = build_face_index()
+index.search(np.zeros(128, dtype = np.float32), 1) # touches every page of the encodings
+print(json.dumps({{'startup_seconds': time.perf_counter() - start, 'size': len(index)}}), flush = True)
+sys.stdin.readline()
+memory = {{}}
+try:
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            name, value = line.split(':', 1)
+            if name in ('Rss', 'Pss', 'Private_Clean', 'Private_Dirty', 'Shared_Clean'):
+                memory[name] = int(value.split()[0]) / 1024 # MB
+except (OSError, ValueError):
+    import resource
+    memory['Rss'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+print(json.dumps(memory), flush = True)
+"""
+
+class Command(BaseCommand):
+    help = ("Writes a snapshot of the stored face encodings (memory-mapped .npy matrix, ids & watermark, see "
+            "face_snapshot.py) into FACE_INDEX_SNAPSHOT_DIR, used by the web workers to load the brute-force face "
+            "index. Run it periodically so that the workers have few encodings to read from the database at startup; "
+            "the face index changes older than FACE_INDEX_CHANGE_RETENTION_DAYS it includes are deleted. --measure then compares --workers processes loading "
+            "the index from the snapshot and from the database : startup time and per worker memory (RSS, and PSS "
+            "where the shared snapshot pages are split between the workers mapping them).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default = None, help = "Snapshot directory (default : FACE_INDEX_SNAPSHOT_DIR).")
+        parser.add_argument('--chunk-size', type = int, default = 2000, help = "Encodings read per query.")
+        parser.add_argument('--measure', action = 'store_true', help = "Also measure the startup time & memory of workers loading the index.")
+        parser.add_argument('--workers', type = int, default = 4, help = "Number of concurrent worker processes measured.")
+
+    def handle(self, *args, **options):
+        directory = options['output'] or getattr(settings, 'FACE_INDEX_SNAPSHOT_DIR', None)
+        if not directory:
+            raise CommandError("No output directory given and FACE_INDEX_SNAPSHOT_DIR is not set.")
+        start = time.perf_counter()
+        path, count, watermark = write_snapshot(directory, options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f"Wrote {count} encoded faces (up to MissingChildEncodedFace ID = {watermark}) to {path} ({time.perf_counter() - start:.1f}s)."))
+        pruned = prune_face_index_changes(SnapshotFaceIndex.open(path).change_sequence)
+        if pruned:
+            self.stdout.write(f"Deleted {pruned} face index change(s) included in the snapshot.")
+        if options['measure']:
+            self.stdout.write(f"{'loaded from':<12} {'workers':>7} {'startup s':>9} {'RSS MB':>8} {'PSS MB':>8} {'private MB':>10}  (per worker)")
+            for mode in ('snapshot', 'database'):
+                self.measure(mode, options['workers'], directory)
+
+    def measure(self, mode, workers, directory):
+        script = PROBE.format(base_dir = str(settings.BASE_DIR))
+        probes = [subprocess.Popen([sys.executable, '-c', script, mode, directory], stdin = subprocess.PIPE, stdout = subprocess.PIPE, text = True) for _ in range(workers)]
+        try:
+            loaded = [json.loads(probe.stdout.readline()) for probe in probes]
+            for probe in probes: # every worker has loaded the index, now they report their memory
+                probe.stdin.write('\n')
+                probe.stdin.flush()
+            memory = [json.loads(probe.stdout.readline()) for probe in probes]
+        except ValueError:
+            raise CommandError(f"A worker failed to load the face index from the {mode}.")
+        finally:
+            for probe in probes:
+                probe.wait()
+        mean = lambda values: sum(values) / len(values)
+        private = mean([m.get('Private_Clean', 0) + m.get('Private_Dirty', 0) for m in memory])
+        self.stdout.write(f"{mode:<12} {workers:>7} {mean([l['startup_seconds'] for l in loaded]):>9.2f} {mean([m['Rss'] for m in memory]):>8.1f} "
+                          f"{mean([m.get('Pss', m['Rss']) for m in memory]):>8.1f} {private:>10.1f}")
@@ -0,0 +1,30 @@
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.http import Http404, HttpResponse
+from django.utils._os import safe_join
+from django.views.static import serve
+from urllib.parse import quote
+import mimetypes, os
+
+# Media files (uploaded & rendition images) are served by serve_media according to MEDIA_SERVING :
+#   'django'           : read & streamed by the Python worker (django.views.static.serve), for development only
+#   'x-accel-redirect' : nginx streams the file from the internal location MEDIA_ACCEL_REDIRECT_PREFIX, e.g.
+#                            location /protected-media/ { internal; alias /path/to/media/; }
+#   'x-sendfile'       : Apache (mod_xsendfile) / lighttpd stream the file at the absolute path given in X-Sendfile
+# so that in production a worker only checks the path and answers with a header, whatever the size of the file.
+
+def serve_media(request, path):
+    mode = getattr(settings, 'MEDIA_SERVING', 'django')
+    if mode == 'django':
+        return serve(request, path, document_root = settings.MEDIA_ROOT)
+    full_path = safe_join(settings.MEDIA_ROOT, path) # raises SuspiciousFileOperation (400) for paths out of MEDIA_ROOT
+    if not os.path.isfile(full_path):
+        raise Http404(f"{path} does not exist.")
+    response = HttpResponse(content_type = mimetypes.guess_type(full_path)[0] or 'application/octet-stream')
+    if mode == 'x-accel-redirect':
+        response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_REDIRECT_PREFIX + quote(path)
+    elif mode == 'x-sendfile':
+        response['X-Sendfile'] = full_path
+    else:
+        raise ImproperlyConfigured(f"MEDIA_SERVING should be 'django', 'x-accel-redirect' or 'x-sendfile', not {mode!r}.")
+    return response
@@ -0,0 +1,307 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from contextlib import contextmanager
+from django.conf import settings
+from django.db import connection
+from django.http import HttpResponse, HttpResponseForbidden
+import atexit, bisect, hmac, json, os, threading, time
+
+# Lightweight in-process counters & histograms exposed in the Prometheus text format on /metrics (see metrics_view),
+# to the scrapers sending the METRICS_TOKEN as a bearer token only. Every process keeps its own values; with
+# METRICS_DIR set, every process also writes them to <METRICS_DIR>/<pid>.json every METRICS_FLUSH_INTERVAL seconds
+# and a scrape served by any of them shows the values of all the processes of the host : counters & histograms summed
+# (those of the exited processes included, so that they never go backwards), gauges labelled with the pid of each
+# running process. Empty METRICS_DIR when the service is (re)started, like the multiprocess mode of prometheus_client.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30) # seconds
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+LAG_BUCKETS = (0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300, 900) # seconds
+
+def label_text(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + '}'
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self._values = {} # sorted label items ---> value
+        self._lock = threading.Lock()
+
+    def inc(self, amount = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._values)
+
+    def merge(self, values, other, pid):
+        for key, value in other.items():
+            values[key] = values.get(key, 0) + value
+
+    def expose(self, values = None):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(f"{self.name}{label_text(key)} {value}" for key, value in sorted((self.snapshot() if values is None else values).items()))
+        return lines
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self._values = {} # sorted label items ---> value
+        self._lock = threading.Lock()
+
+    def set(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = value
+
+    def merge(self, values, other, pid):
+        # a value per process, not a sum
+        for key, value in other.items():
+            values[tuple(sorted(key + (('pid', pid),)))] = value
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, buckets = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self._values = {} # sorted label items ---> [count per bucket (+Inf last), sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            counts_and_sum = self._values.get(key)
+            if counts_and_sum is None:
+                counts_and_sum = self._values[key] = [[0] * (len(self.buckets) + 1), 0]
+            counts_and_sum[0][bisect.bisect_left(self.buckets, value)] += 1
+            counts_and_sum[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def snapshot(self):
+        with self._lock:
+            return {key: [list(counts), total] for key, (counts, total) in self._values.items()}
+
+    def merge(self, values, other, pid):
+        for key, (counts, total) in other.items():
+            if key not in values:
+                values[key] = [[0] * (len(self.buckets) + 1), 0]
+            values[key][0] = [a + b for a, b in zip(values[key][0], counts)]
+            values[key][1] += total
+
+    def expose(self, values = None):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total) in sorted((self.snapshot() if values is None else values).items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{label_text(key + (('le', bound),))} {cumulative}")
+            lines.append(f"{self.name}_sum{label_text(key)} {total}")
+            lines.append(f"{self.name}_count{label_text(key)} {cumulative}")
+        return lines
+
+REQUEST_SECONDS = Histogram('reunite_request_duration_seconds', "Time spent serving a request, per view.")
+REQUEST_DB_QUERIES = Histogram('reunite_request_db_queries', "Database queries run while serving a request, per view.", QUERY_COUNT_BUCKETS)
+STAGE_SECONDS = Histogram('reunite_stage_duration_seconds', "Time spent in a stage of the face search / sighting / notification path.")
+EVENTS = Counter('reunite_events_total', "Outcomes of the face search / sighting / notification path (cache hits, rejections, sent notifications ...).")
+FACE_INDEX_CHANGE_LAG = Histogram('reunite_face_index_change_lag_seconds', "Time between an encoded face being saved / deleted (on any node) and this process applying it to its face index.", LAG_BUCKETS)
+FACE_INDEX_CHANGE_SEQUENCE = Gauge('reunite_face_index_change_sequence', "Last FaceIndexChange id applied to the face index of this process (compare with the other processes).")
+FACE_INDEX_LAST_POLL = Gauge('reunite_face_index_last_poll_timestamp_seconds', "Unix time of the last successful poll of the face index changes (staleness = now - this).")
+METRICS = [REQUEST_SECONDS, REQUEST_DB_QUERIES, STAGE_SECONDS, EVENTS, FACE_INDEX_CHANGE_LAG, FACE_INDEX_CHANGE_SEQUENCE, FACE_INDEX_LAST_POLL]
+
+def stage(name):
+    # with stage('db_fetch'): ... records the time spent in the block
+    return STAGE_SECONDS.time(stage = name)
+
+def record_stage_timings(timings):
+    # timings measured in another process (see encoding_service.timed_encode_faces)
+    for name, seconds in timings.items():
+        STAGE_SECONDS.observe(seconds, stage = name)
+
+def count_event(name, **labels):
+    EVENTS.inc(event = name, **labels)
+
+def metrics_dir():
+    return getattr(settings, 'METRICS_DIR', None)
+
+def write_snapshot(directory):
+    # <directory>/<pid>.json : {metric name: [[label items, value], ...]}, replaced atomically
+    snapshot = {metric.name: [[list(map(list, key)), value] for key, value in metric.snapshot().items()] for metric in METRICS}
+    path = os.path.join(directory, f'{os.getpid()}.json')
+    temporary_path = f'{path}.{threading.get_ident()}.tmp' # the flush thread and atexit may write at the same time
+    with open(temporary_path, 'w') as f:
+        json.dump(snapshot, f)
+    os.replace(temporary_path, path)
+
+def process_running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def read_snapshots(directory):
+    # [(pid, running, {metric name: {label items: value}})] of the other processes sharing directory
+    snapshots = []
+    for name in os.listdir(directory):
+        pid = name[:-len('.json')]
+        if not name.endswith('.json') or not pid.isdigit() or int(pid) == os.getpid():
+            continue
+        try:
+            with open(os.path.join(directory, name)) as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError): # replaced or removed meanwhile
+            continue
+        values = {metric_name: {tuple(map(tuple, key)): value for key, value in items} for metric_name, items in snapshot.items()}
+        snapshots.append((int(pid), process_running(int(pid)), values))
+    return snapshots
+
+def exposition():
+    directory = metrics_dir()
+    if not directory:
+        return '\n'.join(line for metric in METRICS for line in metric.expose()) + '\n'
+    snapshots = read_snapshots(directory)
+    lines = []
+    for metric in METRICS:
+        values = {}
+        metric.merge(values, metric.snapshot(), os.getpid())
+        for pid, running, snapshot in snapshots:
+            if running or not isinstance(metric, Gauge): # the gauges of an exited process are meaningless
+                metric.merge(values, snapshot.get(metric.name, {}), pid)
+        lines.extend(metric.expose(values))
+    return '\n'.join(lines) + '\n'
+
+_flusher_pid = None
+_flusher_lock = threading.Lock()
+
+def share_metrics():
+    # Starts (once per process, again in a forked child) the thread writing the values of this process to METRICS_DIR
+    global _flusher_pid
+    directory = metrics_dir()
+    if not directory:
+        return
+    with _flusher_lock:
+        if _flusher_pid == os.getpid():
+            return
+        forked = _flusher_pid is not None
+        _flusher_pid = os.getpid()
+    os.makedirs(directory, exist_ok = True)
+    interval = getattr(settings, 'METRICS_FLUSH_INTERVAL', 5)
+    def flush_forever():
+        while True:
+            time.sleep(interval)
+            try:
+                write_snapshot(directory)
+            except OSError:
+                pass
+    threading.Thread(target = flush_forever, name = 'metrics-flush', daemon = True).start()
+    if not forked: # registered once, inherited by the forked workers
+        atexit.register(write_snapshot, directory) # the last values of an exiting worker
+
+def after_fork_in_child():
+    # A worker forked from a preloaded application starts from zero (the values of the parent are in its own file) and
+    # gets a flush thread of its own
+    global _flusher_lock
+    _flusher_lock = threading.Lock()
+    if _flusher_pid is None:
+        return
+    for metric in METRICS:
+        metric._lock = threading.Lock()
+        metric._values = {}
+    share_metrics()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child = after_fork_in_child)
+
+def authorized(authorization_header):
+    # 'Bearer <METRICS_TOKEN>' ; no METRICS_TOKEN set = the metrics are served to nobody
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    return bool(token) and hmac.compare_digest((authorization_header or '').encode(), f'Bearer {token}'.encode())
+
+def serve_metrics(port):
+    # Serves /metrics from a background thread, for the processes that aren't web workers (dispatch_notifications)
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if not authorized(self.headers.get('Authorization')):
+                self.send_response(403)
+                self.end_headers()
+                return
+            body = exposition().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+    server = ThreadingHTTPServer(('', port), MetricsHandler)
+    threading.Thread(target = server.serve_forever, daemon = True).start()
+    return server
+
+def metrics_view(request):
+    # Behind the reverse proxy every request comes from its address : a token is required, not a client address
+    if not authorized(request.META.get('HTTP_AUTHORIZATION')):
+        return HttpResponseForbidden()
+    return HttpResponse(exposition(), content_type = 'text/plain; version=0.0.4; charset=utf-8')
+
+class MetricsMiddleware:
+    # Records the latency and the number of database queries of every request, labelled with the view's URL name.
+    # Async capable, so that the requests of the async views (see asgi.py) don't each hold a thread for this
+    # middleware; their queries run in other threads though, so only their latency is recorded.
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        share_metrics()
+        if iscoroutinefunction(get_response): # marks the instance as a coroutine function for Django
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        query_count = [0]
+        def count_query(execute, sql, params, many, context):
+            query_count[0] += 1
+            return execute(sql, params, many, context)
+        start = time.perf_counter()
+        with connection.execute_wrapper(count_query):
+            response = self.get_response(request)
+        view = self.view_name(request)
+        if view != 'metrics':
+            REQUEST_SECONDS.observe(time.perf_counter() - start, view = view, method = request.method, status = response.status_code)
+            REQUEST_DB_QUERIES.observe(query_count[0], view = view)
+        return response
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        response = await self.get_response(request)
+        view = self.view_name(request)
+        if view != 'metrics':
+            REQUEST_SECONDS.observe(time.perf_counter() - start, view = view, method = request.method, status = response.status_code)
+        return response
+
+    def view_name(self, request):
+        resolver_match = getattr(request, 'resolver_match', None)
+        return resolver_match.view_name if resolver_match else 'unresolved'
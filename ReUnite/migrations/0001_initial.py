@@ -0,0 +1,104 @@
+# Generated by Django 3.2.25 on 2026-10-18 20:14
+
+import ReUnite.models
+from django.conf import settings
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+import phonenumber_field.modelfields
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MissingChild',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('full_name', models.CharField(help_text='Fullname should be in the format :- First Name Last Name', max_length=60)),
+                ('child_aadhar_no', models.BigIntegerField(blank=True, null=True, validators=[django.core.validators.MinValueValidator(200000000000), django.core.validators.MaxValueValidator(999999999999)], verbose_name='Aadhar no.')),
+                ('gender', models.CharField(choices=[('M', 'Male'), ('F', 'Female'), ('T', 'Transgender')], default=None, max_length=1, null=True)),
+                ('age', models.PositiveIntegerField(help_text="Age of the child as of now [ in year(s) ]. Note :- Please don't type the unit i.e., year(s).", validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(12)])),
+                ('father_name', models.CharField(max_length=60, verbose_name="Father's name")),
+                ('mother_name', models.CharField(max_length=60, verbose_name="Mother's name")),
+                ('nationality', models.CharField(max_length=60)),
+                ('mother_tongue', models.CharField(blank=True, max_length=60)),
+                ('child_image', models.ImageField(help_text='Image must contains front face. It should be in .jpg or .png format having size range [ 1 MB - 5 MB ].', upload_to='missing_child_images', validators=[django.core.validators.FileExtensionValidator(allowed_extensions=['jpg', 'png']), ReUnite.models.validate_image_size])),
+                ('residential_address', models.CharField(help_text='Permanent address should be entered containing house no. , road name , village / town name , post office / police station name.', max_length=255)),
+                ('district', models.CharField(max_length=60)),
+                ('state', models.CharField(max_length=30)),
+                ('pincode', models.PositiveIntegerField(validators=[django.core.validators.MinValueValidator(110001), django.core.validators.MaxValueValidator(999999)])),
+                ('parent_mobile_no', phonenumber_field.modelfields.PhoneNumberField(max_length=13, region=None)),
+                ('parent_email', models.EmailField(blank=True, max_length=50)),
+                ('parent_aadhar_no', models.BigIntegerField(validators=[django.core.validators.MinValueValidator(200000000000), django.core.validators.MaxValueValidator(999999999999)])),
+                ('missing_from_place', models.CharField(max_length=60)),
+                ('police_station_nearby_missing_place', models.CharField(max_length=60)),
+                ('missing_from_date', models.DateField()),
+                ('missing_from_time', models.TimeField()),
+                ('missing_cause', models.CharField(choices=[('R', 'Runaway'), ('L', 'Lost'), ('T', 'Trafficked'), ('K', 'Kidnapped'), ('Nl', 'Not listed')], default=None, max_length=2, null=True)),
+                ('additional_info', models.TextField(max_length=500, verbose_name='Detailed Information related to event of Missing (in 500 words)')),
+                ('height', models.DecimalField(decimal_places=2, help_text="Height should be in [ M feet(s) . N inch(es) OR M feet(s) ] format. For example, 4.10 resembles 4 feet 10 inches in our database. Note :- Please don't type the units i.e., feet(s) & inch(es).", max_digits=3, validators=[django.core.validators.MinValueValidator(2.6), django.core.validators.MaxValueValidator(5)])),
+                ('weight', models.PositiveIntegerField(help_text="Weight should be in kg(s) only. Omit the gram(s) if any present. For example, if wish to enter is 21.5 kg(s), just type 21 and omit the decimal part which is in gram(s). Note :- Please don't type the unit i.e., kg(s).", validators=[django.core.validators.MinValueValidator(10), django.core.validators.MaxValueValidator(80)])),
+                ('complexion', models.CharField(choices=[('D', 'Dark'), ('F', 'Fair'), ('Vf', 'Very fair')], default=None, max_length=2, null=True)),
+                ('build', models.CharField(choices=[('F', 'Fat'), ('N', 'Normal'), ('T', 'Thin')], default=None, max_length=1, null=True)),
+                ('eye_color', models.CharField(choices=[('Nm', 'Normal'), ('Bl', 'Blue'), ('Br', 'Brown'), ('R', 'Reddish'), ('G', 'Green'), ('Nl', 'Not listed')], default=None, max_length=2, null=True)),
+                ('hair_color', models.CharField(choices=[('Br', 'Brown'), ('Cb', 'Curly black'), ('Bl', 'Black'), ('Nl', 'Not listed')], default=None, max_length=2, null=True)),
+                ('upper_wearing_apparel', models.CharField(blank=True, max_length=60, verbose_name='Wearing Upper Apparel')),
+                ('lower_wearing_apparel', models.CharField(blank=True, max_length=60, verbose_name='Wearing Lower Apparel')),
+                ('footwear', models.CharField(blank=True, max_length=60)),
+                ('identification_marks', models.CharField(blank=True, max_length=100)),
+                ('deformities', models.CharField(choices=[('D', 'Deaf'), ('B', 'Blind'), ('Se', 'Squint eyes'), ('Fe', 'Finger(s) extra'), ('G', 'Goitre'), ('Hm', 'Hand missing'), ('Lm', 'Leg missing'), ('Nl', 'Not listed')], default=None, max_length=2, null=True)),
+                ('habits', models.CharField(blank=True, max_length=100)),
+                ('user', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'Missing Child Info',
+            },
+        ),
+        migrations.CreateModel(
+            name='SightedChild',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sighted_child_full_name', models.CharField(blank=True, help_text='Fullname should be in the format :- First Name Last Name', max_length=60, verbose_name='Full name')),
+                ('sighted_child_age', models.PositiveIntegerField(blank=True, help_text="Age of the child as of now [ in year(s) ]. Note :- Please don't type the unit i.e., year(s).", null=True, validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(12)], verbose_name='Age')),
+                ('sighted_date', models.DateField()),
+                ('sighted_time', models.TimeField()),
+                ('sighted_location', models.CharField(max_length=60)),
+                ('sighted_child_image', models.ImageField(help_text='Image must contains front face. It should be in .jpg or .png format having size range [ 1 MB - 5 MB ].', upload_to='sighted_child_images', validators=[django.core.validators.FileExtensionValidator(allowed_extensions=['jpg', 'png']), ReUnite.models.validate_image_size])),
+                ('match_found', models.BooleanField(default=False)),
+                ('user', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'Sighted Child Info',
+            },
+        ),
+        migrations.CreateModel(
+            name='Profile',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_mobile_no', phonenumber_field.modelfields.PhoneNumberField(max_length=13, region=None, unique=True)),
+                ('image', models.ImageField(default='default.png', upload_to='user_profile_pics')),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'User Profile Info',
+            },
+        ),
+        migrations.CreateModel(
+            name='MissingChildEncodedFace',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('child_encoded_face', models.BinaryField()),
+                ('missing_child', models.OneToOneField(null=True, on_delete=django.db.models.deletion.CASCADE, to='ReUnite.missingchild')),
+            ],
+            options={
+                'verbose_name_plural': 'Missing Child Encoded Faces',
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-18 20:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ReUnite', '0002_notificationoutbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='missingchild',
+            name='source_reference',
+            field=models.CharField(blank=True, editable=False, help_text='Case reference of a record bulk imported from a partner agency.', max_length=100, null=True, unique=True),
+        ),
+    ]
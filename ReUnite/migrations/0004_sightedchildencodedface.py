@@ -0,0 +1,25 @@
+# Generated by Django 3.2.25 on 2026-10-18 20:10
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ReUnite', '0003_missingchild_source_reference'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SightedChildEncodedFace',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('child_encoded_face', models.BinaryField()),
+                ('sighted_child', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to='ReUnite.sightedchild')),
+            ],
+            options={
+                'verbose_name_plural': 'Sighted Child Encoded Faces',
+            },
+        ),
+    ]
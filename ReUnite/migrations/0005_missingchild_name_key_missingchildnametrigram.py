@@ -0,0 +1,52 @@
+# Generated by Django 3.2.25 on 2026-10-18 20:10
+
+from django.db import migrations, models
+import django.db.models.deletion
+from ReUnite.name_search import name_trigrams, normalize_name
+
+
+def index_names(apps, schema_editor):
+    # name_key & trigrams of the missing children reported before the name search (as 'manage.py rebuild_name_index')
+    MissingChild = apps.get_model('ReUnite', 'MissingChild')
+    MissingChildNameTrigram = apps.get_model('ReUnite', 'MissingChildNameTrigram')
+    children = list(MissingChild.objects.only('pk', 'full_name'))
+    for child in children:
+        child.name_key = normalize_name(child.full_name)
+    MissingChild.objects.bulk_update(children, ['name_key'], batch_size = 500)
+    trigram_rows = []
+    for child in children:
+        trigrams = name_trigrams(child.name_key)
+        trigram_rows.extend(MissingChildNameTrigram(missing_child_id = child.pk, trigram = trigram, name_trigram_count = len(trigrams)) for trigram in trigrams)
+    MissingChildNameTrigram.objects.bulk_create(trigram_rows, batch_size = 1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ReUnite', '0004_sightedchildencodedface'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='missingchild',
+            name='name_key',
+            field=models.CharField(blank=True, editable=False, help_text='Normalized full name used by the name search.', max_length=60),
+        ),
+        migrations.CreateModel(
+            name='MissingChildNameTrigram',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('trigram', models.CharField(max_length=3)),
+                ('name_trigram_count', models.PositiveSmallIntegerField(default=0, help_text='Number of trigrams of the name, for the similarity computed by the database.')),
+                ('missing_child', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='ReUnite.missingchild')),
+            ],
+            options={
+                'verbose_name_plural': 'Missing Child Name Trigrams',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='missingchildnametrigram',
+            index=models.Index(fields=['trigram', 'missing_child'], name='ReUnite_mis_trigram_3ba4d4_idx'),
+        ),
+        migrations.RunPython(index_names, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-18 20:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ReUnite', '0005_missingchild_name_key_missingchildnametrigram'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sightedchild',
+            name='face_location',
+            field=models.CharField(blank=True, editable=False, help_text="Box (top, right, bottom, left) of this child's face, in pixels of the stored image, when it is one of the faces of a group photo.", max_length=30),
+        ),
+    ]
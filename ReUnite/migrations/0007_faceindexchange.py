@@ -0,0 +1,26 @@
+# Generated by Django 3.2.25 on 2026-10-18 20:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ReUnite', '0006_sightedchild_face_location'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FaceIndexChange',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('missing_child_id', models.PositiveIntegerField(blank=True, null=True)),
+                ('sighted_child_id', models.PositiveIntegerField(blank=True, null=True)),
+                ('action', models.CharField(choices=[('S', 'Saved'), ('D', 'Deleted')], max_length=1)),
+                ('changed_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Face Index Changes',
+            },
+        ),
+    ]
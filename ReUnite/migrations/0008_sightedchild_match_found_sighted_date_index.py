@@ -0,0 +1,17 @@
+# Generated by Django 3.2.25 on 2026-10-18 20:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ReUnite', '0007_faceindexchange'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='sightedchild',
+            index=models.Index(fields=['match_found', 'sighted_date'], name='ReUnite_sig_match_f_949520_idx'),
+        ),
+    ]
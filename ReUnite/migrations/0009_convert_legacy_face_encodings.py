@@ -0,0 +1,16 @@
+# Generated by Django 3.2.25 on 2026-10-18 20:30
+
+from django.db import migrations
+from ReUnite.face_codec import convert_legacy_encodings
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ReUnite', '0008_sightedchild_match_found_sighted_date_index'),
+    ]
+
+    operations = [
+        # the face encodings stored as raw float64 arrays are rewritten in the versioned format (see face_codec.py)
+        migrations.RunPython(convert_legacy_encodings, migrations.RunPython.noop),
+    ]
@@ -3,7 +3,11 @@ from django.contrib.auth.models import User
 from phonenumber_field.modelfields import PhoneNumberField
 from django.core.validators import MinValueValidator, MaxValueValidator, FileExtensionValidator
 from django.core.exceptions import ValidationError
+from django.utils import timezone
 from PIL import Image
+from .image_pipeline import fit_image_field, MAX_IMAGE_SIZE
+from .name_search import normalize_name
+from .thumbnails import generate_renditions_on_commit, uploaded_renditions
 
 class Profile(models.Model):
     user = models.OneToOneField(User, on_delete = models.CASCADE)
@@ -15,13 +19,9 @@ class Profile(models.Model):
     def __str__(self):
         return f"(ID = {self.id}) ---> {self.user.username} ' s Profile (ForeignKey User ID = {self.user_id})"
 
-    def save(self):
-        super().save()
-        img = Image.open(self.image.path)
-        if img.width > 225 or img.height > 225:
-            output_size = (225, 225)
-            img.thumbnail(output_size)
-        img.save(self.image.path)
+    def save(self, *args, **kwargs):
+        fit_image_field(self.image, 225, Image.BICUBIC)
+        super().save(*args, **kwargs)
 
 def validate_image_size(image):
     min_size = 1 * 1024 * 1024
@@ -74,20 +74,39 @@ class MissingChild(models.Model):
     DEFORMITIES = (('D', 'Deaf'), ('B', 'Blind'), ('Se', 'Squint eyes'), ('Fe', 'Finger(s) extra'), ('G', 'Goitre'), ('Hm', 'Hand missing'), ('Lm', 'Leg missing'), ('Nl', 'Not listed'))
     deformities = models.CharField(max_length = 2, choices = DEFORMITIES, default = None,  null = True)
     habits = models.CharField(max_length = 100, blank = True)
+    source_reference = models.CharField(max_length = 100, unique = True, null = True, blank = True, editable = False, help_text = "Case reference of a record bulk imported from a partner agency.")
+    name_key = models.CharField(max_length = 60, blank = True, editable = False, help_text = "Normalized full name used by the name search.")
 
     class Meta:
         verbose_name_plural = "Missing Child Info"
+        # No secondary index : missing children are only read by primary key, the face search prefilter runs in memory
+        # (see face_filters.py) and the name search goes through MissingChildNameTrigram. Checked by
+        # 'python manage.py audit_query_plans'.
 
     def __str__(self):
         return f"(ID = {self.id}) ---> {self.user.username} ' s Child Info (ForeignKey User ID = {self.user_id})"
 
     def save(self, *args, **kwargs):
+        new_image = bool(self.child_image) and not self.child_image._committed
+        renditions = uploaded_renditions(self.child_image)
+        fit_image_field(self.child_image, MAX_IMAGE_SIZE)
+        self.name_key = normalize_name(self.full_name)
         super().save(*args, **kwargs)
-        img = Image.open(self.child_image.path)
-        if img.width > 1600 or img.height > 1600:
-            output_size = (1600, 1600)
-            img.thumbnail(output_size, Image.LANCZOS)
-        img.save(self.child_image.path)
+        if new_image: # renditions of an already stored image are left as they are
+            generate_renditions_on_commit(self.child_image, renditions)
+
+class MissingChildNameTrigram(models.Model):
+    # kept in sync with MissingChild.name_key by signals.py (see name_search.py)
+    missing_child = models.ForeignKey(MissingChild, on_delete = models.CASCADE)
+    trigram = models.CharField(max_length = 3)
+    name_trigram_count = models.PositiveSmallIntegerField(default = 0, help_text = "Number of trigrams of the name, for the similarity computed by the database.")
+
+    class Meta:
+        verbose_name_plural = "Missing Child Name Trigrams"
+        indexes = [models.Index(fields = ['trigram', 'missing_child'])]
+
+    def __str__(self):
+        return f"(ID = {self.id}) ---> '{self.trigram}' of Missing Child ID = {self.missing_child_id}"
 
 class MissingChildEncodedFace(models.Model):
     missing_child = models.OneToOneField(MissingChild, on_delete = models.CASCADE, null = True)
@@ -99,6 +118,25 @@ class MissingChildEncodedFace(models.Model):
     def __str__(self):
         return f"(ID = {self.id}) ---> {self.missing_child.full_name} ' s Encoded Face (ForeignKey Missing Child ID = {self.missing_child_id})"
 
+class FaceIndexChange(models.Model):
+    # Change feed of MissingChildEncodedFace (missing_child_id set) and of the unmatched sightings searched by the
+    # reverse matching (sighted_child_id set) : its id is the sequence number every web worker follows to apply the
+    # encodings saved / deleted by the other workers & nodes to its in-process indexes (see face_index_changes.py).
+    # Not ForeignKeys : the rows of the deleted children are kept.
+    missing_child_id = models.PositiveIntegerField(null = True, blank = True)
+    sighted_child_id = models.PositiveIntegerField(null = True, blank = True)
+    ACTION = (('S', 'Saved'), ('D', 'Deleted'))
+    action = models.CharField(max_length = 1, choices = ACTION)
+    changed_at = models.DateTimeField(auto_now_add = True, db_index = True)
+
+    class Meta:
+        verbose_name_plural = "Face Index Changes"
+
+    def __str__(self):
+        if self.sighted_child_id is not None:
+            return f"(ID = {self.id}) ---> Encoded Face of Sighted Child ID = {self.sighted_child_id} {self.get_action_display()}"
+        return f"(ID = {self.id}) ---> Encoded Face of Missing Child ID = {self.missing_child_id} {self.get_action_display()}"
+
 class SightedChild(models.Model):
     user = models.ForeignKey(User, on_delete = models.CASCADE, null = True)
     sighted_child_full_name = models.CharField(max_length = 60, blank = True, verbose_name = "Full name", help_text = "Fullname should be in the format :- First Name Last Name")
@@ -108,17 +146,52 @@ class SightedChild(models.Model):
     sighted_location = models.CharField(max_length = 60)
     sighted_child_image = models.ImageField(upload_to = 'sighted_child_images', help_text = "Image must contains front face. It should be in .jpg or .png format having size range [ 1 MB - 5 MB ].", validators = [FileExtensionValidator(allowed_extensions = ['jpg', 'png']), validate_image_size])
     match_found = models.BooleanField(default = False)
+    face_location = models.CharField(max_length = 30, blank = True, editable = False, help_text = "Box (top, right, bottom, left) of this child's face, in pixels of the stored image, when it is one of the faces of a group photo.")
 
     class Meta:
         verbose_name_plural = "Sighted Child Info"
+        # unmatched sightings, by date (listings, reverse matching, loading the sighting index)
+        indexes = [models.Index(fields = ['match_found', 'sighted_date'])]
 
     def __str__(self):
         return f"(ID = {self.id}) ---> {self.user.username} ' s Child Info (ForeignKey User ID = {self.user_id})"
 
-    def save(self):
-        super().save()
-        img = Image.open(self.sighted_child_image.path)
-        if img.width > 1600 or img.height > 1600:
-            output_size = (1600, 1600)
-            img.thumbnail(output_size, Image.LANCZOS)
-        img.save(self.sighted_child_image.path)
+    def save(self, *args, **kwargs):
+        new_image = bool(self.sighted_child_image) and not self.sighted_child_image._committed
+        renditions = uploaded_renditions(self.sighted_child_image)
+        fit_image_field(self.sighted_child_image, MAX_IMAGE_SIZE)
+        super().save(*args, **kwargs)
+        if new_image:
+            generate_renditions_on_commit(self.sighted_child_image, renditions)
+
+class SightedChildEncodedFace(models.Model):
+    sighted_child = models.OneToOneField(SightedChild, on_delete = models.CASCADE)
+    child_encoded_face = models.BinaryField()
+
+    class Meta:
+        verbose_name_plural = "Sighted Child Encoded Faces"
+
+    def __str__(self):
+        return f"(ID = {self.id}) ---> Encoded Face of Sighted Child ID = {self.sighted_child_id}"
+
+class NotificationOutbox(models.Model):
+    sighted_child = models.ForeignKey(SightedChild, on_delete = models.SET_NULL, null = True, blank = True)
+    CHANNEL = (('E', 'Email'), ('S', 'SMS'))
+    channel = models.CharField(max_length = 1, choices = CHANNEL)
+    recipient = models.CharField(max_length = 254, help_text = "Email address for Email, mobile no. without country code for SMS.")
+    subject = models.CharField(max_length = 255, blank = True)
+    message = models.TextField()
+    STATUS = (('P', 'Pending'), ('S', 'Sent'), ('F', 'Failed'))
+    status = models.CharField(max_length = 1, choices = STATUS, default = 'P')
+    attempts = models.PositiveIntegerField(default = 0)
+    next_attempt_at = models.DateTimeField(default = timezone.now) # also used as the lease of a dispatcher working on it
+    last_error = models.TextField(blank = True)
+    created_at = models.DateTimeField(auto_now_add = True)
+    sent_at = models.DateTimeField(null = True, blank = True)
+
+    class Meta:
+        verbose_name_plural = "Notification Outbox"
+        indexes = [models.Index(fields = ['status', 'next_attempt_at'])]
+
+    def __str__(self):
+        return f"(ID = {self.id}) ---> {self.get_channel_display()} to {self.recipient} ({self.get_status_display()}, {self.attempts} attempt(s))"
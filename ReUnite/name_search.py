@@ -0,0 +1,97 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Count, F, FloatField, Max, Value
+from django.db.models.functions import Cast
+import hashlib, math, re, time, unicodedata
+
+# Fuzzy name search : every MissingChild has a normalized name_key and one MissingChildNameTrigram row per trigram of
+# it, which also holds the number of trigrams of the name. A query only reads the trigram rows it shares with the stored
+# names (through the trigram index), and the database computes the trigram similarity of each name from them, ranks
+# the names and returns the top ones only : misspelled and partial names are found without scanning the MissingChild
+# table, and however common the searched trigrams are, no more than limit names leave the database. The results are
+# cached in NAME_SEARCH_CACHE until a MissingChild is saved or deleted (see signals.py).
+
+GENERATION_KEY = 'name_search:generation'
+
+def normalize_name(name):
+    # ' Raví  KUMAR.' ---> 'ravi kumar'
+    name = unicodedata.normalize('NFKD', name or '')
+    name = ''.join(c for c in name if not unicodedata.combining(c))
+    return ' '.join(re.findall(r'[^\W_]+', name.lower()))
+
+def name_trigrams(name_key):
+    # Same as PostgreSQL's pg_trgm : every word is padded with two spaces in front and one behind
+    trigrams = set()
+    for word in name_key.split():
+        padded = f"  {word} "
+        trigrams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return trigrams
+
+def sync_name_trigrams(names):
+    # names : {missing_child_id: name_key}. Only the trigram rows that changed are deleted / inserted (and the trigram
+    # count of the kept ones updated), so re-saving a MissingChild with the same name costs a single query.
+    from .models import MissingChildNameTrigram
+    existing = {}
+    for missing_child_id, trigram in MissingChildNameTrigram.objects.filter(missing_child_id__in = list(names)).values_list('missing_child_id', 'trigram'):
+        existing.setdefault(missing_child_id, set()).add(trigram)
+    removed = []
+    added = []
+    for missing_child_id, name_key in names.items():
+        old = existing.get(missing_child_id, set())
+        new = name_trigrams(name_key)
+        removed.extend((missing_child_id, trigram) for trigram in old - new)
+        added.extend(MissingChildNameTrigram(missing_child_id = missing_child_id, trigram = trigram, name_trigram_count = len(new)) for trigram in new - old)
+        if old & new and len(old) != len(new):
+            MissingChildNameTrigram.objects.filter(missing_child_id = missing_child_id, trigram__in = list(old & new)).update(name_trigram_count = len(new))
+    for missing_child_id in {missing_child_id for missing_child_id, _ in removed}:
+        MissingChildNameTrigram.objects.filter(missing_child_id = missing_child_id, trigram__in = [trigram for i, trigram in removed if i == missing_child_id]).delete()
+    MissingChildNameTrigram.objects.bulk_create(added)
+
+def similar_names(query_trigrams, min_similarity, limit = None):
+    # (missing_child_id, similarity) of the names whose trigram similarity to the query is at least min_similarity,
+    # most similar first : shared trigrams / (query trigrams + name trigrams - shared trigrams), computed on the
+    # trigram rows the names share with the query. A similarity of at least min_similarity implies sharing at least
+    # min_similarity * len(query_trigrams) trigrams, which is checked first.
+    from .models import MissingChildNameTrigram
+    min_shared = max(1, math.ceil(min_similarity * len(query_trigrams) - 1e-9))
+    names = (MissingChildNameTrigram.objects.filter(trigram__in = query_trigrams)
+                                            .values('missing_child_id')
+                                            .annotate(shared = Count('id'), name_trigram_count = Max('name_trigram_count'))
+                                            .annotate(similarity = Cast(F('shared'), FloatField()) / (Value(len(query_trigrams)) + F('name_trigram_count') - F('shared')))
+                                            .filter(shared__gte = min_shared, similarity__gte = min_similarity - 1e-9)
+                                            .order_by('-similarity', 'missing_child_id')
+                                            .values_list('missing_child_id', 'similarity'))
+    return names[:limit] if limit else names
+
+def search_names(query, limit = None, min_similarity = None):
+    # Returns [(missing_child_id, similarity)], most similar name first, for the names whose trigram similarity to the
+    # query is at least min_similarity (1.0 = same normalized name).
+    if min_similarity is None:
+        min_similarity = settings.NAME_SEARCH_MIN_SIMILARITY
+    query_trigrams = name_trigrams(normalize_name(query))
+    if not query_trigrams:
+        return []
+    return list(similar_names(query_trigrams, min_similarity, limit))
+
+def name_search_cache():
+    return caches[getattr(settings, 'NAME_SEARCH_CACHE', 'default')]
+
+def new_generation():
+    # A generation is the time it was started at : unlike a counter, a generation key culled from the cache (or lost
+    # with it) is never restarted at a value whose cached results may be stale.
+    return time.time_ns()
+
+def invalidate_name_searches():
+    # Starts a new generation of cached results : the ones cached so far are never read again and expire on their own
+    name_search_cache().set(GENERATION_KEY, new_generation(), timeout = None)
+
+def cached_search_names(query, limit = None, min_similarity = None):
+    cache = name_search_cache()
+    generation = cache.get_or_set(GENERATION_KEY, new_generation, timeout = None)
+    query_digest = hashlib.sha1(normalize_name(query).encode()).hexdigest()
+    key = f"name_search:{generation}:{limit}:{min_similarity}:{query_digest}"
+    results = cache.get(key)
+    if results is None:
+        results = search_names(query, limit, min_similarity)
+        cache.set(key, results, timeout = getattr(settings, 'NAME_SEARCH_CACHE_TIMEOUT', 600))
+    return results
@@ -0,0 +1,123 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction, connection
+from django.utils import timezone
+from requests.adapters import HTTPAdapter
+from .models import NotificationOutbox
+from .metrics import stage, count_event
+import phonenumbers, requests
+
+def sighting_notifications(matched_child, sighting):
+    # Email & SMS (unsaved NotificationOutbox objects) telling the parent of matched_child that their child has
+    # been sighted, sighting.user being the person who reported the sighting.
+    sighted_by = sighting.user
+    mail_msg = f"Hi {matched_child.user.first_name},\n\nYour missing child {matched_child.full_name} is sighted at {sighting.sighted_location} on {sighting.sighted_date.strftime('%d-%b-%Y')} {sighting.sighted_time.strftime('%I:%M %p')}. Your child has been sighted by {sighted_by.first_name}. Our website uses Face Recognition as Image Processing technique to compare between two faces i.e., between a sighted child image & list of all missing child images stored on our server's database. Face Recognition algorithm is triggered on our website as soon as Sighted Child form is submitted with an image of sighted child.\n\nYou've got this notification mail because your missing child's face is most probably matching with the sighted child's face uploaded by {sighted_by.first_name} through Sighted Child form on our website. Our team is trying its best to provide all the details of sighted user ({sighted_by.first_name}) as well as sighted child matched with your missing child.\n\nThe team is sharing some of the basic details of {sighted_by.first_name} which can be used for any sort of further communication for gaining detailed information about the sighted events.\n\nBasic details of {sighted_by.first_name} (Sighted User) are :-\n\nFull Name : {sighted_by.first_name} {sighted_by.last_name}\nEmail : {sighted_by.email}\nMobile No. : {sighted_by.profile.user_mobile_no}\n\nSighted Child details are :-\n\nFull Name : {sighting.sighted_child_full_name}            (This field can be empty when sighted user doesn't know the sighted child's name.)\nAge :           {sighting.sighted_child_age} yr.                 (This field can be None when sighted user doesn't know the sighted child's age.)\nSighted Date : {sighting.sighted_date.strftime('%d-%b-%Y')}\nSighted Time : {sighting.sighted_time.strftime('%I:%M %p')}\nSighted Location : {sighting.sighted_location}\n\nThanks & Regards,\nReUnite Team"
+
+    sms_msg = f"Hi {matched_child.user.first_name},\n\nYour missing child {matched_child.full_name} is sighted at {sighting.sighted_location} on {sighting.sighted_date.strftime('%d-%b-%Y')} {sighting.sighted_time.strftime('%I:%M %p')}. An email has been sent to your registered Email ID for detailed information about sighted child as well as sighted user.\n\nThanks and Regards,\nReUnite Team"
+
+    x = phonenumbers.parse(f"{matched_child.user.profile.user_mobile_no}")
+    user_mobile_no_with_country_prefix_code_0 = str(phonenumbers.format_number(x, phonenumbers.PhoneNumberFormat.NATIONAL)).replace(" ", "")
+    user_mobile_no_without_country_prefix_code = int(user_mobile_no_with_country_prefix_code_0[1:])
+
+    return [NotificationOutbox(sighted_child = sighting, channel = 'E', recipient = matched_child.user.email, message = mail_msg,
+                               subject = "Greetings, your missing child has been sighted by someone..."),
+            NotificationOutbox(sighted_child = sighting, channel = 'S', recipient = user_mobile_no_without_country_prefix_code, message = sms_msg)]
+
+LEASE = timedelta(minutes = 5) # a claimed notification is retried after this if its dispatcher died while sending it
+
+def retry_delay(attempts):
+    # exponential backoff : 30s, 1m, 2m, 4m ... capped at 1 hour
+    return timedelta(seconds = min(getattr(settings, 'NOTIFICATION_RETRY_BASE_DELAY', 30) * 2 ** (attempts - 1), 3600))
+
+def due_notifications(now):
+    # Pending notifications whose next attempt is due, the most overdue first
+    return NotificationOutbox.objects.filter(status = 'P', next_attempt_at__lte = now).order_by('next_attempt_at')
+
+def claim_due_notifications(batch_size):
+    # Pending notifications whose next attempt is due are leased to this dispatcher by pushing next_attempt_at
+    # forward, so that several dispatchers can run side by side without sending anything twice.
+    now = timezone.now()
+    with transaction.atomic():
+        due = due_notifications(now)
+        if connection.features.has_select_for_update_skip_locked:
+            due = due.select_for_update(skip_locked = True)
+        claimed = list(due[:batch_size])
+        NotificationOutbox.objects.filter(pk__in = [notification.pk for notification in claimed]).update(next_attempt_at = now + LEASE)
+    return claimed
+
+def send_emails(notifications):
+    # All the emails of one worker go through a single SMTP connection.
+    try:
+        mail_connection = get_connection()
+        mail_connection.open()
+    except Exception as e:
+        return [(notification, e) for notification in notifications]
+    results = []
+    try:
+        for notification in notifications:
+            try:
+                with stage('smtp'):
+                    EmailMessage(subject = notification.subject, body = notification.message, from_email = "ReUnite Team",
+                                 to = [notification.recipient], connection = mail_connection).send()
+                results.append((notification, None))
+            except Exception as e:
+                results.append((notification, e))
+    finally:
+        mail_connection.close()
+    return results
+
+def sms_session(pool_size):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections = 1, pool_maxsize = pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update({
+        'authorization': settings.SMS_GATEWAY_AUTHORIZATION,
+        'Cache-Control': "no-cache",
+        })
+    return session
+
+def send_sms(session, notification):
+    try:
+        with stage('sms_post'):
+            response = session.post(settings.SMS_GATEWAY_URL,
+                                    data = {'sender_id': "FSTSMS", 'message': notification.message, 'language': "english", 'route': "p", 'numbers': notification.recipient},
+                                    timeout = getattr(settings, 'SMS_GATEWAY_TIMEOUT', 10))
+        response.raise_for_status()
+        return notification, None
+    except requests.RequestException as e:
+        return notification, e
+
+def record_result(notification, error):
+    notification.attempts += 1
+    if error is None:
+        notification.status = 'S'
+        notification.sent_at = timezone.now()
+        notification.last_error = ""
+    elif notification.attempts >= getattr(settings, 'NOTIFICATION_MAX_ATTEMPTS', 5):
+        notification.status = 'F'
+        notification.last_error = repr(error)
+    else:
+        notification.next_attempt_at = timezone.now() + retry_delay(notification.attempts)
+        notification.last_error = repr(error)
+    notification.save(update_fields = ['attempts', 'status', 'sent_at', 'next_attempt_at', 'last_error'])
+    count_event('notification', channel = notification.get_channel_display(), status = 'Retry' if notification.status == 'P' else notification.get_status_display())
+
+def dispatch_notifications(batch_size = 100, workers = 4):
+    # Sends one batch of due notifications concurrently and returns the number of notifications handled.
+    notifications = claim_due_notifications(batch_size)
+    if not notifications:
+        return 0
+    emails = [notification for notification in notifications if notification.channel == 'E']
+    sms = [notification for notification in notifications if notification.channel == 'S']
+    email_chunks = [emails[i::workers] for i in range(workers) if emails[i::workers]]
+    with ThreadPoolExecutor(max_workers = workers) as executor, sms_session(workers) as session:
+        email_futures = [executor.submit(send_emails, chunk) for chunk in email_chunks]
+        sms_futures = [executor.submit(send_sms, session, notification) for notification in sms]
+        results = [result for future in email_futures for result in future.result()]
+        results += [future.result() for future in sms_futures]
+    for notification, error in results:
+        record_result(notification, error)
+    return len(results)
@@ -0,0 +1,36 @@
+from django.conf import settings
+from django.db import transaction
+from .face_index import get_sighting_index
+from .face_index_changes import record_sighting_index_changes
+from .models import SightedChild, NotificationOutbox
+from .notifications import sighting_notifications
+
+def match_sightings(missing_child, face_encoding):
+    # Searches the sightings saved without a match for the face of a newly reported missing child. The matching
+    # sightings are flagged as matched and the parent (missing_child.user) gets notified of each of them. Only the
+    # sightings made on or after the day the child went missing can be the child (the other direction of the sighting
+    # prefilter, see face_filters.py) : every face within tolerance is fetched, the FACE_SEARCH_TOP_K nearest of those
+    # dated after missing_from_date are kept. Returns the matched sightings, nearest face first.
+    sighting_index = get_sighting_index()
+    best_matches = sighting_index.search(face_encoding, k = None, tolerance = settings.FACE_MATCH_TOLERANCE)
+    if not best_matches:
+        return []
+    sightings = SightedChild.objects.select_related('user__profile').filter(match_found = False, sighted_date__gte = missing_child.missing_from_date) \
+                                    .in_bulk([sighted_child_id for sighted_child_id, _ in best_matches])
+    matched_sightings = []
+    for sighted_child_id, face_distance in best_matches:
+        sighting = sightings.get(sighted_child_id)
+        if sighting is None: # sighted before the child went missing, or matched / deleted since the index was loaded
+            continue
+        if len(matched_sightings) == settings.FACE_SEARCH_TOP_K:
+            break
+        sighting.face_distance = face_distance
+        sighting.match_found = True
+        matched_sightings.append(sighting)
+    with transaction.atomic():
+        SightedChild.objects.filter(pk__in = [sighting.pk for sighting in matched_sightings]).update(match_found = True)
+        NotificationOutbox.objects.bulk_create([notification for sighting in matched_sightings for notification in sighting_notifications(missing_child, sighting)])
+        record_sighting_index_changes([sighting.pk for sighting in matched_sightings]) # removed from the other processes' indexes
+    for sighting in matched_sightings: # update() doesn't send post_save
+        sighting_index.remove(sighting.pk)
+    return matched_sightings
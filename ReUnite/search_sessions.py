@@ -0,0 +1,46 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.core.paginator import Paginator
+import uuid
+
+# The results of a search are kept in the 'search_results' cache (shared by all the worker processes) under a token of
+# the user who searched, as a list of (missing_child_id, face distance, name similarity) : the result pages and the
+# detail of one result are then read back with primary key lookups only, without searching again.
+
+def results_cache():
+    return caches[getattr(settings, 'SEARCH_RESULTS_CACHE', 'search_results')]
+
+def cache_key(user, token):
+    return f"search_results:{user.pk}:{token}"
+
+def save_search_results(user, results):
+    # results : MissingChild objects with a face_distance and / or name_similarity attribute ---> token of the search
+    token = uuid.uuid4().hex
+    entries = [(result.pk, getattr(result, 'face_distance', None), getattr(result, 'name_similarity', None)) for result in results]
+    results_cache().set(cache_key(user, token), entries, timeout = settings.SEARCH_RESULTS_TTL)
+    return token
+
+def search_results_page(user, token, page_number = 1, missing_child_id = None):
+    # Returns (page, MissingChild objects of the page) or None when the search has expired. With missing_child_id, the
+    # page holding that result is returned instead of page_number (or None when it isn't one of the results).
+    from .models import MissingChild
+    entries = results_cache().get(cache_key(user, token))
+    if entries is None:
+        return None
+    paginator = Paginator(entries, settings.SEARCH_RESULTS_PER_PAGE)
+    if missing_child_id is not None:
+        position = next((i for i, entry in enumerate(entries) if entry[0] == missing_child_id), None)
+        if position is None:
+            return None
+        page_number = position // paginator.per_page + 1
+    page = paginator.get_page(page_number)
+    missing_children = MissingChild.objects.in_bulk([entry[0] for entry in page])
+    results = []
+    for missing_child_pk, face_distance, name_similarity in page:
+        missing_child = missing_children.get(missing_child_pk)
+        if missing_child is None: # deleted since the search
+            continue
+        missing_child.face_distance = face_distance
+        missing_child.name_similarity = name_similarity
+        results.append(missing_child)
+    return page, results
@@ -37,12 +37,13 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
-    'ReUnite',
+    'ReUnite.apps.ReUniteConfig',
     'crispy_forms',
     'phonenumber_field',
 ]
 
 MIDDLEWARE = [
+    'ReUnite.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -65,12 +66,14 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'ReUnite.caching.cache_settings',
             ],
         },
     },
 ]
 
 WSGI_APPLICATION = 'ReUnite.wsgi.application'
+ASGI_APPLICATION = 'ReUnite.asgi.application' # serves search_child & sighted_child with their async variants
 
 
 # Database
@@ -95,6 +98,8 @@ else:
         }
     }
 
+DEFAULT_AUTO_FIELD = 'django.db.models.AutoField' # keeps the 32-bit primary keys of the existing tables
+
 
 PASSWORD_HASHERS = [
     'django.contrib.auth.hashers.PBKDF2PasswordHasher',
@@ -154,6 +159,17 @@ STATICFILES_DIRS = (os.path.join(BASE_DIR, 'static'),) # It searches for all sta
 
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 MEDIA_URL = '/media/'
+# How media files are served (see media.py) : 'django' (by the web server from MEDIA_URL, or by Django when DEBUG is
+# on), 'x-accel-redirect' (nginx) or 'x-sendfile' (Apache mod_xsendfile / lighttpd)
+MEDIA_SERVING = os.environ.get('MEDIA_SERVING', 'django')
+MEDIA_ACCEL_REDIRECT_PREFIX = '/protected-media/'
+
+# Renditions written for every stored child image (see thumbnails.py) : largest side in pixels, twice the size they
+# are displayed at for high density screens. The full size is the stored image itself (fitted to MAX_IMAGE_SIZE in
+# image_pipeline.py).
+IMAGE_RENDITIONS = {'list': 120, 'detail': 300}
+IMAGE_RENDITION_FORMATS = ['WEBP', 'JPEG'] # WebP first, JPEG for the browsers without WebP support
+IMAGE_RENDITION_QUALITY = 80
 
 CRISPY_TEMPLATE_PACK = 'bootstrap4'
 
@@ -165,3 +181,136 @@ EMAIL_HOST = 'smtp.gmail.com'
 EMAIL_HOST_USER = 'Your gmail id'
 EMAIL_HOST_PASSWORD = 'Your gmail password'
 EMAIL_PORT = 587
+
+# Face search index
+# 'brute_force' compares a face with every stored encoding, 'ivf' only with the FACE_INDEX_NPROBE k-means partitions
+# nearest to it (higher nprobe = better recall, slower search). The IVF index is built by
+# 'python manage.py rebuild_face_index' into FACE_INDEX_PATH and is used only when that file exists.
+FACE_INDEX_BACKEND = os.environ.get('FACE_INDEX_BACKEND', 'brute_force')
+FACE_INDEX_PATH = os.path.join(BASE_DIR, 'face_index.npz')
+FACE_INDEX_NPROBE = 8
+# The brute-force index is loaded from the snapshot written by 'python manage.py snapshot_face_index' into
+# FACE_INDEX_SNAPSHOT_DIR (memory-mapped, shared by the workers, see face_snapshot.py) plus the encodings saved since,
+# or from the database alone when there is no snapshot (or FACE_INDEX_SNAPSHOT_DIR is None).
+FACE_INDEX_SNAPSHOT_DIR = os.path.join(BASE_DIR, 'face_index_snapshot')
+# Every web worker applies the encodings saved / deleted by the other workers & nodes (FaceIndexChange rows, see
+# face_index_changes.py) to its face index every FACE_INDEX_CHANGE_POLL_INTERVAL seconds, and before a search when its
+# last successful poll is older than FACE_INDEX_MAX_STALENESS seconds. The changes older than
+# FACE_INDEX_CHANGE_RETENTION_DAYS are deleted by 'python manage.py snapshot_face_index' once in a snapshot.
+FACE_INDEX_CHANGE_POLL_INTERVAL = 2
+FACE_INDEX_MAX_STALENESS = 10
+FACE_INDEX_CHANGE_GAP_TIMEOUT = 60
+FACE_INDEX_CHANGE_RETENTION_DAYS = 7
+
+# Face search returns at most FACE_SEARCH_TOP_K missing children, nearest face first, among those whose face distance
+# to the searched / sighted face is at most FACE_MATCH_TOLERANCE (0.6 is the face_recognition default).
+FACE_SEARCH_TOP_K = 10
+FACE_MATCH_TOLERANCE = 0.6
+# When the age of the searched / sighted child is known, only the missing children whose age differs by at most
+# FACE_SEARCH_AGE_MARGIN year(s) are compared with its face.
+FACE_SEARCH_AGE_MARGIN = 2
+
+# Name search returns at most NAME_SEARCH_LIMIT missing children whose name has a trigram similarity of at least
+# NAME_SEARCH_MIN_SIMILARITY with the searched name (1.0 = same name, 0.3 is PostgreSQL's pg_trgm default).
+NAME_SEARCH_LIMIT = 20
+NAME_SEARCH_MIN_SIMILARITY = 0.3
+
+# Face detection & encoding of uploaded images runs in FACE_ENCODING_WORKERS worker processes (0 = in the request
+# thread). At most FACE_ENCODING_MAX_PENDING images wait for or are in encoding at a time, a new upload waits up to
+# FACE_ENCODING_QUEUE_WAIT seconds for a free slot and then up to FACE_ENCODING_TIMEOUT seconds for its encodings.
+# Every web worker process has a pool of its own : the CPUs are shared between the WEB_CONCURRENCY web workers (the
+# environment variable gunicorn takes its number of workers from) so that the host runs one encoder per CPU.
+WEB_WORKERS = int(os.environ.get('WEB_CONCURRENCY', 1))
+FACE_ENCODING_WORKERS = max((os.cpu_count() or 1) // WEB_WORKERS, 1)
+FACE_ENCODING_MAX_PENDING = 4 * FACE_ENCODING_WORKERS
+FACE_ENCODING_QUEUE_WAIT = 1
+FACE_ENCODING_TIMEOUT = 30
+
+# Face detection & encoding options per endpoint (see face_detection.py) : searches detect faces on a downscaled copy
+# of the image for speed, registrations of missing children detect on the full image and encode more carefully. All of
+# them align the faces on the same 5 landmarks (encoding_model 'small', face_recognition's default) as the encodings
+# stored so far : encodings of faces aligned on 5 and on 68 landmarks aren't comparable as reliably, and the header of
+# a stored encoding doesn't record its landmark model (see face_codec.py). Check a change with
+# 'python manage.py benchmark_face_detection', which pairs each profile with the registration one, and re-encode the
+# stored faces ('python manage.py reencode_faces') before switching the landmark model. The images that must show a
+# single face are first checked on a 640 pixels copy, so that a photo of several people is rejected cheaply. The
+# renditions of the stored images are produced from the image decoded for the faces (see thumbnails.py).
+FACE_ENCODING_PROFILES = {
+    'missing_child': {'detection_size': None, 'upsample': 1, 'detection_model': 'hog', 'num_jitters': 3, 'encoding_model': 'small', 'precheck_size': 640, 'renditions': True},
+    'search_child': {'detection_size': 800, 'upsample': 1, 'detection_model': 'hog', 'num_jitters': 1, 'encoding_model': 'small', 'precheck_size': 640},
+    'sighted_child': {'detection_size': 800, 'upsample': 1, 'detection_model': 'hog', 'num_jitters': 1, 'encoding_model': 'small', 'precheck_size': 640, 'renditions': True},
+    # group photos / CCTV stills : the faces are small, so they are detected on the full resolution image
+    'sighted_child_group': {'detection_size': None, 'upsample': 1, 'detection_model': 'hog', 'num_jitters': 1, 'encoding_model': 'small', 'renditions': True},
+}
+# Most faces of a group photo searched (and stored as separate sightings) at once
+SIGHTING_MAX_FACES = 50
+
+# Precision the face encodings are stored with in the database : 'float32' or 'float16' (see face_codec.py)
+FACE_ENCODING_STORAGE_DTYPE = 'float32'
+
+# SMS gateway used by 'python manage.py dispatch_notifications' for the sighted child notifications
+SMS_GATEWAY_URL = "https://www.fast2sms.com/dev/bulk"
+SMS_GATEWAY_AUTHORIZATION = "Your API authorization key of Fast2SMS account"
+SMS_GATEWAY_TIMEOUT = 10 # seconds
+NOTIFICATION_MAX_ATTEMPTS = 5
+NOTIFICATION_RETRY_BASE_DELAY = 30 # seconds, doubled after every failed attempt
+
+# The 'search_results' cache must be shared by all the web worker processes : the results of a search are stored in it
+# for SEARCH_RESULTS_TTL seconds and shown SEARCH_RESULTS_PER_PAGE per page (see search_sessions.py). Use a memcached /
+# redis / database cache instead of the file based one when the workers run on several hosts. Past MAX_ENTRIES files
+# the file based cache deletes 1 / CULL_FREQUENCY of them at random, expired or not : SEARCH_RESULTS_MAX_ENTRIES must
+# hold the searches of a SEARCH_RESULTS_TTL window at peak (plus the cached name searches), so that the result pages
+# of live searches aren't culled.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'pages': { # rendered pages & form fragments, a local memory cache per worker is enough (see caching.py)
+        'BACKEND': os.environ.get('PAGE_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('PAGE_CACHE_LOCATION', 'pages'),
+    },
+    'search_results': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache', 'search_results'),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.environ.get('SEARCH_RESULTS_MAX_ENTRIES', 20000)),
+            'CULL_FREQUENCY': 10,
+        },
+    },
+}
+SEARCH_RESULTS_CACHE = 'search_results'
+SEARCH_RESULTS_TTL = 30 * 60
+SEARCH_RESULTS_PER_PAGE = 10
+PAGE_CACHE = 'pages'
+PAGE_CACHE_TIMEOUT = 60 * 60
+# Name search results are cached in NAME_SEARCH_CACHE (shared by the workers, so that saving / deleting a missing child
+# in one of them invalidates them for all) for NAME_SEARCH_CACHE_TIMEOUT seconds.
+NAME_SEARCH_CACHE = 'search_results'
+NAME_SEARCH_CACHE_TIMEOUT = 10 * 60
+
+# Face encodings of the last FACE_ENCODING_CACHE_SIZE uploaded photos are kept in every web worker process (0 = no
+# cache) so that the same photo uploaded again isn't encoded again (see encoding_cache.py). Setting
+# FACE_ENCODING_CACHE_BACKEND to the name of one of the CACHES also shares them between the workers / restarts for
+# FACE_ENCODING_CACHE_TTL seconds. A resized / recompressed copy of a cached photo (perceptual hash at most
+# FACE_ENCODING_CACHE_MAX_HASH_DISTANCE bits away) only skips the face detection : the cached encodings are used when
+# the faces at the cached boxes encode to at most FACE_ENCODING_CACHE_CONFIRM_DISTANCE from them.
+FACE_ENCODING_CACHE_SIZE = 1024
+FACE_ENCODING_CACHE_BACKEND = None
+FACE_ENCODING_CACHE_TTL = 24 * 60 * 60
+FACE_ENCODING_CACHE_MAX_HASH_DISTANCE = 10 # bits out of 256
+FACE_ENCODING_CACHE_CONFIRM_DISTANCE = 0.15 # vs FACE_MATCH_TOLERANCE
+
+# Uploads are streamed to temporary files and only their header is read to check the image format & dimensions
+# (see upload_handlers.py). That images of missing / searched / sighted children show exactly one face is checked by
+# the encoding service, on the faces its detection finds (see encoding_service.py).
+FILE_UPLOAD_HANDLERS = ['ReUnite.upload_handlers.ImageUploadHandler']
+IMAGE_UPLOAD_MIN_DIMENSION = 200 # pixels
+IMAGE_UPLOAD_MAX_PIXELS = 50 * 1000 * 1000
+
+# Request / stage latencies and counters are exposed in the Prometheus text format on /metrics (see metrics.py) to the
+# scrapers sending 'Authorization: Bearer <METRICS_TOKEN>' (not set = to nobody). With METRICS_DIR set (a directory
+# local to the host, emptied when the service starts), every process writes its values there every
+# METRICS_FLUSH_INTERVAL seconds and any of them serves the values of all.
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+METRICS_DIR = os.environ.get('METRICS_DIR')
+METRICS_FLUSH_INTERVAL = 5
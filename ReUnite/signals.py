@@ -0,0 +1,82 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import MissingChild, MissingChildEncodedFace, SightedChild, SightedChildEncodedFace
+from .face_index import loaded_face_index, loaded_sighting_index
+from .face_index_changes import record_face_index_changes, record_sighting_index_changes
+from .face_filters import loaded_missing_child_attributes, COLUMNS as ATTRIBUTE_COLUMNS
+from .face_codec import decode_face_encoding
+from .name_search import sync_name_trigrams, invalidate_name_searches
+
+@receiver(post_save, sender = MissingChild)
+def sync_missing_child_name_trigrams(sender, instance, update_fields = None, **kwargs):
+    if update_fields is not None and 'full_name' not in update_fields:
+        return
+    sync_name_trigrams({instance.pk: instance.name_key})
+    invalidate_name_searches()
+
+@receiver(post_delete, sender = MissingChild)
+def invalidate_name_searches_of_deleted_child(sender, instance, **kwargs):
+    invalidate_name_searches()
+
+@receiver(post_save, sender = MissingChild)
+def sync_missing_child_attributes(sender, instance, update_fields = None, **kwargs):
+    if update_fields is not None and not set(ATTRIBUTE_COLUMNS).intersection(update_fields):
+        return
+    record_face_index_changes([instance.pk], 'S') # the other processes reload its prefilter attributes too
+    attributes = loaded_missing_child_attributes()
+    if attributes is not None:
+        attributes.set(instance.pk, *(getattr(instance, column) for column in ATTRIBUTE_COLUMNS))
+
+@receiver(post_delete, sender = MissingChild)
+def remove_missing_child_attributes(sender, instance, **kwargs):
+    record_face_index_changes([instance.pk], 'D')
+    attributes = loaded_missing_child_attributes()
+    if attributes is not None:
+        attributes.remove(instance.pk)
+
+@receiver(post_save, sender = MissingChildEncodedFace)
+def add_encoded_face_to_index(sender, instance, **kwargs):
+    if instance.missing_child_id is None:
+        return
+    record_face_index_changes([instance.missing_child_id], 'S') # for the face index of the other processes
+    face_index = loaded_face_index()
+    if face_index is None: # index will be built from the database on its first use anyway
+        return
+    face_index.add(instance.missing_child_id, decode_face_encoding(instance.child_encoded_face))
+
+@receiver(post_delete, sender = MissingChildEncodedFace)
+def remove_encoded_face_from_index(sender, instance, **kwargs):
+    if instance.missing_child_id is None:
+        return
+    record_face_index_changes([instance.missing_child_id], 'D')
+    face_index = loaded_face_index()
+    if face_index is None:
+        return
+    face_index.remove(instance.missing_child_id)
+
+@receiver(post_save, sender = SightedChildEncodedFace)
+def add_sighting_encoded_face_to_index(sender, instance, **kwargs):
+    record_sighting_index_changes([instance.sighted_child_id], 'S') # for the sighting index of the other processes
+    sighting_index = loaded_sighting_index()
+    if sighting_index is None:
+        return
+    if instance.sighted_child.match_found:
+        return
+    sighting_index.add(instance.sighted_child_id, decode_face_encoding(instance.child_encoded_face))
+
+@receiver(post_save, sender = SightedChild)
+def remove_matched_sighting_from_index(sender, instance, created = False, **kwargs):
+    if not instance.match_found:
+        return
+    if not created: # a new sighting has no encoding yet
+        record_sighting_index_changes([instance.pk], 'S')
+    sighting_index = loaded_sighting_index()
+    if sighting_index is not None:
+        sighting_index.remove(instance.pk)
+
+@receiver(post_delete, sender = SightedChildEncodedFace)
+def remove_sighting_encoded_face_from_index(sender, instance, **kwargs):
+    record_sighting_index_changes([instance.sighted_child_id], 'D')
+    sighting_index = loaded_sighting_index()
+    if sighting_index is not None:
+        sighting_index.remove(instance.sighted_child_id)
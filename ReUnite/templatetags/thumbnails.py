@@ -0,0 +1,10 @@
+from django import template
+from ReUnite.thumbnails import rendition_url
+
+register = template.Library()
+
+@register.filter
+def rendition(field_file, spec):
+    # {{ child.child_image|rendition:'list' }} ---> URL of the JPEG list rendition, 'list.webp' for the WebP one
+    name, _, image_format = spec.partition('.')
+    return rendition_url(field_file, name, image_format or 'JPEG')
@@ -0,0 +1,487 @@
+from datetime import date, time, timedelta
+from unittest import mock
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import DatabaseError
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+from .models import Profile, MissingChild, MissingChildEncodedFace, SightedChild, SightedChildEncodedFace, NotificationOutbox
+from .encoding_cache import EncodingCache, upload_cache_keys
+from .encoding_service import EncodingServiceBusy, TooManyFaces, confirmed_face_encodings, timed_encode_faces
+from .face_codec import convert_legacy_encodings, decode_face_encoding, encode_face_encoding, encoding_model_version, MODEL_VERSION
+from .face_filters import MissingChildAttributes, get_missing_child_attributes, reset_missing_child_attributes
+from .face_index import FaceEncodingIndex, get_face_index, reset_face_index
+from .ivf_index import IVFFaceIndex
+from .name_search import search_names
+from .thumbnails import rendition_name
+from .upload_handlers import ImageUploadHandler
+from .notifications import claim_due_notifications, dispatch_notifications
+import io, requests, shutil, tempfile
+import numpy as np
+
+MEDIA_ROOT = tempfile.mkdtemp()
+TEST_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'pages': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'test-pages'},
+    'search_results': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'test-search-results'},
+}
+
+def image_file(name, size = (300, 300), noise_seed = None):
+    # PNG upload; random noise makes it large enough for validate_image_size (1 MB at least) at 900 x 900
+    if noise_seed is None:
+        img = Image.new('RGB', size, (200, 150, 120))
+    else:
+        img = Image.fromarray(np.random.default_rng(noise_seed).integers(0, 255, size = (size[1], size[0], 3), dtype = np.uint8))
+    content = io.BytesIO()
+    img.save(content, 'PNG')
+    return SimpleUploadedFile(name, content.getvalue(), 'image/png')
+
+def missing_child(user, full_name, face_encoding, child_image_upload = None, **fields):
+    child = MissingChild.objects.create(user = user, full_name = full_name, gender = 'Male', age = 6, father_name = 'Father', mother_name = 'Mother',
+                                        nationality = 'Indian', child_image = child_image_upload or image_file(f'{full_name}.png'), residential_address = 'Address',
+                                        district = 'Pune', state = 'Maharashtra', pincode = 411001, parent_mobile_no = '+919876543210',
+                                        parent_email = 'parent@gmail.com', parent_aadhar_no = 234567890123, missing_from_place = 'Station',
+                                        police_station_nearby_missing_place = 'Police station', missing_from_date = date(2020, 1, 1),
+                                        missing_from_time = time(10, 0), missing_cause = 'Lost', additional_info = 'Info', height = 3.5, weight = 20, **fields)
+    MissingChildEncodedFace.objects.create(missing_child = child, child_encoded_face = encode_face_encoding(face_encoding))
+    return child
+
+@override_settings(MEDIA_ROOT = MEDIA_ROOT, CACHES = TEST_CACHES, FACE_ENCODING_WORKERS = 0, FACE_ENCODING_CACHE_SIZE = 0,
+                   FACE_INDEX_SNAPSHOT_DIR = None, FACE_INDEX_MAX_STALENESS = None, FACE_SEARCH_TOP_K = 20, SEARCH_RESULTS_PER_PAGE = 10)
+class SearchQueryCountTests(TestCase):
+    # The number of queries of a search and of its result pages must not grow with the number of stored or matched
+    # children (no query per result, e.g. for its user & profile).
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('alice', 'alice@gmail.com', 'password', first_name = 'Alice')
+        Profile.objects.create(user = cls.user, user_mobile_no = '+919876543211')
+        cls.face = np.random.default_rng(0).normal(0, 0.05, 128)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors = True)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        reset_face_index()
+        reset_missing_child_attributes()
+        self.addCleanup(reset_face_index)
+        self.addCleanup(reset_missing_child_attributes)
+
+    def report_children(self, count, first = 0):
+        # count children whose faces all match self.face, and as many whose faces don't
+        rng = np.random.default_rng(first + 1)
+        for i in range(first, first + count):
+            missing_child(self.user, f'Ravi Kumar {i}', self.face + rng.normal(0, 0.005, 128))
+            missing_child(self.user, f'Sita Devi {i}', rng.normal(0, 0.05, 128) + 1)
+        get_face_index() # built (& kept in sync) once per process, not per request
+        get_missing_child_attributes()
+
+    def search(self, data):
+        with mock.patch('ReUnite.views.face_encodings_of_file', return_value = [self.face]):
+            return self.client.post(reverse('search_child'), dict({'full_name_to_search': '', 'gender': '', 'age': '', 'state': '', 'district': '',
+                                                                   'missing_from_date': ''}, **data))
+
+    def face_search(self, **filters):
+        return self.search(dict(filters, child_image_to_search = image_file('searched.png', (900, 900), noise_seed = 1)))
+
+    def assertSearchQueries(self, num, search):
+        # session + user, (name search : shared trigrams, name keys of the names sharing them), matched children
+        with self.assertNumQueries(num):
+            response = search()
+        self.assertEqual(response.status_code, 302)
+        return response['Location']
+
+    def test_face_search_queries_dont_grow_with_the_matches(self):
+        self.report_children(3)
+        self.assertSearchQueries(3, self.face_search)
+        self.report_children(12, first = 3)
+        results_url = self.assertSearchQueries(3, self.face_search)
+        response = self.client.get(results_url)
+        self.assertEqual(response.context['page'].paginator.count, 15)
+
+    def test_filtered_face_search_queries(self):
+        self.report_children(5)
+        self.assertSearchQueries(3, lambda: self.face_search(gender = 'M', age = 6, state = 'maharashtra'))
+
+    def test_name_search_queries_dont_grow_with_the_matches(self):
+        self.report_children(3)
+        self.assertSearchQueries(4, lambda: self.search({'full_name_to_search': 'Ravi Kumar'}))
+        self.report_children(12, first = 3)
+        self.assertSearchQueries(4, lambda: self.search({'full_name_to_search': 'Ravi Kumr'}))
+
+    def test_results_pages_queries_dont_grow_with_the_results(self):
+        self.report_children(15)
+        results_url = self.face_search()['Location']
+        # session + user, children of the page
+        with self.assertNumQueries(3):
+            response = self.client.get(results_url)
+        self.assertEqual(len(response.context['res']), 10)
+        with self.assertNumQueries(3):
+            response = self.client.get(results_url, {'page': 2})
+        self.assertEqual(len(response.context['res']), 5)
+        clicked = response.context['res'][0]
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('individual_search_child_view', kwargs = {'token': results_url.rstrip('/').rsplit('/', 1)[1], 'pk': clicked.pk}))
+        self.assertEqual(response.context['clicked_user'].pk, clicked.pk)
+
+@override_settings(MEDIA_ROOT = MEDIA_ROOT, CACHES = TEST_CACHES, FACE_ENCODING_WORKERS = 0, FACE_ENCODING_CACHE_SIZE = 0,
+                   FACE_INDEX_SNAPSHOT_DIR = None, FACE_INDEX_MAX_STALENESS = None, EMAIL_BACKEND = 'django.core.mail.backends.locmem.EmailBackend',
+                   NOTIFICATION_MAX_ATTEMPTS = 3, NOTIFICATION_RETRY_BASE_DELAY = 30)
+class NotificationOutboxTests(TestCase):
+    # Notifications are queued in the transaction of the sighting and sent by dispatch_notifications, the SMS gateway
+    # being replaced by a stub of requests.Session.post.
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.parent = User.objects.create_user('alice', 'alice@gmail.com', 'password', first_name = 'Alice')
+        Profile.objects.create(user = cls.parent, user_mobile_no = '+919876543211')
+        cls.sighted_by = User.objects.create_user('bob', 'bob@gmail.com', 'password', first_name = 'Bob')
+        Profile.objects.create(user = cls.sighted_by, user_mobile_no = '+919876543212')
+        cls.face = np.random.default_rng(0).normal(0, 0.05, 128)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors = True)
+
+    def setUp(self):
+        reset_face_index()
+        reset_missing_child_attributes()
+        self.addCleanup(reset_face_index)
+        self.addCleanup(reset_missing_child_attributes)
+
+    def report_sighting(self, **encoded_faces):
+        # encoded_faces : return_value / side_effect of face_encodings_of_file, the face of the missing child by default
+        missing_child(self.parent, 'Ravi Kumar', self.face)
+        self.client.force_login(self.sighted_by)
+        with mock.patch('ReUnite.views.face_encodings_of_file', **(encoded_faces or {'return_value': [self.face]})):
+            return self.client.post(reverse('sighted_child'), {'sighted_child_full_name': '', 'sighted_child_age': 6, 'sighted_date': '2020-06-01',
+                                                               'sighted_time': '10:00', 'sighted_location': 'Pune',
+                                                               'sighted_child_image': image_file('sighted.png', (900, 900), noise_seed = 2)})
+
+    def queue_notifications(self):
+        return [NotificationOutbox.objects.create(channel = 'E', recipient = 'alice@gmail.com', subject = "Sighted", message = "Your child has been sighted"),
+                NotificationOutbox.objects.create(channel = 'S', recipient = '9876543211', message = "Your child has been sighted")]
+
+    def sms_gateway(self, error = None):
+        response = mock.Mock()
+        response.raise_for_status.side_effect = error
+        return mock.patch.object(requests.Session, 'post', return_value = response)
+
+    def test_sighting_queues_its_notifications_without_sending_them(self):
+        with self.sms_gateway() as post:
+            response = self.report_sighting()
+        self.assertEqual(response.status_code, 200)
+        sighting = SightedChild.objects.get()
+        self.assertTrue(sighting.match_found)
+        self.assertEqual(sorted(NotificationOutbox.objects.filter(sighted_child = sighting, status = 'P').values_list('channel', 'recipient')),
+                         [('E', 'alice@gmail.com'), ('S', '9876543211')])
+        self.assertEqual(len(mail.outbox), 0)
+        post.assert_not_called()
+
+    def test_sighting_isnt_saved_when_its_notifications_cant_be_queued(self):
+        with mock.patch.object(NotificationOutbox.objects, 'bulk_create', side_effect = DatabaseError("outbox unavailable")), self.assertRaises(DatabaseError):
+            self.report_sighting()
+        self.assertFalse(SightedChild.objects.exists())
+        self.assertFalse(SightedChildEncodedFace.objects.exists())
+        self.assertFalse(NotificationOutbox.objects.exists())
+
+    def test_sighting_without_single_face_is_saved_without_encoding(self):
+        for encoded_faces in ({'return_value': []}, {'side_effect': TooManyFaces(3)}):
+            SightedChild.objects.all().delete()
+            response = self.report_sighting(**encoded_faces)
+            self.assertEqual(response.status_code, 200)
+            sighting = SightedChild.objects.get()
+            self.assertFalse(sighting.match_found)
+            self.assertFalse(SightedChildEncodedFace.objects.exists())
+            self.assertFalse(NotificationOutbox.objects.exists())
+
+    def test_sighting_isnt_saved_when_its_image_cant_be_encoded(self):
+        response = self.report_sighting(side_effect = EncodingServiceBusy())
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(SightedChild.objects.exists())
+
+    def test_dispatch_sends_due_notifications_once(self):
+        email, sms = self.queue_notifications()
+        with self.sms_gateway() as post:
+            self.assertEqual(dispatch_notifications(workers = 2), 2)
+            self.assertEqual(dispatch_notifications(workers = 2), 0)
+        self.assertEqual([(message.subject, message.to) for message in mail.outbox], [("Sighted", ['alice@gmail.com'])])
+        post.assert_called_once()
+        self.assertEqual(post.call_args.kwargs['data']['numbers'], '9876543211')
+        for notification in (email, sms):
+            notification.refresh_from_db()
+            self.assertEqual((notification.status, notification.attempts, notification.last_error), ('S', 1, ""))
+            self.assertIsNotNone(notification.sent_at)
+
+    def test_claimed_notifications_arent_claimed_by_another_dispatcher(self):
+        self.queue_notifications()
+        self.assertEqual(len(claim_due_notifications(10)), 2)
+        self.assertEqual(claim_due_notifications(10), [])
+        with self.sms_gateway() as post:
+            self.assertEqual(dispatch_notifications(), 0)
+        self.assertEqual(len(mail.outbox), 0)
+        post.assert_not_called()
+
+    def test_failed_notification_is_retried_with_backoff(self):
+        email, sms = self.queue_notifications()
+        with self.sms_gateway(requests.ConnectionError("gateway down")):
+            self.assertEqual(dispatch_notifications(), 2)
+        sms.refresh_from_db()
+        self.assertEqual((sms.status, sms.attempts), ('P', 1))
+        self.assertIn("gateway down", sms.last_error)
+        self.assertGreater(sms.next_attempt_at, timezone.now() + timedelta(seconds = 25))
+        with self.sms_gateway() as post:
+            self.assertEqual(dispatch_notifications(), 0) # not due yet
+            NotificationOutbox.objects.filter(pk = sms.pk).update(next_attempt_at = timezone.now())
+            self.assertEqual(dispatch_notifications(), 1)
+        post.assert_called_once()
+        sms.refresh_from_db()
+        self.assertEqual((sms.status, sms.attempts, sms.last_error), ('S', 2, ""))
+        self.assertEqual(len(mail.outbox), 1) # the email went out on the first attempt, and only then
+
+    def test_notification_fails_after_max_attempts(self):
+        email, sms = self.queue_notifications()
+        with self.sms_gateway(requests.ConnectionError("gateway down")) as post:
+            for attempt in range(3):
+                NotificationOutbox.objects.filter(pk = sms.pk).update(next_attempt_at = timezone.now())
+                dispatch_notifications()
+            NotificationOutbox.objects.filter(pk = sms.pk).update(next_attempt_at = timezone.now())
+            self.assertEqual(dispatch_notifications(), 0)
+        self.assertEqual(post.call_count, 3)
+        sms.refresh_from_db()
+        self.assertEqual((sms.status, sms.attempts), ('F', 3))
+
+class FacePrecheckTests(SimpleTestCase):
+    # The faces of an image that must show at most max_faces faces are first counted on a low resolution copy
+
+    def test_too_many_faces_on_the_copy_skip_the_full_resolution_pass(self):
+        with mock.patch('ReUnite.encoding_service.low_resolution_face_locations', return_value = [(0, 10, 10, 0), (0, 30, 10, 20)]), \
+             mock.patch('ReUnite.encoding_service.prepare_image') as prepare_image:
+            face_locations, face_encodings, downscaled_image, renditions, timings = timed_encode_faces(b'image', {'precheck_size': 640}, max_faces = 1)
+        prepare_image.assert_not_called()
+        self.assertEqual(len(face_locations), 2)
+        self.assertIsNone(face_encodings)
+        self.assertEqual(list(timings), ['face_precheck'])
+
+    def test_faces_missed_on_the_copy_are_searched_at_full_resolution(self):
+        face = np.zeros(128)
+        with mock.patch('ReUnite.encoding_service.low_resolution_face_locations', return_value = []), \
+             mock.patch('ReUnite.encoding_service.prepare_image', return_value = (np.zeros((900, 900, 3), dtype = np.uint8), None)), \
+             mock.patch('ReUnite.encoding_service.detect_faces', return_value = [(100, 200, 200, 100)]), \
+             mock.patch('ReUnite.encoding_service.detect_and_encode', return_value = [face]):
+            face_locations, face_encodings, downscaled_image, renditions, timings = timed_encode_faces(b'image', {'precheck_size': 640}, max_faces = 1)
+        self.assertEqual(face_locations, [(100, 200, 200, 100)])
+        self.assertEqual(len(face_encodings), 1)
+
+@override_settings(MEDIA_ROOT = MEDIA_ROOT, IMAGE_RENDITIONS = {'list': 120, 'detail': 300}, IMAGE_RENDITION_FORMATS = ['WEBP', 'JPEG'])
+class RenditionTests(TestCase):
+    # The renditions of an upload are produced by the encoding service from the image it decodes for the faces
+
+    def test_renditions_come_with_the_encodings(self):
+        with mock.patch('ReUnite.encoding_service.detect_faces', return_value = []), mock.patch('ReUnite.encoding_service.detect_and_encode', return_value = []):
+            _, _, _, renditions, timings = timed_encode_faces(image_file('child.png', (900, 600)).read(), {'renditions': True})
+        self.assertEqual(sorted(renditions), [('detail', 'JPEG'), ('detail', 'WEBP'), ('list', 'JPEG'), ('list', 'WEBP')])
+        self.assertEqual(Image.open(io.BytesIO(renditions[('detail', 'JPEG')])).size, (300, 200))
+        self.assertIn('rendition_generation', timings)
+
+    def test_uploaded_renditions_are_written_without_decoding_the_stored_image(self):
+        user = User.objects.create_user('alice', 'alice@gmail.com', 'password')
+        upload = image_file('Ravi Kumar.png')
+        upload.renditions = {('list', 'JPEG'): b'list', ('detail', 'JPEG'): b'detail'}
+        with mock.patch('ReUnite.thumbnails.generate_renditions') as generate_renditions, self.captureOnCommitCallbacks(execute = True):
+            child = missing_child(user, 'Ravi Kumar', np.zeros(128), child_image_upload = upload)
+        generate_renditions.assert_not_called()
+        with child.child_image.storage.open(rendition_name(child.child_image.name, 'list')) as f:
+            self.assertEqual(f.read(), b'list')
+
+class EncodingCacheTests(SimpleTestCase):
+    # An identical upload gets the cached encodings, a resized copy only the boxes of the cached faces to confirm them
+
+    def setUp(self):
+        pixels = np.kron(np.random.default_rng(1).integers(0, 255, (30, 40, 3), dtype = np.uint8), np.ones((40, 40, 1), dtype = np.uint8))
+        self.photo = Image.fromarray(pixels) # 1600 x 1200
+        self.cache = EncodingCache(16, max_hash_distance = 10)
+        self.face = np.random.default_rng(2).normal(0, 0.05, 128)
+
+    def jpeg(self, img, quality = 90):
+        content = io.BytesIO()
+        img.save(content, 'JPEG', quality = quality)
+        return content.getvalue()
+
+    def test_identical_upload_is_a_hit(self):
+        self.cache.set(upload_cache_keys(self.jpeg(self.photo)), [(400, 1000, 800, 600)], [self.face])
+        np.testing.assert_array_equal(self.cache.get(upload_cache_keys(self.jpeg(self.photo)))[0], self.face)
+
+    def test_resized_copy_is_only_a_candidate(self):
+        self.cache.set(upload_cache_keys(self.jpeg(self.photo)), [(400, 1000, 800, 600)], [self.face])
+        cache_keys = upload_cache_keys(self.jpeg(self.photo.resize((800, 600)), quality = 70))
+        self.assertIsNone(self.cache.get(cache_keys))
+        face_locations, face_encodings = self.cache.similar(cache_keys)
+        self.assertEqual(face_locations, [(200, 500, 400, 300)])
+        self.assertIs(confirmed_face_encodings(face_encodings, [self.face + 0.001]), face_encodings)
+        self.assertIsNone(confirmed_face_encodings(face_encodings, [np.random.default_rng(3).normal(0, 0.05, 128)]))
+
+    def test_different_photo_isnt_a_candidate(self):
+        self.cache.set(upload_cache_keys(self.jpeg(self.photo)), [(400, 1000, 800, 600)], [self.face])
+        self.assertIsNone(self.cache.similar(upload_cache_keys(self.jpeg(self.photo.transpose(Image.FLIP_LEFT_RIGHT)))))
+
+class FaceCodecTests(TestCase):
+    # Header + float32 / float16 payload, the legacy float64 blobs staying readable until they are converted
+
+    def setUp(self):
+        self.face = np.random.default_rng(0).normal(0, 0.05, 128)
+
+    def test_round_trip(self):
+        blob = encode_face_encoding(self.face, dtype = 'float32')
+        self.assertEqual(len(blob), 8 + 128 * 4)
+        np.testing.assert_allclose(decode_face_encoding(blob), self.face, atol = 1e-7)
+        self.assertEqual(encoding_model_version(blob), MODEL_VERSION)
+        np.testing.assert_allclose(decode_face_encoding(encode_face_encoding(self.face, dtype = 'float16')), self.face, atol = 1e-3)
+
+    def test_legacy_blob_is_read_as_float64(self):
+        blob = self.face.astype('<f8').tobytes()
+        np.testing.assert_array_equal(decode_face_encoding(blob), self.face)
+        self.assertIsNone(encoding_model_version(blob))
+
+    def test_unknown_format_is_rejected(self):
+        with self.assertRaises(ValueError):
+            decode_face_encoding(b'XX' + encode_face_encoding(self.face)[2:])
+
+    def test_legacy_blobs_are_converted(self):
+        user = User.objects.create_user('alice', 'alice@gmail.com', 'password')
+        with override_settings(MEDIA_ROOT = MEDIA_ROOT):
+            legacy, current = missing_child(user, 'Ravi Kumar', self.face), missing_child(user, 'Priya Sharma', self.face)
+        MissingChildEncodedFace.objects.filter(missing_child = legacy).update(child_encoded_face = self.face.astype('<f8').tobytes())
+        self.assertEqual(convert_legacy_encodings(dtype = 'float32'), 1)
+        for child in (legacy, current):
+            blob = bytes(MissingChildEncodedFace.objects.get(missing_child = child).child_encoded_face)
+            self.assertEqual(len(blob), 8 + 128 * 4)
+            np.testing.assert_allclose(decode_face_encoding(blob), self.face, atol = 1e-7)
+        self.assertEqual(convert_legacy_encodings(), 0)
+
+class FaceIndexTests(SimpleTestCase):
+    # The batched distances of the in-memory indexes give the same results as comparing every encoding one by one
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.ids = np.arange(1, 501)
+        self.encodings = rng.normal(0, 0.05, (500, 128)).astype(np.float32)
+        self.queries = self.encodings[[3, 42, 250]] + rng.normal(0, 0.01, (3, 128)).astype(np.float32)
+
+    def brute_force(self, query, k, tolerance, candidates = None):
+        distances = np.linalg.norm(self.encodings - query, axis = 1)
+        results = sorted((distance, missing_child_id) for missing_child_id, distance in zip(self.ids.tolist(), distances.tolist())
+                         if distance <= tolerance and (candidates is None or missing_child_id in candidates))
+        return [missing_child_id for _, missing_child_id in results[:k]]
+
+    def assertSameResults(self, results, expected):
+        self.assertEqual([missing_child_id for missing_child_id, _ in results], expected)
+
+    def test_search_matches_brute_force(self):
+        index = FaceEncodingIndex()
+        index.load(zip(self.ids, self.encodings))
+        for query in self.queries:
+            self.assertSameResults(index.search(query, 5, tolerance = 0.9), self.brute_force(query, 5, 0.9))
+            self.assertSameResults(index.search(query, 5, tolerance = 0.9, candidates = self.ids[::2]), self.brute_force(query, 5, 0.9, set(self.ids[::2].tolist())))
+        for query, results in zip(self.queries, index.search_many(self.queries, 5, tolerance = 0.9)):
+            self.assertSameResults(results, self.brute_force(query, 5, 0.9))
+
+    def test_removed_and_updated_encodings(self):
+        index = FaceEncodingIndex(capacity = 4)
+        index.load(zip(self.ids, self.encodings))
+        index.remove(4)
+        index.add(42, self.encodings[0])
+        self.assertEqual(len(index), 499)
+        self.assertNotIn(4, [missing_child_id for missing_child_id, _ in index.search(self.queries[0], 10, tolerance = 2)])
+        self.assertEqual(index.search(self.encodings[0], 2, tolerance = 1e-3), [(1, 0.0), (42, 0.0)])
+
+    def test_ivf_search_with_every_list_probed_is_exact(self):
+        index = IVFFaceIndex.train(self.ids, self.encodings, nlist = 8, nprobe = 8)
+        self.assertEqual(len(index), 500)
+        for query in self.queries:
+            self.assertSameResults(index.search(query, 5, tolerance = 0.9), self.brute_force(query, 5, 0.9))
+        for query, results in zip(self.queries, index.search_many(self.queries, 5, tolerance = 0.9, candidates = self.ids[:300])):
+            self.assertSameResults(results, self.brute_force(query, 5, 0.9, set(range(1, 301))))
+
+@override_settings(FACE_SEARCH_AGE_MARGIN = 1)
+class MissingChildAttributesTests(SimpleTestCase):
+    def setUp(self):
+        self.attributes = MissingChildAttributes(capacity = 2)
+        self.attributes.load([(1, 'Male', 6, 'Maharashtra', 'Pune', date(2020, 1, 1)), (2, 'Female', 6, 'Maharashtra', 'Mumbai', date(2021, 1, 1)),
+                              (5, 'Male', 12, 'Kerala', 'Kochi', date(2015, 6, 1))])
+
+    def test_masks(self):
+        self.assertIsNone(self.attributes.candidates({'gender': '', 'age': None}))
+        self.assertEqual(self.attributes.candidates({'gender': 'male'}).tolist(), [1, 5])
+        self.assertEqual(self.attributes.candidates({'state': ' MAHARASHTRA', 'age': 7}).tolist(), [1, 2])
+        self.assertEqual(self.attributes.candidates({'missing_from_date': date(2020, 6, 1)}).tolist(), [1, 5])
+        self.assertEqual(self.attributes.candidates({'district': 'Delhi'}).tolist(), [])
+        # aged 8 (6 in 2020), 7 (6 in 2021) and 18 (12 in 2015) on the sighted date
+        self.assertEqual(self.attributes.candidates({'sighted_date': date(2022, 1, 15), 'sighted_age': 9}).tolist(), [1])
+
+    def test_removed_child_isnt_a_candidate(self):
+        self.attributes.remove(1)
+        self.assertEqual(self.attributes.candidates({'gender': 'Male'}).tolist(), [5])
+
+@override_settings(MEDIA_ROOT = MEDIA_ROOT, CACHES = TEST_CACHES, NAME_SEARCH_MIN_SIMILARITY = 0.3)
+class NameSearchTests(TestCase):
+    # Trigram similarity (as pg_trgm) computed by the database on the trigram rows of the names
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user('alice', 'alice@gmail.com', 'password')
+        face = np.zeros(128)
+        cls.ravi = missing_child(user, 'Ravi Kumar', face)
+        cls.ravi_pillai = missing_child(user, 'Ravi Kumaran Pillai', face)
+        cls.priya = missing_child(user, 'Priya Sharma', face)
+
+    def test_misspelled_and_partial_names_most_similar_first(self):
+        self.assertEqual([missing_child_id for missing_child_id, _ in search_names('Ravi Kumr')], [self.ravi.pk, self.ravi_pillai.pk])
+        self.assertEqual([missing_child_id for missing_child_id, _ in search_names('  RAVÍ kumar. ')], [self.ravi.pk, self.ravi_pillai.pk])
+        self.assertEqual(search_names('Ravi Kumar')[0], (self.ravi.pk, 1.0))
+        self.assertEqual(search_names('priya'), [(self.priya.pk, 6 / 13)]) # 6 shared trigrams, 6 + 13 - 6 in all
+        self.assertEqual(search_names('Zoya'), [])
+        self.assertEqual(search_names('Ravi Kumar', limit = 1), [(self.ravi.pk, 1.0)])
+
+    def test_renamed_child_is_found_by_its_new_name(self):
+        self.ravi.full_name = 'Ravi Kumar Sharma'
+        self.ravi.save()
+        self.assertEqual(search_names('Ravi Kumar Sharma')[0], (self.ravi.pk, 1.0))
+        self.assertLess(dict(search_names('Ravi Kumar')).get(self.ravi.pk, 0), 1.0)
+
+@override_settings(IMAGE_UPLOAD_MIN_DIMENSION = 200, IMAGE_UPLOAD_MAX_PIXELS = 50 * 1000 * 1000)
+class ImageUploadHandlerTests(SimpleTestCase):
+    # The upload is checked from the header in its first chunk(s) and a rejected one isn't written any further
+
+    def upload(self, name, content, chunk_size = 64 * 1024):
+        handler = ImageUploadHandler()
+        handler.new_file('child_image', name, 'image/png', len(content))
+        written = 0
+        for start in range(0, len(content), chunk_size):
+            if handler.receive_data_chunk(content[start:start + chunk_size], start) is not None:
+                written += 1
+        return handler.file_complete(len(content)), written
+
+    def test_valid_image(self):
+        content = image_file('child.png', (900, 900), noise_seed = 0).read()
+        uploaded_file, _ = self.upload('child.png', content)
+        self.assertEqual((uploaded_file.image_format, uploaded_file.image_size, uploaded_file.size), ('PNG', (900, 900), len(content)))
+        uploaded_file.close()
+
+    def test_rejected_images_stop_being_written(self):
+        for name, size, reason in (('child.jpg', (900, 900), "not a .jpg one"), ('child.png', (900, 150), "at least 200 pixels"),
+                                   ('child.gif', (900, 900), "'gif' is not allowed")):
+            uploaded_file, written = self.upload(name, image_file(name, size, noise_seed = 0).read())
+            self.assertIn(reason, uploaded_file.upload_rejection)
+            self.assertEqual((uploaded_file.size, written), (0, 0))
+
+    def test_not_an_image(self):
+        uploaded_file, _ = self.upload('child.png', b'not an image' * 100)
+        self.assertIn("not an image", uploaded_file.upload_rejection)
@@ -0,0 +1,85 @@
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from PIL import Image
+from .image_pipeline import downscale, image_content
+from .metrics import stage
+import logging, os
+
+logger = logging.getLogger(__name__)
+
+# Renditions of the stored child images : every image is also written at the IMAGE_RENDITIONS sizes (list : result
+# lists, detail : a selected result) in every IMAGE_RENDITION_FORMATS format, next to the original under
+# renditions/<rendition>/. The pages reference the smallest rendition they need (see the rendition template filter)
+# and link the stored image itself (already fitted to MAX_IMAGE_SIZE) for the full size. The renditions of an upload
+# are produced by the encoding service from the image it decodes for the faces (see encoding_service.py) and only
+# written by the request once the upload is saved ; the stored file is only decoded again for an upload that came
+# without them (encodings found in the encoding cache, image saved outside of the views).
+
+EXTENSIONS = {'WEBP': 'webp', 'JPEG': 'jpg'}
+
+def rendition_name(name, rendition, image_format = 'JPEG'):
+    # 'missing_child_images/child.png', 'list', 'WEBP' ---> 'renditions/list/missing_child_images/child.webp'
+    return f"renditions/{rendition}/{os.path.splitext(name)[0]}.{EXTENSIONS[image_format.upper()]}"
+
+def rendition_contents(img):
+    # {(rendition, image format): content} of an opened (JPEG : at the scale of the largest rendition) or decoded
+    # image, largest rendition first, each one being downscaled from the previous one
+    renditions = sorted(settings.IMAGE_RENDITIONS.items(), key = lambda rendition: -rendition[1])
+    downscale(img, renditions[0][1])
+    img = img.convert('RGB')
+    contents = {}
+    for rendition, size in renditions:
+        img.thumbnail((size, size), Image.LANCZOS) # no-op when the image is already smaller
+        for image_format in settings.IMAGE_RENDITION_FORMATS:
+            contents[(rendition, image_format)] = image_content(img, image_format, quality = settings.IMAGE_RENDITION_QUALITY)
+    return contents
+
+def save_renditions(field_file, contents, overwrite = True):
+    # Writes the renditions (see rendition_contents) of a stored image. Returns the number of files written.
+    storage = field_file.storage
+    written = 0
+    for (rendition, image_format), content in contents.items():
+        name = rendition_name(field_file.name, rendition, image_format)
+        if storage.exists(name):
+            if not overwrite:
+                continue
+            storage.delete(name)
+        storage.save(name, ContentFile(content))
+        written += 1
+    return written
+
+def generate_renditions(field_file, overwrite = True):
+    # Decodes the stored image once and writes every rendition. Returns the number of files written.
+    if not field_file:
+        return 0
+    names = [rendition_name(field_file.name, rendition, image_format) for rendition in settings.IMAGE_RENDITIONS for image_format in settings.IMAGE_RENDITION_FORMATS]
+    if not overwrite and all(field_file.storage.exists(name) for name in names):
+        return 0
+    with stage('rendition_generation'), field_file.open('rb'):
+        contents = rendition_contents(Image.open(field_file))
+    return save_renditions(field_file, contents, overwrite)
+
+def uploaded_renditions(field_file):
+    # Renditions produced with the encodings of a not yet stored upload (see encoding_service.encoded_upload), or None
+    if not field_file or field_file._committed:
+        return None
+    return getattr(field_file.file, 'renditions', None)
+
+def generate_renditions_on_commit(field_file, contents = None):
+    # Renditions of a newly stored image (contents : the ones produced with its encodings, generated from the stored
+    # file when not given) are written once the transaction saving it has committed (never for a rolled back one, and
+    # without keeping it open meanwhile). A failure doesn't fail the save : the missing renditions are written by
+    # 'manage.py generate_renditions'.
+    def generate():
+        try:
+            if contents is not None:
+                save_renditions(field_file, contents, overwrite = False)
+            else:
+                generate_renditions(field_file, overwrite = False)
+        except OSError:
+            logger.exception("Writing the renditions of %s failed, run 'manage.py generate_renditions' to write them.", field_file.name)
+    transaction.on_commit(generate)
+
+def rendition_url(field_file, rendition, image_format = 'JPEG'):
+    return field_file.storage.url(rendition_name(field_file.name, rendition, image_format))
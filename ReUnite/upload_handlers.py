@@ -0,0 +1,63 @@
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from PIL import Image
+import io, os, struct
+
+IMAGE_FORMATS = {'JPEG': ('jpg', 'jpeg'), 'PNG': ('png',)}
+MAX_HEADER_BYTES = 256 * 1024 # the format & dimensions of a JPEG / PNG are always found within that much data
+
+class ImageUploadHandler(TemporaryFileUploadHandler):
+    # Streams every uploaded file to a temporary file (never buffering it in memory) and reads its image format and
+    # dimensions from the first chunk(s) only, without decoding the image. An upload with a wrong extension, format
+    # or dimensions stops being written as soon as this is known : it is completed as an empty file whose
+    # upload_rejection holds the reason, reported as a form error by HeaderCheckedImageField (see forms.py).
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.header = b''
+        self.image_format = None
+        self.image_size = None
+        self.rejection = None
+        extension = os.path.splitext(self.file_name)[1][1:].lower()
+        if extension not in [e for extensions in IMAGE_FORMATS.values() for e in extensions]:
+            self.rejection = f"File extension '{extension}' is not allowed. Allowed extensions are: 'jpg', 'png'."
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.rejection is None and self.image_format is None:
+            self.header += raw_data
+            self.check_header(complete = False)
+        if self.rejection is not None: # the rest of the upload is read but not written anywhere
+            return None
+        return super().receive_data_chunk(raw_data, start)
+
+    def check_header(self, complete):
+        try:
+            img = Image.open(io.BytesIO(self.header))
+        except (OSError, SyntaxError, ValueError, struct.error):
+            if complete or len(self.header) >= MAX_HEADER_BYTES:
+                self.rejection = "Upload a valid image. The file you uploaded was either not an image or a corrupted image."
+            return
+        self.image_format, self.image_size = img.format, img.size
+        self.header = b''
+        width, height = img.size
+        extension = os.path.splitext(self.file_name)[1][1:].lower()
+        if extension not in IMAGE_FORMATS.get(img.format, ()):
+            self.rejection = f"The uploaded file is a {img.format} image, not a .{extension} one. It should be in .jpg or .png format."
+        elif min(width, height) < settings.IMAGE_UPLOAD_MIN_DIMENSION:
+            self.rejection = f"The uploaded image is {width} x {height} pixels. Ensure both its width and height are at least {settings.IMAGE_UPLOAD_MIN_DIMENSION} pixels."
+        elif width * height > settings.IMAGE_UPLOAD_MAX_PIXELS:
+            self.rejection = f"The uploaded image is {width} x {height} pixels. Ensure it has at most {settings.IMAGE_UPLOAD_MAX_PIXELS // 1000000} megapixels."
+
+    def file_complete(self, file_size):
+        if self.rejection is None and self.image_format is None:
+            self.check_header(complete = True)
+        if self.rejection is not None:
+            self.file.close() # deletes the temporary file
+            rejected_file = SimpleUploadedFile(self.file_name, b'', self.content_type)
+            rejected_file.upload_rejection = self.rejection
+            return rejected_file
+        uploaded_file = super().file_complete(file_size)
+        uploaded_file.image_format = self.image_format
+        uploaded_file.image_size = self.image_size
+        return uploaded_file
@@ -15,10 +15,12 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.contrib.auth import views as auth_views
-from django.urls import path
+from django.urls import path, re_path
 from django.conf import settings
-from django.conf.urls.static import static
 from . import views as user_views
+from .media import serve_media
+from .metrics import metrics_view
+import re
 
 admin.autodiscover()
 
@@ -29,12 +31,16 @@ urlpatterns = [
     path('profile/',user_views.profile, name = 'profile'),
     path('missing-child/',user_views.missing_child, name = 'missing_child'),
     path('search-child/',user_views.search_child, name = 'search_child'),
-    path('search-child/<int:pk>',user_views.search_child, name = 'individual_search_child_view'),
+    path('search-child/results/<str:token>/',user_views.search_results, name = 'search_results'),
+    path('search-child/results/<str:token>/<int:pk>',user_views.search_results, name = 'individual_search_child_view'),
     path('sighted-child/',user_views.sighted_child, name = 'sighted_child'),
     path('login/',auth_views.LoginView.as_view(template_name = 'login.html', extra_context = {'title': 'Log In'}), name = 'login'),
     path('logout/',auth_views.LogoutView.as_view(template_name = 'logout.html', extra_context = {'title': 'Log Out'}), name = 'logout'),
     path('about/',user_views.about, name = 'about'),
+    path('metrics',metrics_view, name = 'metrics'),
 ]
 
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root = settings.MEDIA_ROOT)
+# Without DEBUG, media files are either served by the web server from MEDIA_URL directly (MEDIA_SERVING = 'django') or
+# handed over to it by serve_media (see media.py)
+if settings.DEBUG or getattr(settings, 'MEDIA_SERVING', 'django') != 'django':
+    urlpatterns += [re_path(r'^%s(?P<path>.*)$' % re.escape(settings.MEDIA_URL.lstrip('/')), serve_media, name = 'media')]
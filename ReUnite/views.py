@@ -2,11 +2,22 @@ from django.shortcuts import render, redirect
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from .forms import UserRegisterForm, UserProfileForm, UserUpdateForm, ProfileUpdateForm, MissingChildPersonalDetailsForm, MissingChildParentDetailsForm, MissingEventDetailsChildForm, MissingChildPhysicalFeaturesForm, SearchChildForm, SightedChildForm
-from .models import MissingChild, MissingChildEncodedFace
-from django.core.mail import send_mail
-from PIL import Image
-import numpy as np, face_recognition, requests, phonenumbers
+from .models import MissingChild, MissingChildEncodedFace, SightedChild, SightedChildEncodedFace, NotificationOutbox
+from .notifications import sighting_notifications
+from .reverse_matching import match_sightings
+from .name_search import cached_search_names
+from .search_sessions import save_search_results, search_results_page
+from .metrics import stage, count_event
+from .caching import cache_anonymous_page
+from .face_index import get_face_index
+from .face_filters import get_missing_child_attributes
+from .face_codec import encode_face_encoding
+from .encoding_service import face_encodings_of_file, EncodingServiceBusy, EncodingServiceTimeout, TooManyFaces
+from django.db import transaction
+from django.conf import settings
+import numpy as np
 
+@cache_anonymous_page
 def homepage(request):
     return render(request, 'homepage.html')
 
@@ -55,13 +66,10 @@ def missing_child(request):
         phy_form = MissingChildPhysicalFeaturesForm(request.POST)
         if per_form.is_valid() and par_form.is_valid() and eve_form.is_valid() and phy_form.is_valid():
             uploaded_child_image = per_form.cleaned_data.get('child_image')
-            child_image = face_recognition.load_image_file(uploaded_child_image)
-            if max(child_image.shape) > 1600:
-                img = Image.fromarray(child_image)
-                img.thumbnail((1600, 1600), Image.LANCZOS)
-                child_image = np.array(img)
-            child_face_encoding = face_recognition.face_encodings(child_image)
-            if len(child_face_encoding) == 0:
+            child_face_encoding = face_encodings_of_upload(request, uploaded_child_image, 'missing_child', max_faces = 1)
+            if child_face_encoding is None:
+                pass
+            elif len(child_face_encoding) == 0:
                 messages.error(request, f"No face(s) recognized in the uploaded image!!! Please upload a clear version of the same image or a different one.")
             elif len(child_face_encoding) > 1:
                 messages.error(request, f"More than one face recognized in the uploaded image!!! Please upload an image having single face of the missing child to avoid ambiguity.")
@@ -79,11 +87,14 @@ def missing_child(request):
                 instance1.hair_color = instance1.get_hair_color_display()
                 instance1.deformities = instance1.get_deformities_display()
                 instance1.save()
-                child_face_encoding_in_bytecode = child_face_encoding[0].tostring()
+                child_face_encoding_in_bytecode = encode_face_encoding(child_face_encoding[0])
                 instance2 = MissingChildEncodedFace.objects.create(child_encoded_face = child_face_encoding_in_bytecode)
                 instance2.missing_child = instance1
                 instance2.save()
                 messages.success(request, f"Missing Child details submitted successfully...")
+                matched_sightings = match_sightings(instance1, child_face_encoding[0])
+                if matched_sightings:
+                    messages.success(request, f"{len(matched_sightings)} earlier sighting(s) match your child. Their details are being sent to you by Email & SMS.")
                 return redirect('missing_child')
         else:
             messages.error(request, f"Some error(s) occurred. Please correct the error(s) below.")
@@ -94,125 +105,244 @@ def missing_child(request):
         phy_form = MissingChildPhysicalFeaturesForm()
     return render(request, 'missing_child.html', {'per_form': per_form, 'par_form': par_form, 'eve_form': eve_form, 'phy_form': phy_form, 'title': 'Missing Child'})
 
-def face_comparision(request, child_image_to_search):
-    unknown_image = face_recognition.load_image_file(child_image_to_search)
-    if max(unknown_image.shape) > 1600:
-        img = Image.fromarray(unknown_image)
-        img.thumbnail((1600, 1600), Image.LANCZOS)
-        unknown_image = np.array(img)
-    unknown_face_encoding = face_recognition.face_encodings(unknown_image)
-    if len(unknown_face_encoding) == 0:
+def face_encodings_of_upload(request, uploaded_image, endpoint, with_locations = False, max_faces = None):
+    # Face detection & encoding run in the encoding service's worker processes, this thread only waits for them. The
+    # faces of an image showing more than max_faces faces aren't encoded there : they come back as one None per face,
+    # for the callers to reject like any image with too many faces. None when the image couldn't be processed.
+    try:
+        return face_encodings_of_file(uploaded_image, endpoint, with_locations = with_locations, max_faces = max_faces)
+    except TooManyFaces as e:
+        return [None] * e.face_count
+    except EncodingServiceBusy:
+        messages.error(request, f"Too many images are being processed right now!!! Please try again in a few moments.")
+    except EncodingServiceTimeout:
+        messages.error(request, f"Processing the uploaded image took too long!!! Please try again in a few moments or upload a smaller image.")
+
+def single_face_encoding(request, uploaded_image, endpoint):
+    return single_face(request, face_encodings_of_upload(request, uploaded_image, endpoint, max_faces = 1))
+
+def single_face(request, face_encodings):
+    if face_encodings is None:
+        pass
+    elif len(face_encodings) == 0:
         messages.error(request, f"No face(s) recognized in the uploaded image!!! Please upload a clear version of the same image or a different one.")
-    elif len(unknown_face_encoding) > 1:
+    elif len(face_encodings) > 1:
         messages.error(request, f"More than one face recognized in the uploaded image!!! Please upload an image having single face of the missing child to avoid ambiguity.")
     else:
-        unknown_face_encoding = unknown_face_encoding[0]
-        encodings = MissingChildEncodedFace.objects.all()
-        search_results = []
-        for encoding in encodings:
-            known_face_encoding = np.fromstring(encoding.child_encoded_face)
-            results = face_recognition.compare_faces([known_face_encoding], unknown_face_encoding)
-            if results[0]:
-                corresponding_missing_child_object = MissingChild.objects.get(pk = encoding.missing_child_id)
-                search_results.append(corresponding_missing_child_object)
-        return search_results
-
-res = None
-class_name = ""
+        return face_encodings[0]
+
+def prefiltered_candidates(filters):
+    # Structured filters (gender, age, state, district, missing_from_date, or sighted_age & sighted_date of a sighting)
+    # ---> array of the missing_child_id's the face search is restricted to, or None when no filter is given and every
+    # stored face is compared. Evaluated on the in-memory attributes of every missing child (see face_filters.py).
+    filters = dict(filters or {})
+    if filters.get('gender'):
+        filters['gender'] = dict(MissingChild.GENDER).get(filters['gender'], filters['gender']) # stored as display value
+    return get_missing_child_attributes().candidates(filters)
+
+def search_missing_children(unknown_face_encoding, filters = None, candidates = None):
+    # candidates (missing_child_id's, e.g. those found by the name search) further restricts the search
+    with stage('candidate_prefilter'):
+        prefiltered = prefiltered_candidates(filters)
+    if candidates is None:
+        candidates = prefiltered
+    elif prefiltered is not None:
+        candidates = np.intersect1d(np.asarray(candidates, dtype = np.int64), prefiltered)
+    if candidates is not None and not len(candidates):
+        return []
+    with stage('distance_computation'):
+        best_matches = get_face_index().search(unknown_face_encoding, k = settings.FACE_SEARCH_TOP_K, tolerance = settings.FACE_MATCH_TOLERANCE, candidates = candidates)
+    # one query for all the matched children together with their user & profile (used by the notifications of
+    # sighted_child) instead of one query per match
+    with stage('db_fetch'):
+        matched_missing_child_objects = MissingChild.objects.select_related('user__profile').in_bulk([missing_child_id for missing_child_id, _ in best_matches])
+    search_results = [] # nearest face first
+    for missing_child_id, face_distance in best_matches:
+        corresponding_missing_child_object = matched_missing_child_objects.get(missing_child_id)
+        if corresponding_missing_child_object is None: # deleted since the index was loaded
+            continue
+        corresponding_missing_child_object.face_distance = face_distance
+        search_results.append(corresponding_missing_child_object)
+    return search_results
+
+def search_missing_children_per_face(face_encodings, filters = None):
+    # One search for all the faces of a group photo : [matched MissingChild objects, nearest first] for every face.
+    # Every face is compared with the stored encodings in a single matrix-matrix product (see search_many in
+    # face_index.py) and a child matched by several faces is only kept for the nearest one.
+    with stage('candidate_prefilter'):
+        candidates = prefiltered_candidates(filters)
+    if candidates is not None and not len(candidates):
+        return [[] for _ in face_encodings]
+    with stage('distance_computation'):
+        best_matches_per_face = get_face_index().search_many(face_encodings, k = settings.FACE_SEARCH_TOP_K, tolerance = settings.FACE_MATCH_TOLERANCE, candidates = candidates)
+    nearest_face = {} # missing_child_id ---> (face, face distance)
+    for face, best_matches in enumerate(best_matches_per_face):
+        for missing_child_id, face_distance in best_matches:
+            if missing_child_id not in nearest_face or face_distance < nearest_face[missing_child_id][1]:
+                nearest_face[missing_child_id] = (face, face_distance)
+    with stage('db_fetch'):
+        matched_missing_child_objects = MissingChild.objects.select_related('user__profile').in_bulk(list(nearest_face))
+    search_results = [[] for _ in face_encodings]
+    for missing_child_id, (face, face_distance) in sorted(nearest_face.items(), key = lambda item: item[1][1]):
+        corresponding_missing_child_object = matched_missing_child_objects.get(missing_child_id)
+        if corresponding_missing_child_object is None:
+            continue
+        corresponding_missing_child_object.face_distance = face_distance
+        search_results[face].append(corresponding_missing_child_object)
+    return search_results
+
+def search_missing_children_by_name(full_name):
+    with stage('name_search'):
+        best_matches = cached_search_names(full_name, limit = settings.NAME_SEARCH_LIMIT)
+    matched_missing_child_objects = MissingChild.objects.in_bulk([missing_child_id for missing_child_id, _ in best_matches])
+    search_results = [] # most similar name first
+    for missing_child_id, name_similarity in best_matches:
+        corresponding_missing_child_object = matched_missing_child_objects.get(missing_child_id)
+        if corresponding_missing_child_object is None:
+            continue
+        corresponding_missing_child_object.name_similarity = name_similarity
+        search_results.append(corresponding_missing_child_object)
+    return search_results
+
 @login_required
-def search_child(request, pk = None):
+def search_child(request):
     if request.method == 'POST':
-        global res
-        global class_name
-        res = None
-        class_name = ""
         search_form = SearchChildForm(request.POST, request.FILES)
         if search_form.is_valid():
-            full_name_to_search = search_form.cleaned_data['full_name_to_search']
             child_image_to_search = search_form.cleaned_data['child_image_to_search']
-            if full_name_to_search == "" and child_image_to_search == None:
+            if search_form.cleaned_data['full_name_to_search'] == "" and child_image_to_search == None:
                 messages.error(request, f"Access Denied!!! Please fill any one field.")
             else:
-                if full_name_to_search != "" and child_image_to_search == None:
-                    res = MissingChild.objects.filter(full_name__iexact = full_name_to_search) # field_name__iexact
-                                                                                               # for Case-insensitive
-                                                                                               # exact match
-                    class_name = res.__class__.__name__
-                elif full_name_to_search == "" and child_image_to_search != None:
-                    res = face_comparision(request, child_image_to_search)
-                    class_name = res.__class__.__name__
-                else:
-                    full_name_res = list(MissingChild.objects.filter(full_name__iexact = full_name_to_search))
-                    child_image_res = face_comparision(request, child_image_to_search)
-                    if child_image_res.__class__.__name__ == "list":
-                        res = []
-                        class_name = res.__class__.__name__
-                    if full_name_res and child_image_res:
-                        res = [query_res for query_res in full_name_res if query_res in child_image_res]
-                        class_name = res.__class__.__name__
-                search_form = SearchChildForm()
-                return render(request, 'search_child.html', {'search_form': search_form, 'res': res, 'class_name': class_name, 'title' : 'Search Results'})
+                unknown_face_encoding = single_face_encoding(request, child_image_to_search, 'search_child') if child_image_to_search != None else None
+                return search_response(request, search_form, unknown_face_encoding)
         else:
             messages.error(request, f"Some error(s) occurred. Please correct the error(s) below.")
     else:
         search_form = SearchChildForm()
-        if pk:
-            clicked_user = MissingChild.objects.get(pk = pk)
-            return render(request, 'search_child.html', {'search_form': search_form, 'res': res, 'class_name': class_name, 'clicked_user': clicked_user, 'title': 'Search Results'})
     return render(request, 'search_child.html', {'search_form': search_form, 'title': 'Search Child'})
 
+def search_response(request, search_form, unknown_face_encoding):
+    # Rest of a search once the face of the searched image (if any) is encoded, shared by search_child and its async
+    # variant (see async_views.py)
+    full_name_to_search = search_form.cleaned_data['full_name_to_search']
+    child_image_to_search = search_form.cleaned_data['child_image_to_search']
+    search_filters = {field: search_form.cleaned_data[field] for field in ('gender', 'age', 'state', 'district', 'missing_from_date')}
+    if child_image_to_search == None:
+        res = search_missing_children_by_name(full_name_to_search) # exact, misspelled & partial names
+    elif unknown_face_encoding is None:
+        res = None
+    elif full_name_to_search == "":
+        res = search_missing_children(unknown_face_encoding, search_filters)
+    else: # faces are only compared with those of the children found by the name search
+        name_candidates = [missing_child_id for missing_child_id, _ in cached_search_names(full_name_to_search)]
+        res = search_missing_children(unknown_face_encoding, search_filters, name_candidates)
+    if res is not None: # kept in the cache for the result pages (see search_sessions.py)
+        return redirect('search_results', token = save_search_results(request.user, res))
+    search_form = SearchChildForm()
+    return render(request, 'search_child.html', {'search_form': search_form, 'title' : 'Search Results'})
+
+@login_required
+def search_results(request, token, pk = None):
+    results_page = search_results_page(request.user, token, request.GET.get('page'), pk)
+    if results_page is None:
+        messages.error(request, f"These search results have expired!!! Please search again.")
+        return redirect('search_child')
+    page, res = results_page
+    clicked_user = next((r for r in res if r.pk == pk), None)
+    search_form = SearchChildForm()
+    return render(request, 'search_child.html', {'search_form': search_form, 'res': res, 'page': page, 'token': token, 'clicked_user': clicked_user, 'title': 'Search Results'})
+
 @login_required
 def sighted_child(request):
     if request.method == 'POST':
         sighted_form = SightedChildForm(request.POST, request.FILES)
         if sighted_form.is_valid():
-            sighted_child_full_name = sighted_form.cleaned_data['sighted_child_full_name']
-            sighted_child_age = sighted_form.cleaned_data['sighted_child_age']
-            sighted_date = sighted_form.cleaned_data['sighted_date']
-            sighted_time = sighted_form.cleaned_data['sighted_time']
-            sighted_location = sighted_form.cleaned_data['sighted_location']
             sighted_child_image = sighted_form.cleaned_data['sighted_child_image']
-            result = face_comparision(request, sighted_child_image)
-            if result:
-                url = "https://www.fast2sms.com/dev/bulk"
-                headers = {
-                    'authorization': "Your API authorization key of Fast2SMS account",
-                    'Content-Type': "application/x-www-form-urlencoded",
-                    'Cache-Control': "no-cache",
-                    }
-                for matched_child in result:
-                    mail_msg = f"Hi {matched_child.user.first_name},\n\nYour missing child {matched_child.full_name} is sighted at {sighted_location} on {sighted_date.strftime('%d-%b-%Y')} {sighted_time.strftime('%I:%M %p')}. Your child has been sighted by {request.user.first_name}. Our website uses Face Recognition as Image Processing technique to compare between two faces i.e., between a sighted child image & list of all missing child images stored on our server's database. Face Recognition algorithm is triggered on our website as soon as Sighted Child form is submitted with an image of sighted child.\n\nYou've got this notification mail because your missing child's face is most probably matching with the sighted child's face uploaded by {request.user.first_name} through Sighted Child form on our website. Our team is trying its best to provide all the details of sighted user ({request.user.first_name}) as well as sighted child matched with your missing child.\n\nThe team is sharing some of the basic details of {request.user.first_name} which can be used for any sort of further communication for gaining detailed information about the sighted events.\n\nBasic details of {request.user.first_name} (Sighted User) are :-\n\nFull Name : {request.user.first_name} {request.user.last_name}\nEmail : {request.user.email}\nMobile No. : {request.user.profile.user_mobile_no}\n\nSighted Child details are :-\n\nFull Name : {sighted_child_full_name}            (This field can be empty when sighted user doesn't know the sighted child's name.)\nAge :           {sighted_child_age} yr.                 (This field can be None when sighted user doesn't know the sighted child's age.)\nSighted Date : {sighted_date.strftime('%d-%b-%Y')}\nSighted Time : {sighted_time.strftime('%I:%M %p')}\nSighted Location : {sighted_location}\n\nThanks & Regards,\nReUnite Team"
-
-                    sms_msg = f"Hi {matched_child.user.first_name},\n\nYour missing child {matched_child.full_name} is sighted at {sighted_location} on {sighted_date.strftime('%d-%b-%Y')} {sighted_time.strftime('%I:%M %p')}. An email has been sent to your registered Email ID for detailed information about sighted child as well as sighted user.\n\nThanks and Regards,\nReUnite Team"
-
-                    x = phonenumbers.parse(f"{matched_child.user.profile.user_mobile_no}")
-                    user_mobile_no_with_country_prefix_code_0 = str(phonenumbers.format_number(x, phonenumbers.PhoneNumberFormat.NATIONAL)).replace(" ", "")
-                    user_mobile_no_without_country_prefix_code = int(user_mobile_no_with_country_prefix_code_0[1:])
-
-                    send_mail(
-                        subject = "Greetings, your missing child has been sighted by someone...",
-                        message = mail_msg,
-                        from_email = "ReUnite Team",
-                        recipient_list = [matched_child.user.email]
-                    )
-                    payload = f"sender_id=FSTSMS&message={sms_msg}&language=english&route=p&numbers={user_mobile_no_without_country_prefix_code}"
-                    requests.request("POST", url, data = payload, headers = headers)
-            instance = sighted_form.save(commit = False)
-            instance.user = request.user
-            if result:
-                instance.match_found = True
-                instance.save()
-                messages.success(request, f"{len(result)} match(es) found. Sighted Child details submitted successfully. Email & SMS have been sent to all matched cases.")
-            else:
-                instance.save()
-                messages.error(request, f"No match found. But the details have been saved successfully for mapping with future missing child cases.")
-            sighted_form = SightedChildForm()
-            return render(request, 'sighted_child.html', {'sighted_form': sighted_form, 'title' : 'Sighted Results'})
+            if sighted_form.cleaned_data['group_photo']:
+                return group_sighting_response(request, sighted_form, face_encodings_of_upload(request, sighted_child_image, 'sighted_child_group', with_locations = True))
+            return sighting_response(request, sighted_form, face_encodings_of_upload(request, sighted_child_image, 'sighted_child', max_faces = 1))
         else:
             messages.error(request, f"Some error(s) occurred. Please correct the error(s) below.")
     else:
         sighted_form = SightedChildForm()
     return render(request, 'sighted_child.html', {'sighted_form': sighted_form, 'title': 'Sighted Child'})
 
+def sighting_response(request, sighted_form, face_encodings):
+    # Rest of a sighting once the faces of the sighted image are encoded (face_encodings, None when the image couldn't
+    # be processed), shared by sighted_child and its async variant (see async_views.py)
+    if face_encodings is None: # not encoded (service busy / timeout) : not saved, to be submitted again
+        return render(request, 'sighted_child.html', {'sighted_form': sighted_form, 'title': 'Sighted Child'})
+    sighted_face_encoding = single_face(request, face_encodings)
+    result = []
+    if sighted_face_encoding is not None:
+        # a child sighted at some age on some date can only be one who went missing before that date and would be about
+        # that age on that date (age at reporting + years since going missing)
+        result = search_missing_children(sighted_face_encoding, {'sighted_age': sighted_form.cleaned_data['sighted_child_age'],
+                                                                 'sighted_date': sighted_form.cleaned_data['sighted_date']})
+    instance = sighted_form.save(commit = False)
+    instance.user = request.user
+    if result:
+        instance.match_found = True
+    with stage('sighting_save'), transaction.atomic():
+        instance.save()
+        if sighted_face_encoding is not None: # kept for mapping with future missing child cases (see reverse_matching.py)
+            SightedChildEncodedFace.objects.create(sighted_child = instance, child_encoded_face = encode_face_encoding(sighted_face_encoding))
+        if result: # notifications are only queued here, they are sent by 'manage.py dispatch_notifications'
+            NotificationOutbox.objects.bulk_create([notification for matched_child in result for notification in sighting_notifications(matched_child, instance)])
+    count_event('sighting', matched = bool(result))
+    if result:
+        messages.success(request, f"{len(result)} match(es) found. Sighted Child details submitted successfully. Email & SMS are being sent to all matched cases.")
+    else:
+        messages.error(request, f"No match found. But the details have been saved successfully for mapping with future missing child cases.")
+    sighted_form = SightedChildForm()
+    return render(request, 'sighted_child.html', {'sighted_form': sighted_form, 'title' : 'Sighted Results'})
+
+def group_sighting_response(request, sighted_form, located_faces):
+    # Every face of a group photo / CCTV still (located_faces : boxes & encodings found in one pass) is searched at
+    # once and saved as a sighting of its own (sharing the stored image, with the box of its face) so that each matched
+    # child's parents are notified and each unmatched face is kept for the future missing child cases.
+    if located_faces is None: # not encoded (service busy / timeout) : not saved, to be submitted again
+        return render(request, 'sighted_child.html', {'sighted_form': sighted_form, 'title': 'Sighted Child'})
+    face_locations, face_encodings = located_faces
+    if len(face_encodings) == 0:
+        messages.error(request, f"No face(s) recognized in the uploaded image!!! Please upload a clear version of the same image or a different one.")
+    elif len(face_encodings) > settings.SIGHTING_MAX_FACES: # saved without encoding, like an image without face
+        messages.error(request, f"{len(face_encodings)} faces recognized in the uploaded image!!! Please upload an image having at most {settings.SIGHTING_MAX_FACES} faces.")
+        face_locations, face_encodings = [], []
+    results = search_missing_children_per_face(face_encodings, {'sighted_date': sighted_form.cleaned_data['sighted_date']}) if face_encodings else []
+    sightings = []
+    with stage('sighting_save'), transaction.atomic():
+        if not face_encodings: # saved without encoding, like a single face sighting whose face wasn't recognized
+            sighting = sighted_form.save(commit = False)
+            sighting.user = request.user
+            sighting.save()
+        notifications = []
+        for face_location, face_encoding, result in zip(face_locations, face_encodings, results):
+            sighting = SightedChild(user = request.user, sighted_date = sighted_form.cleaned_data['sighted_date'], sighted_time = sighted_form.cleaned_data['sighted_time'],
+                                    sighted_location = sighted_form.cleaned_data['sighted_location'], match_found = bool(result), face_location = ','.join(map(str, face_location)),
+                                    sighted_child_image = sightings[0].sighted_child_image.name if sightings else sighted_form.cleaned_data['sighted_child_image']) # image stored once
+            sighting.save()
+            SightedChildEncodedFace.objects.create(sighted_child = sighting, child_encoded_face = encode_face_encoding(face_encoding))
+            notifications.extend(notification for matched_child in result for notification in sighting_notifications(matched_child, sighting))
+            sightings.append(sighting)
+        NotificationOutbox.objects.bulk_create(notifications)
+    for result in results:
+        count_event('sighting', matched = bool(result))
+    faces = []
+    if sightings:
+        matched_faces = sum(1 for result in results if result)
+        if matched_faces:
+            messages.success(request, f"{len(sightings)} face(s) recognized, {matched_faces} of them match missing children. Sighted Child details submitted successfully. Email & SMS are being sent to all matched cases.")
+        else:
+            messages.error(request, f"{len(sightings)} face(s) recognized but no match found. But the details have been saved successfully for mapping with future missing child cases.")
+        width, height = sightings[0].sighted_child_image.width, sightings[0].sighted_child_image.height
+        for number, ((top, right, bottom, left), result) in enumerate(zip(face_locations, results), 1): # boxes in % of the image
+            faces.append({'number': number, 'top': 100 * top / height, 'left': 100 * left / width, 'width': 100 * (right - left) / width,
+                          'height': 100 * (bottom - top) / height, 'matches': result})
+    else:
+        messages.error(request, f"No match found. But the details have been saved successfully for mapping with future missing child cases.")
+    return render(request, 'sighted_child.html', {'sighted_form': SightedChildForm(), 'faces': faces, 'group_photo': sightings[0].sighted_child_image if sightings else None, 'title': 'Sighted Results'})
+
+@cache_anonymous_page
 def about(request):
     return render(request, 'about.html', {'title': 'About'})
@@ -14,3 +14,13 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ReUnite.settings')
 
 application = get_wsgi_application()
+
+from django.conf import settings
+from ReUnite.face_index import load_face_index_on_first_request
+from ReUnite.face_index_changes import start_polling_face_index_changes
+from ReUnite.encoding_service import get_encoding_service
+
+load_face_index_on_first_request() # load the face search index before the first search request, without querying the database at import time
+start_polling_face_index_changes() # then follow the encodings saved & deleted by the other processes
+if settings.FACE_ENCODING_WORKERS:
+    get_encoding_service().start() # same for the face encoding worker processes & their models